@@ -0,0 +1,315 @@
+"""In-process snapshot of every tag and what it's allowed to open
+
+Doorbots and tool scanners ask the same question over and over: is this tag
+active, and does it have this permission? The answer only changes when an
+admin edits a member, role, or permission, so we keep a copy of the whole ACL
+in memory and answer checks without going to the database.
+
+The snapshot is thrown away after any commit that touches Member, Role, or
+Permission through the ORM in this process, and rebuilt on the next check.
+Other processes (like other uwsgi workers, or the MMS sync scripts) can't
+tell us when they change something, so the snapshot is also rebuilt once
+it's older than acl_cache.max_age_seconds in the config.
+
+Each snapshot carries the AclVersion it was built from. Database triggers
+bump the version on any change to the ACL tables, ORM or not. Callers that
+can afford one tiny query (like the tag dumps) can ask for a snapshot that's
+checked against the current version, and so reflects every committed change.
+Door decisions use get_door_snapshot(), which compares it against
+get_current_version(). That only asks the database once every
+acl_cache.version_check_seconds, so a tag deactivated in one worker is
+refused by every other worker within that long. The login caches in
+Doorbot.API do the same with get_current_auth_version(), which follows
+changes to tokens and passwords (see AuthVersion) instead.
+The last few snapshots are kept around by version, so we can tell a doorbot
+what changed since the version it already has.
+"""
+import threading
+import time
+from collections import OrderedDict
+from collections import namedtuple
+import Doorbot.Config
+from Doorbot.SQLAlchemy import AclVersion
+from Doorbot.SQLAlchemy import AuthVersion
+from Doorbot.SQLAlchemy import Member
+from Doorbot.SQLAlchemy import Permission
+from Doorbot.SQLAlchemy import Role
+from Doorbot.SQLAlchemy import member_role_association
+from Doorbot.SQLAlchemy import role_permission_association
+from Doorbot.SQLAlchemy import get_session
+from Doorbot.SQLAlchemy import on_committed_change
+from Doorbot.SQLAlchemy import on_engine_change
+from Doorbot.SQLAlchemy import request_or_own_session
+from sqlalchemy import select
+
+
+DEFAULT_MAX_AGE_SECONDS = 60
+DEFAULT_HISTORY_SIZE = 20
+DEFAULT_VERSION_CHECK_SECONDS = 1
+BUILD_BATCH_SIZE = 1000
+
+ACLEntry = namedtuple( 'ACLEntry', [
+    'rfid',
+    'active',
+    'full_name',
+    'permissions',
+])
+"""A single tag in the snapshot. The permissions are a frozenset of names."""
+
+
+class ACLSnapshot:
+    """Immutable view of all tags and their permissions at one point in time"""
+
+    def __init__(
+        self,
+        entries: dict,
+        permission_names: frozenset,
+        version: int,
+        max_age: float,
+    ):
+        self.entries = entries
+        self.permission_names = permission_names
+        self.version = version
+        self.built_at = time.monotonic()
+        self.max_age = max_age
+        self._tags_by_permission = {}
+
+    def is_expired( self ):
+        return ( time.monotonic() - self.built_at ) > self.max_age
+
+    def get( self, tag ):
+        """Fetch the ACLEntry for a tag, or None if it's not known"""
+        return self.entries.get( tag )
+
+    def has_permission( self, tag, permission ):
+        """True if the tag is active and has the named permission"""
+        entry = self.entries.get( tag )
+        if entry is None:
+            return False
+        return entry.active and ( permission in entry.permissions )
+
+    def active_tags( self, permission = None ):
+        """Sorted tuple of active tags with the given permission
+
+        With no permission, all active tags are returned.
+        """
+        tags = self._tags_by_permission.get( permission )
+        if tags is None:
+            tags = tuple( sorted(
+                entry.rfid for entry in self.entries.values()
+                if entry.active and (
+                    permission is None or permission in entry.permissions
+                )
+            ) )
+            self._tags_by_permission[ permission ] = tags
+        return tags
+
+    def tags_by_permission( self, permissions = None ):
+        """Dict of permission names to their sorted tuple of active tags
+
+        With no permissions given, every permission is included. Tags for 
+        all permissions are sorted out in one pass over the entries, rather 
+        than one pass per permission.
+        """
+        if permissions is None:
+            permissions = self.permission_names
+
+        missing = [ name for name in permissions
+            if name not in self._tags_by_permission ]
+        if missing:
+            found = { name: [] for name in missing }
+            for entry in self.entries.values():
+                if not entry.active:
+                    continue
+                for name in entry.permissions:
+                    if name in found:
+                        found[ name ].append( entry.rfid )
+            for name, tags in found.items():
+                self._tags_by_permission[ name ] = tuple( sorted( tags ) )
+
+        return {
+            name: self._tags_by_permission[ name ]
+            for name in sorted( permissions )
+        }
+
+
+__LOCK = threading.Lock()
+__SNAPSHOT = None
+__GENERATION = 0
+__HISTORY = OrderedDict()
+# Counter model to the last ( version, monotonic time ) read from it
+__CURRENT_VERSIONS = {}
+
+
+def build_snapshot():
+    """Load a fresh snapshot from the database"""
+    acl_conf = Doorbot.Config.get( 'acl_cache', {} )
+    max_age = acl_conf.get( 'max_age_seconds', DEFAULT_MAX_AGE_SECONDS )
+
+    permission_names_stmt = select( Permission.name )
+    member_stmt = select(
+        Member.rfid,
+        Member.active,
+        Member.full_name,
+    ).where(
+        Member.rfid != None
+    )
+    permission_stmt = select(
+        Member.rfid,
+        Permission.name,
+    ).join(
+        member_role_association,
+        member_role_association.c.member_id == Member.id,
+    ).join(
+        role_permission_association,
+        role_permission_association.c.role_id ==
+            member_role_association.c.role_id,
+    ).join(
+        Permission,
+        Permission.id == role_permission_association.c.permission_id,
+    )
+
+    # Its own session, even in a request, since the isolation level can only 
+    # be set before the transaction starts. It's rare, unlike version checks.
+    session = get_session()
+    if 'postgresql' == session.get_bind().dialect.name:
+        # The version has to match the data exactly, or a doorbot asking
+        # for changes since that version could miss some
+        session.connection( execution_options = {
+            "isolation_level": "REPEATABLE READ",
+        })
+    version = AclVersion.get_current( session )
+    permission_names = frozenset( session.scalars( permission_names_stmt ) )
+
+    # Rows are read in batches and never become ORM objects, so the only 
+    # thing kept per member is their ACLEntry
+    permissions_by_tag = {}
+    permission_rows = session.execute( permission_stmt, execution_options = {
+        "yield_per": BUILD_BATCH_SIZE,
+    })
+    for rfid, permission in permission_rows:
+        permissions_by_tag.setdefault( rfid, set() ).add( permission )
+
+    entries = {}
+    members = session.execute( member_stmt, execution_options = {
+        "yield_per": BUILD_BATCH_SIZE,
+    })
+    for rfid, active, full_name in members:
+        entries[ rfid ] = ACLEntry(
+            rfid = rfid,
+            active = True if active else False,
+            full_name = full_name,
+            permissions = frozenset( permissions_by_tag.get( rfid, () ) ),
+        )
+    session.close()
+
+    return ACLSnapshot( entries, permission_names, version, max_age )
+
+def get_snapshot(
+    check_version: bool = False,
+):
+    """Get the current snapshot, rebuilding it if needed
+
+    Normally this doesn't touch the database unless the snapshot has to be 
+    rebuilt. If check_version is set, the snapshot's version is compared to 
+    the database first, which guarantees it's current.
+    """
+    global __SNAPSHOT
+
+    snapshot = __SNAPSHOT
+    if check_version and snapshot is not None:
+        with request_or_own_session() as session:
+            version = AclVersion.get_current( session )
+
+        if version != snapshot.version:
+            invalidate()
+            snapshot = None
+
+    if snapshot is not None and not snapshot.is_expired():
+        return snapshot
+
+    with __LOCK:
+        # Someone else may have rebuilt it while we waited on the lock
+        snapshot = __SNAPSHOT
+        if snapshot is not None and not snapshot.is_expired():
+            return snapshot
+
+        generation = __GENERATION
+        snapshot = build_snapshot()
+
+        # If something was committed while we were building, our copy may
+        # already be out of date. Use it for this check, but don't keep it.
+        if generation == __GENERATION:
+            __SNAPSHOT = snapshot
+            _remember( snapshot )
+
+    return snapshot
+
+def get_current_version():
+    """The current AclVersion, read at most every version_check_seconds
+
+    Between reads, the last version read is returned. It can be behind the 
+    database by up to acl_cache.version_check_seconds, but never ahead.
+    """
+    return _read_version( AclVersion )
+
+def get_current_auth_version():
+    """The current AuthVersion, read the same way as get_current_version()"""
+    return _read_version( AuthVersion )
+
+def _read_version( model ):
+    acl_conf = Doorbot.Config.get( 'acl_cache', {} )
+    interval = acl_conf.get( 'version_check_seconds',
+        DEFAULT_VERSION_CHECK_SECONDS )
+
+    now = time.monotonic()
+    current = __CURRENT_VERSIONS.get( model )
+    if current is None or ( now - current[1] ) >= interval:
+        with request_or_own_session() as session:
+            current = ( model.get_current( session ), now )
+        __CURRENT_VERSIONS[ model ] = current
+
+    return current[0]
+
+def get_door_snapshot():
+    """Get the current snapshot, for deciding whether to let someone in
+
+    The snapshot is rebuilt if it's older than get_current_version(). A busy 
+    door costs at most one tiny query per acl_cache.version_check_seconds.
+    """
+    version = get_current_version()
+    snapshot = __SNAPSHOT
+    if snapshot is not None and snapshot.version < version:
+        invalidate()
+    return get_snapshot()
+
+def get_snapshot_at(
+    version: int,
+):
+    """Fetch a recent snapshot by version, or None if we don't have it"""
+    return __HISTORY.get( version )
+
+def _remember( snapshot ):
+    acl_conf = Doorbot.Config.get( 'acl_cache', {} )
+    history_size = acl_conf.get( 'history_size', DEFAULT_HISTORY_SIZE )
+
+    __HISTORY[ snapshot.version ] = snapshot
+    __HISTORY.move_to_end( snapshot.version )
+    while len( __HISTORY ) > history_size:
+        __HISTORY.popitem( last = False )
+
+def invalidate():
+    """Throw away the current snapshot. The next check will rebuild it."""
+    global __SNAPSHOT, __GENERATION
+    __GENERATION += 1
+    __SNAPSHOT = None
+
+def reset():
+    """Throw away the current snapshot and all history"""
+    invalidate()
+    __HISTORY.clear()
+    __CURRENT_VERSIONS.clear()
+
+
+on_committed_change( [ Member, Role, Permission ], invalidate )
+on_engine_change( reset )
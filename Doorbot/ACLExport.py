@@ -0,0 +1,156 @@
+"""Binary formats for sending tag lists to microcontroller doorbots
+
+JSON dumps are big, and parsing them on a doorbot takes RAM we don't have.
+These formats can be written straight to flash and searched in place.
+
+Every format starts with the same 20 byte header. All numbers are
+little-endian.
+
+    offset  size  field
+    0       4     magic, the ASCII bytes "DBAC"
+    4       1     format version, currently 1
+    5       1     kind: 1 for a sorted tag array, 2 for a Bloom filter
+    6       2     size of each entry in bytes, currently 8
+    8       8     ACL version the data was built from
+    16      4     number of tags
+
+Only tags made up of digits are included, as unsigned 64 bit integers. This
+means leading zeros don't matter, so "0001234" and "1234" are the same tag.
+
+A sorted tag array (KIND_SORTED) follows the header with the tags in
+ascending order, one uint64 each. Look a tag up with a binary search.
+
+A Bloom filter (KIND_BLOOM) follows the header with:
+
+    offset  size  field
+    20      4     number of bits in the filter (m)
+    24      1     number of hash functions (k)
+    25      3     padding, all zero
+    28      m/8   the bits. Bit n is (byte[n / 8] >> (n % 8)) & 1
+
+To check a tag, run it through splitmix64 (see below). Take h1 as the low 32
+bits of the result, and h2 as the high 32 bits with the lowest bit set. For
+each i from 0 to k - 1, bit (h1 + i * h2) mod m must be set. Use 64 bit math
+for the sum. A Bloom filter can say a tag is allowed when it isn't (at about
+the configured false positive rate), but never the other way around.
+"""
+import math
+import struct
+
+
+MAGIC = b"DBAC"
+FORMAT_VERSION = 1
+KIND_SORTED = 1
+KIND_BLOOM = 2
+ENTRY_SIZE = 8
+
+HEADER = struct.Struct( "<4sBBHQI" )
+BLOOM_HEADER = struct.Struct( "<IB3x" )
+
+MAX_TAG = 2 ** 64 - 1
+MASK_64 = 2 ** 64 - 1
+DEFAULT_FALSE_POSITIVE_RATE = 0.001
+MAX_HASHES = 16
+
+
+def numeric_tags( tags ):
+    """Sorted list of unique tags as integers. Non-numeric tags are skipped."""
+    numbers = set()
+    for tag in tags:
+        if tag.isdigit():
+            number = int( tag )
+            if number <= MAX_TAG:
+                numbers.add( number )
+    return sorted( numbers )
+
+def splitmix64( value ):
+    """The splitmix64 mixing function, used to hash tags for Bloom filters"""
+    value = ( value + 0x9E3779B97F4A7C15 ) & MASK_64
+    value = ( ( value ^ ( value >> 30 ) ) * 0xBF58476D1CE4E5B9 ) & MASK_64
+    value = ( ( value ^ ( value >> 27 ) ) * 0x94D049BB133111EB ) & MASK_64
+    return value ^ ( value >> 31 )
+
+def _header( kind, acl_version, count ):
+    return HEADER.pack(
+        MAGIC,
+        FORMAT_VERSION,
+        kind,
+        ENTRY_SIZE,
+        acl_version,
+        count,
+    )
+
+def pack_sorted(
+    tags,
+    acl_version: int,
+):
+    """Pack tags into a sorted array of uint64s"""
+    numbers = numeric_tags( tags )
+    body = struct.pack( "<" + str( len( numbers ) ) + "Q", *numbers )
+    return _header( KIND_SORTED, acl_version, len( numbers ) ) + body
+
+def bloom_size(
+    count: int,
+    false_positive_rate: float,
+):
+    """Number of bits and hashes for a Bloom filter holding count tags"""
+    count = max( count, 1 )
+    bits = math.ceil(
+        -count * math.log( false_positive_rate ) / ( math.log( 2 ) ** 2 )
+    )
+    # Whole bytes, and at least 64 bits
+    bits = max( 64, ( bits + 7 ) // 8 * 8 )
+    hashes = round( bits / count * math.log( 2 ) )
+    hashes = min( max( hashes, 1 ), MAX_HASHES )
+    return bits, hashes
+
+def bloom_positions(
+    number: int,
+    bits: int,
+    hashes: int,
+):
+    """Bits in the filter that are set for a tag"""
+    hashed = splitmix64( number )
+    h1 = hashed & 0xFFFFFFFF
+    h2 = ( hashed >> 32 ) | 1
+    return [ ( h1 + i * h2 ) % bits for i in range( hashes ) ]
+
+def pack_bloom(
+    tags,
+    acl_version: int,
+    false_positive_rate: float = DEFAULT_FALSE_POSITIVE_RATE,
+):
+    """Pack tags into a Bloom filter"""
+    numbers = numeric_tags( tags )
+    bits, hashes = bloom_size( len( numbers ), false_positive_rate )
+
+    filter_bytes = bytearray( bits // 8 )
+    for number in numbers:
+        for position in bloom_positions( number, bits, hashes ):
+            filter_bytes[ position >> 3 ] |= 1 << ( position & 7 )
+
+    return _header( KIND_BLOOM, acl_version, len( numbers ) ) \
+        + BLOOM_HEADER.pack( bits, hashes ) \
+        + bytes( filter_bytes )
+
+def bloom_contains(
+    data: bytes,
+    tag: str,
+):
+    """Check a tag against a packed Bloom filter, the way a doorbot would"""
+    bits, hashes = BLOOM_HEADER.unpack_from( data, HEADER.size )
+    filter_bytes = data[ HEADER.size + BLOOM_HEADER.size: ]
+
+    for position in bloom_positions( int( tag ), bits, hashes ):
+        if not filter_bytes[ position >> 3 ] & ( 1 << ( position & 7 ) ):
+            return False
+    return True
+
+def unpack_header( data: bytes ):
+    """Returns a tuple of ( kind, acl_version, count )"""
+    magic, format_version, kind, entry_size, acl_version, count = \
+        HEADER.unpack_from( data )
+    if magic != MAGIC or format_version != FORMAT_VERSION:
+        raise ValueError( "Not a version " + str( FORMAT_VERSION )
+            + " ACL export" )
+    return kind, acl_version, count
@@ -1,16 +1,39 @@
+import base64
+import csv
 import flask
+import hashlib
+import hmac
 import os
 import re
+import secrets
+import Doorbot.ACLCache
+import Doorbot.ACLExport
+import Doorbot.BcryptCalibration
 import Doorbot.Config
+import Doorbot.DBPool
+import Doorbot.EntryLogWriter
+import Doorbot.LastSeen
+import Doorbot.PasswordPool
+import Doorbot.ScanRollups
 from Doorbot.SQLAlchemy import Location
+from Doorbot.SQLAlchemy import LocationLastScan
 from Doorbot.SQLAlchemy import EntryLog
 from Doorbot.SQLAlchemy import Member
+from Doorbot.SQLAlchemy import MemberLastSeen
+from Doorbot.SQLAlchemy import OauthToken
 from Doorbot.SQLAlchemy import Permission
 from Doorbot.SQLAlchemy import Role
+from Doorbot.SQLAlchemy import close_request_session
 from Doorbot.SQLAlchemy import get_engine
-from Doorbot.SQLAlchemy import get_session
-from datetime import datetime
+from Doorbot.SQLAlchemy import get_request_session
+from Doorbot.SQLAlchemy import on_committed_change
+from Doorbot.SQLAlchemy import to_utc
+from Doorbot.TTLCache import TTLCache
+from datetime import datetime, timedelta, timezone
 from flask_httpauth import HTTPBasicAuth
+from sqlalchemy import DateTime
+from sqlalchemy import bindparam
+from sqlalchemy import or_
 from sqlalchemy import select
 from sqlalchemy.sql import text
 
@@ -37,6 +60,10 @@ app = flask.Flask( "rfid_app",
 )
 auth = HTTPBasicAuth()
 
+@app.teardown_appcontext
+def teardown_db_session( exception ):
+    close_request_session()
+
 def set_error(
     response,
     msg,
@@ -58,6 +85,12 @@ def error_response( msg, status = 400 ):
     response = set_error( response, msg, status )
     return response
 
+@app.errorhandler( Doorbot.PasswordPool.PasswordPoolBusy )
+def password_pool_busy( err ):
+    response = error_response( str( err ), 503 )
+    response.headers[ 'Retry-After' ] = "1"
+    return response
+
 # From https://stackoverflow.com/questions/2546207/does-sqlalchemy-have-an-equivalent-of-djangos-get-or-create
 def get_or_create(
     session,
@@ -81,49 +114,261 @@ def get(
     instance = session.query( model ).filter_by( **kwargs ).first()
     return instance
 
-def search_scan_logs( tag, offset, limit):
+def encode_entry_cursor( entry_time, entry_id ):
+    """Opaque cursor pointing just past the given entry log row"""
+    cursor = flask.json.dumps([ entry_time.isoformat(), entry_id ])
+    return base64.urlsafe_b64encode( cursor.encode( 'utf-8' ) ) \
+        .decode( 'ascii' )
+
+def decode_entry_cursor( cursor ):
+    """Returns a tuple of ( entry_time, entry_id ). Raises ValueError if the 
+    cursor is bad."""
+    try:
+        entry_time, entry_id = flask.json.loads(
+            base64.urlsafe_b64decode( cursor.encode( 'ascii' ) )
+        )
+        entry_time = datetime.fromisoformat( entry_time )
+    except ( TypeError, ValueError, UnicodeError ) as e:
+        raise ValueError( "Invalid cursor" ) from e
+    if not isinstance( entry_id, int ):
+        raise ValueError( "Invalid cursor" )
+    return entry_time, entry_id
+
+def parse_entry_log_time( value, default_tz = timezone.utc ):
+    """Parse an ISO 8601 time for filtering the entry log
+
+    Times without a timezone are taken to be in default_tz. Returns None for 
+    an empty value, and raises ValueError for a bad one.
+    """
+    if not value:
+        return None
+    try:
+        when = datetime.fromisoformat( value.strip() )
+    except ValueError as e:
+        raise ValueError( "Invalid time: " + value ) from e
+    if when.tzinfo is None:
+        if hasattr( default_tz, 'localize' ):
+            # pytz timezones need this to get daylight saving right
+            when = default_tz.localize( when )
+        else:
+            when = when.replace( tzinfo = default_tz )
+    return when.astimezone( timezone.utc )
+
+def parse_entry_log_flag( value ):
+    """Parse a yes/no filter. Returns None when it's not set."""
+    if value is None or value == "":
+        return None
+    value = value.strip().lower()
+    if value in ( "1", "true", "yes" ):
+        return True
+    if value in ( "0", "false", "no" ):
+        return False
+    raise ValueError( "Invalid flag: " + value )
+
+def parse_entry_log_filters( args, default_tz = timezone.utc ):
+    """Pull the filters for search_scan_logs() out of request args
+
+    Raises ValueError if any of them are bad.
+    """
+    location = args.get( 'location' )
+    if location and not MATCH_NAME.match( location ):
+        raise ValueError( "Invalid location: " + location )
+
+    unknown = parse_entry_log_flag( args.get( 'unknown' ) )
+    return {
+        "location": location if location else None,
+        "since": parse_entry_log_time( args.get( 'since' ), default_tz ),
+        "until": parse_entry_log_time( args.get( 'until' ), default_tz ),
+        "granted": parse_entry_log_flag( args.get( 'granted' ) ),
+        "found": None if unknown is None else not unknown,
+    }
+
+def entry_log_statement(
+    dialect_name,
+    tag = None,
+    cursor = None,
+    name = None,
+    location = None,
+    since = None,
+    until = None,
+    granted = None,
+    found = None,
+    limit = None,
+    offset = 0,
+):
+    """Build the entry log query, newest first
+
+    Returns a tuple of ( statement, params ). Without a limit, every 
+    matching row is returned. See search_scan_logs() for the filters.
+    """
     # People could scan an RFID that isn't in the system. We still want to 
     # log that, but it means we can't explicitly link the member and entry_log 
     # tables. This is a problem for SQLAlchemy, so don't bother, and use raw 
     # SQL.
-    sql_params = {
-        "offset": offset,
-        "limit": limit,
-    }
-    where_clause = ""
+    #
+    # Each filter is written so it can use one of the entry_log indexes 
+    # without a join, like by looking up the location's id first.
+    sql_params = {}
+    time_params = []
+    where = []
     if tag:
-        where_clause = "WHERE entry_log.rfid = :rfid"
+        where.append( "entry_log.rfid = :rfid" )
         sql_params[ 'rfid' ] = tag
+    if name:
+        # The trigram index on full_name works for ILIKE, which SQLite 
+        # doesn't have
+        if 'postgresql' == dialect_name:
+            name_match = "members.full_name ILIKE :name"
+        else:
+            name_match = "LOWER( members.full_name ) LIKE LOWER( :name )"
+        where.append( "entry_log.rfid IN ( SELECT members.rfid FROM members"
+            + " WHERE " + name_match + " )" )
+        sql_params[ 'name' ] = '%' + name + '%'
+    if location:
+        where.append( "entry_log.location = ( SELECT locations.id"
+            + " FROM locations WHERE locations.name = :location )" )
+        sql_params[ 'location' ] = location
+    if since:
+        where.append( "entry_log.entry_time >= :since" )
+        sql_params[ 'since' ] = since
+        time_params.append( 'since' )
+    if until:
+        where.append( "entry_log.entry_time < :until" )
+        sql_params[ 'until' ] = until
+        time_params.append( 'until' )
+    # Written out rather than bound, so the planner can match them to the 
+    # partial indexes on denied and unknown scans
+    if granted is not None:
+        where.append( "entry_log.is_active_tag" if granted
+            else "NOT entry_log.is_active_tag" )
+    if found is not None:
+        where.append( "entry_log.is_found_tag" if found
+            else "NOT entry_log.is_found_tag" )
+    if cursor:
+        cursor_time, cursor_id = decode_entry_cursor( cursor )
+        # Matches the (entry_time DESC, id DESC) index
+        where.append( """(
+            entry_log.entry_time < :cursor_time
+            OR (
+                entry_log.entry_time = :cursor_time
+                AND entry_log.id < :cursor_id
+            )
+        )""" )
+        sql_params[ 'cursor_time' ] = cursor_time
+        sql_params[ 'cursor_id' ] = cursor_id
+        time_params.append( 'cursor_time' )
+
+    limit_clause = ""
+    if limit:
+        limit_clause = "LIMIT :limit"
+        sql_params[ 'limit' ] = limit
+        if offset and not cursor:
+            limit_clause += " OFFSET :offset"
+            sql_params[ 'offset' ] = offset
 
-    with get_engine().connect() as conn:
-        stmt = text( """
-            SELECT
-                members.full_name AS full_name
-                ,entry_log.rfid AS rfid
-                ,locations.name AS location
-                ,entry_log.entry_time AS entry_time
-                ,entry_log.is_active_tag AS is_active_tag
-                ,entry_log.is_found_tag AS is_found_tag
-            FROM entry_log
-            LEFT OUTER JOIN members ON entry_log.rfid = members.rfid
-            LEFT OUTER JOIN locations ON entry_log.location = locations.id
-        """ + where_clause +
-        """
-            ORDER BY entry_log.entry_time DESC
-            LIMIT :limit
-            OFFSET :offset
-        """ )
-
-        logs = conn.execute( stmt, sql_params )
+    where_clause = ""
+    if where:
+        where_clause = "WHERE " + " AND ".join( where )
+
+    stmt = text( """
+        SELECT
+            members.full_name AS full_name
+            ,entry_log.rfid AS rfid
+            ,locations.name AS location
+            ,entry_log.entry_time AS entry_time
+            ,entry_log.is_active_tag AS is_active_tag
+            ,entry_log.is_found_tag AS is_found_tag
+            ,entry_log.id AS id
+        FROM entry_log
+        LEFT OUTER JOIN members ON entry_log.rfid = members.rfid
+        LEFT OUTER JOIN locations ON entry_log.location = locations.id
+    """ + where_clause +
+    """
+        ORDER BY entry_log.entry_time DESC, entry_log.id DESC
+    """ + limit_clause )
+    # Typed, so times are sent the same way the column is stored (SQLite 
+    # keeps it as a string), and come back as a datetime
+    stmt = stmt.bindparams( *[
+        bindparam( param, type_ = DateTime() ) for param in time_params
+    ]).columns(
+        entry_time = DateTime(),
+    )
+    return stmt, sql_params
+
+def search_scan_logs(
+    tag,
+    offset,
+    limit,
+    cursor = None,
+    name = None,
+    location = None,
+    since = None,
+    until = None,
+    granted = None,
+    found = None,
+):
+    """Fetch a page of the entry log, newest first
+
+    Pass the cursor from next_entry_cursor() to get the page after it. This 
+    costs the same no matter how deep the page is, where the offset has to 
+    skip over every row before it. The offset is ignored when there's a 
+    cursor.
+
+    Filters are all optional. The name is a case insensitive substring of 
+    the member's name. since and until are times, with since inclusive and 
+    until exclusive. granted and found match is_active_tag and 
+    is_found_tag.
+    """
+    session = get_request_session()
+    stmt, sql_params = entry_log_statement(
+        session.get_bind().dialect.name,
+        tag = tag,
+        cursor = cursor,
+        name = name,
+        location = location,
+        since = since,
+        until = until,
+        granted = granted,
+        found = found,
+        limit = limit,
+        offset = offset,
+    )
+    logs = session.execute( stmt, sql_params ).all()
     return logs
 
+def next_entry_cursor( logs, limit ):
+    """Cursor for the page after these logs, or None if this was the last 
+    page"""
+    if len( logs ) < limit:
+        return None
+    last = logs[-1]
+    return encode_entry_cursor( last.entry_time, last.id )
+
 def search_tag_list(
     name = None,
     tag = None,
     offset = 0,
     limit = 100,
+    inactive_months = None,
 ):
-    stmt = select( Member )
+    """Search members, along with when their tag was last scanned
+
+    Returns rows with rfid, full_name, active, mms_id, and last_seen 
+    columns, not Member objects, since lists don't need the rest of the 
+    member. last_seen is None if the tag has never been scanned. With 
+    inactive_months, only members who haven't been seen in that many months 
+    are returned.
+    """
+    stmt = select(
+        Member.rfid,
+        Member.full_name,
+        Member.active,
+        Member.mms_id,
+        MemberLastSeen.last_seen,
+    ).outerjoin(
+        MemberLastSeen,
+        MemberLastSeen.rfid == Member.rfid,
+    )
     if name:
         stmt = stmt.where(
             Member.full_name.ilike( '%' + name + '%' )
@@ -132,21 +377,94 @@ def search_tag_list(
         stmt = stmt.where(
             Member.rfid == tag,
         )
+    if inactive_months:
+        cutoff = Doorbot.LastSeen.inactive_cutoff( inactive_months )
+        stmt = stmt.where(or_(
+            MemberLastSeen.last_seen == None,
+            MemberLastSeen.last_seen < cutoff,
+        ))
 
     stmt = stmt.order_by(
-        'join_date'
+        Member.join_date
     ).limit(
         limit
     ).offset(
         offset
     )
 
-    session = get_session()
-    members = session.scalars( stmt ).all()
-    session.close()
+    session = get_request_session()
+    members = session.execute( stmt ).all()
 
     return members
 
+def format_last_seen( last_seen ):
+    """ISO 8601 in UTC, or an empty string if never seen"""
+    if last_seen is None:
+        return ""
+    return to_utc( last_seen ).isoformat()
+
+def parse_inactive_months( value ):
+    if not value:
+        return None
+    if not MATCH_INT.match( value ) or int( value ) < 1:
+        raise ValueError( "Invalid inactive months: " + value )
+    return int( value )
+
+TOKEN_CACHE = None
+
+def get_token_cache():
+    """Cache of bearer tokens we've already looked up
+
+    Keyed by a SHA256 digest of the bearer string, so the tokens themselves 
+    aren't sitting around in memory. Values are a tuple of the member ID, 
+    the token's expiration date, and the auth version it was looked up at. 
+    Changing any token moves the auth version on (in any worker), and older 
+    entries are then looked up again.
+    """
+    global TOKEN_CACHE
+    if TOKEN_CACHE is None:
+        oauth_conf = Doorbot.Config.get( 'oauth' )
+        TOKEN_CACHE = TTLCache(
+            max_size = oauth_conf.get( 'cache_size', 1000 ),
+            ttl = oauth_conf.get( 'cache_seconds', 300 ),
+        )
+    return TOKEN_CACHE
+
+def clear_token_cache():
+    if TOKEN_CACHE is not None:
+        TOKEN_CACHE.clear()
+
+on_committed_change( [ OauthToken ], clear_token_cache )
+
+def lookup_bearer_token( bearer_str ):
+    """Returns a tuple of ( member_id, expiration_date ), or None if the 
+    token doesn't exist"""
+    cache = get_token_cache()
+    key = hashlib.sha256( bearer_str.encode( 'utf-8' ) ).digest()
+    version = Doorbot.ACLCache.get_current_auth_version()
+
+    found = cache.get( key )
+    if found is not None and found[2] == version:
+        return found[ :2 ]
+
+    session = get_request_session()
+    stmt = select(
+        OauthToken.member_id,
+        OauthToken.expiration_date,
+    ).where(
+        OauthToken.token == bearer_str
+    )
+    token = session.execute( stmt ).one_or_none()
+
+    if token is None:
+        return None
+
+    member_id, expires = token
+    expires = to_utc( expires )
+
+    cache.set( key, ( member_id, expires, version ) )
+    return ( member_id, expires )
+
 def auth_required( func ):
     def check( *args, **kwargs ):
         #if 'is_testing' in app.config and app.config[ 'is_testing' ]:
@@ -160,19 +478,17 @@ def auth_required( func ):
         if not bearer_str:
             return error_response( "Invalid authorization", 401 )
 
-        session = get_session()
-        stmt = select( Doorbot.SQLAlchemy.OauthToken ).where(
-            Doorbot.SQLAlchemy.OauthToken.token == bearer_str
-        )
-        token = session.scalars( stmt ).one_or_none()
-        session.close()
+        token = lookup_bearer_token( bearer_str )
+        if not token:
+            return error_response( "Invalid authorization", 401 )
 
-        # TODO store token somewhere so we can check permissions on an 
-        # endpoint later
-        if token:
-            return func( *args, **kwargs )
+        member_id, expires = token
+        if expires <= datetime.now( timezone.utc ):
+            return error_response( "Expired authorization", 401 )
 
-        return error_response( "Invalid authorization", 401 )
+        # Lets an endpoint check permissions on the token's member later
+        flask.g.token_member_id = member_id
+        return func( *args, **kwargs )
 
     # Avoid error of "View function mapping is overwriting an existing endpoint 
     # function"
@@ -180,14 +496,62 @@ def auth_required( func ):
 
     return check
 
+CREDENTIAL_CACHE = None
+# Only lives in this process, so cached entries are useless to anyone who 
+# manages to read them out of memory
+CREDENTIAL_CACHE_KEY = secrets.token_bytes( 32 )
+
+def get_credential_cache():
+    """Cache of username/password pairs that recently passed Basic auth
+
+    Checking a password costs a full bcrypt run, and doorbots send the same 
+    credentials on every request. Keys are an HMAC of the username and 
+    password, so neither is kept in memory. Values are the auth version the 
+    credentials passed at. Changing a member's username, password, or active 
+    flag moves it on (in any worker), and older entries are then checked 
+    again.
+    """
+    global CREDENTIAL_CACHE
+    if CREDENTIAL_CACHE is None:
+        auth_conf = Doorbot.Config.get( 'basic_auth', {} )
+        CREDENTIAL_CACHE = TTLCache(
+            max_size = auth_conf.get( 'cache_size', 100 ),
+            ttl = auth_conf.get( 'cache_seconds', 60 ),
+        )
+    return CREDENTIAL_CACHE
+
+def clear_credential_cache():
+    if CREDENTIAL_CACHE is not None:
+        CREDENTIAL_CACHE.clear()
+
+# Covers set_password() and change_password, along with anything else that 
+# might change who a username belongs to
+on_committed_change( [ Member ], clear_credential_cache )
+
+def credential_cache_key( username, password ):
+    username = username.encode( 'utf-8' )
+    password = password.encode( 'utf-8' )
+    # Length prefix keeps ("ab", "c") and ("a", "bc") apart
+    msg = len( username ).to_bytes( 4, 'big' ) + username + password
+    return hmac.new( CREDENTIAL_CACHE_KEY, msg, hashlib.sha256 ).digest()
+
 @auth.verify_password
 def verify_basic_auth( username, password ):
-    session = get_session()
+    cache = get_credential_cache()
+    key = credential_cache_key( username, password )
+    version = Doorbot.ACLCache.get_current_auth_version()
+    if cache.get( key ) == version:
+        return username
+
+    session = get_request_session()
     member = Member.get_by_username( username, session )
-    session.close()
 
-    if member and member.check_password( password, session ):
-        return member
+    is_valid = member is not None \
+        and member.check_password( password, session )
+
+    if is_valid:
+        cache.set( key, version )
+        return username
 
     return None
 
@@ -207,13 +571,11 @@ def check_tag( tag ):
         response.status = 400
         return response
 
-    session = get_session()
-    member = Member.get_by_tag( tag, session )
-    session.close()
+    entry = Doorbot.ACLCache.get_door_snapshot().get( tag )
 
-    if None == member:
+    if None == entry:
         response.status = 404
-    elif member.active:
+    elif entry.active:
         response.status = 200
     else:
         response.status = 403
@@ -228,27 +590,25 @@ def check_tag_by_permission( tag, permission ):
         response.status = 400
         return response
 
-    session = get_session()
-    member = Member.get_by_tag( tag, session )
-    session.close()
+    entry = Doorbot.ACLCache.get_door_snapshot().get( tag )
 
     is_active = False
     is_found = False
     full_name = None
-    if None == member:
+    if None == entry:
         response.status = 404
-    elif member.active:
+    elif entry.active:
         is_active = True
         is_found = True
-        full_name = member.full_name
-        if member.has_permission( permission ):
+        full_name = entry.full_name
+        if permission in entry.permissions:
             response.status = 200
         else:
             response.status = 403
     else:
         is_active = False
         is_found = True
-        full_name = member.full_name
+        full_name = entry.full_name
         response.status = 403
 
     response.content_type = 'application/json'
@@ -263,6 +623,64 @@ def check_tag_by_permission( tag, permission ):
 
     return response
 
+MAX_BATCH_CHECKS = 1000
+
+@app.route( "/v1/check_tags",  methods = [ "GET" ] )
+@auth_required
+def check_tags_by_permission():
+    """Check many tags against many permissions in one request
+
+    Pass each tag as a 'tag' arg, and each permission as a 'permission' arg. 
+    Every tag is checked against every permission. If no permissions are 
+    passed, tags are only checked for being active.
+    """
+    args = flask.request.args
+    tags = args.getlist( 'tag' )
+    permissions = args.getlist( 'permission' )
+
+    if not tags:
+        return error_response( "At least one tag is required", 400 )
+    for tag in tags:
+        if not MATCH_INT.match( tag ):
+            return error_response( "Tag " + tag + " is not valid", 400 )
+    if len( tags ) * max( len( permissions ), 1 ) > MAX_BATCH_CHECKS:
+        return error_response( "Too many checks in one request", 400 )
+
+    snapshot = Doorbot.ACLCache.get_door_snapshot()
+
+    results = []
+    for tag in tags:
+        entry = snapshot.get( tag )
+        is_found = entry is not None
+        is_active = is_found and entry.active
+        full_name = entry.full_name if is_found else None
+
+        if not permissions:
+            results.append({
+                "rfid": tag,
+                "location": None,
+                "full_name": full_name,
+                "active": is_active,
+                "found": is_found,
+                "allowed": is_active,
+            })
+
+        for permission in permissions:
+            results.append({
+                "rfid": tag,
+                "location": permission,
+                "full_name": full_name,
+                "active": is_active,
+                "found": is_found,
+                "allowed": is_active and ( permission in entry.permissions ),
+            })
+
+    response = flask.make_response()
+    response.status = 200
+    response.content_type = 'application/json'
+    response.set_data( flask.json.dumps( results ) )
+    return response
+
 # TODO deprecate non-/v1 version
 @app.route( "/entry/<tag>/<location>", methods = [ "GET" ] )
 @app.route( "/v1/entry/<tag>/<location>", methods = [ "GET" ] )
@@ -273,7 +691,7 @@ def log_entry( tag, location ):
         response.status = 400
         return response
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     stmt = select( Location ).where(
@@ -282,7 +700,6 @@ def log_entry( tag, location ):
     location_db = session.scalars( stmt ).one_or_none()
 
     if location_db is None:
-        session.close()
         set_error(
             response = response,
             msg = "Location " + location + " was not found",
@@ -290,42 +707,102 @@ def log_entry( tag, location ):
         )
         return response
 
-    entry = EntryLog(
-        rfid = tag,
-        mapped_location = location_db,
-    )
+    location_id = location_db.id
 
     full_name = None
     if None == member:
-        entry.is_active_tag = False
-        entry.is_found_tag = False
+        is_active_tag = False
+        is_found_tag = False
         response.status = 404
     elif member.active:
         full_name = member.full_name
-        entry.is_active_tag = True
-        entry.is_found_tag = True
+        is_active_tag = True
+        is_found_tag = True
         response.status = 200
     else:
         full_name = member.full_name
-        entry.is_active_tag = False
-        entry.is_found_tag = True
+        is_active_tag = False
+        is_found_tag = True
         response.status = 403
 
-    session.add( entry )
-    session.add( location_db )
-    session.commit()
+    # Written in the background, so the doorbot doesn't wait on the commit
+    Doorbot.EntryLogWriter.log_entry(
+        rfid = tag,
+        location_id = location_id,
+        is_active_tag = is_active_tag,
+        is_found_tag = is_found_tag,
+    )
 
     response.content_type = 'application/json'
     json_data = flask.json.dumps({
         "rfid": tag,
         "location": location,
         "full_name": full_name,
-        "active": entry.is_active_tag,
-        "found": entry.is_found_tag,
+        "active": is_active_tag,
+        "found": is_found_tag,
+    })
+    response.set_data( json_data )
+
+    return response
+
+@app.route( "/v1/scan/<tag>/<location>", methods = [ "GET" ] )
+@auth_required
+def scan_tag( tag, location ):
+    """Check a tag for a location and log the entry, all in one request
+
+    The location's permission is the permission with the same name. If there 
+    isn't one, nobody gets in.
+    """
+    response = flask.make_response()
+    if (not MATCH_INT.match( tag )) or (not MATCH_NAME.match( location )):
+        response.status = 400
+        return response
+
+    session = get_request_session()
+    stmt = select( Location.id ).where(
+        Location.name == location
+    )
+    location_id = session.scalars( stmt ).one_or_none()
+
+    if location_id is None:
+        set_error(
+            response = response,
+            msg = "Location " + location + " was not found",
+            status = 404,
+        )
+        return response
+
+    entry = Doorbot.ACLCache.get_door_snapshot().get( tag )
+
+    is_found = entry is not None
+    is_active = is_found and entry.active
+    is_allowed = is_active and ( location in entry.permissions )
+    full_name = entry.full_name if is_found else None
+
+    if not is_found:
+        response.status = 404
+    elif is_allowed:
+        response.status = 200
+    else:
+        response.status = 403
+
+    Doorbot.EntryLogWriter.log_entry(
+        rfid = tag,
+        location_id = location_id,
+        is_active_tag = is_allowed,
+        is_found_tag = is_found,
+    )
+
+    response.content_type = 'application/json'
+    json_data = flask.json.dumps({
+        "rfid": tag,
+        "location": location,
+        "full_name": full_name,
+        "active": is_active,
+        "found": is_found,
     })
     response.set_data( json_data )
 
-    session.close()
     return response
 
 @app.route( "/v1/new_tag/<tag>/<full_name>", methods = [ "PUT" ] )
@@ -336,14 +813,13 @@ def new_tag( tag, full_name ):
         response.status = 400
         return response
 
-    session = get_session()
+    session = get_request_session()
     member = Doorbot.SQLAlchemy.Member(
         full_name = full_name,
         rfid = tag,
     )
     session.add( member )
     session.commit()
-    session.close()
 
     response.status = 201
     return response
@@ -356,13 +832,12 @@ def deactivate_tag( tag ):
         response.status = 400
         return response
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     member.active = False
     session.add( member )
     session.commit()
-    session.close()
 
     response.status = 200
     return response
@@ -375,13 +850,12 @@ def reactivate_tag( tag ):
         response.status = 400
         return response
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     member.active = True
     session.add( member )
     session.commit()
-    session.close()
 
     response.status = 200
     return response
@@ -397,13 +871,12 @@ def edit_tag( current_tag, new_tag ):
         response.status = 400
         return response
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( current_tag, session )
 
     member.rfid = new_tag
     session.add( member )
     session.commit()
-    session.close()
 
     response.status = 201
     return response
@@ -416,13 +889,12 @@ def edit_name( tag, new_name ):
         response.status = 400
         return response
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     member.full_name = new_name
     session.add( member )
     session.commit()
-    session.close()
 
     response.status = 201
     return response
@@ -449,16 +921,29 @@ def search_tags():
     elif limit > 100:
         limit = 100
 
-    members = Doorbot.API.search_tag_list( name, tag, offset, limit )
+    try:
+        inactive_months = parse_inactive_months( args.get( 'inactive_months' ) )
+    except ValueError as e:
+        set_error(
+            response = response,
+            msg = str( e ),
+            status = 400,
+        )
+        return response
+
+    members = Doorbot.API.search_tag_list( name, tag, offset, limit,
+        inactive_months )
 
-    out = ''
-    for member in members:
-        out += ','.join([
+    out = ''.join(
+        ','.join([
             member.rfid,
             member.full_name,
             "1" if member.active else "0",
             member.mms_id if member.mms_id else "",
+            format_last_seen( member.last_seen ),
         ]) + "\n"
+        for member in members
+    )
 
     response.status = 200
     response.content_type = 'text/plain'
@@ -472,8 +957,10 @@ def search_entry_log():
     response = flask.make_response()
 
     tag = args.get( 'tag' )
+    name = args.get( 'name' )
     offset = args.get( 'offset' )
     limit = args.get( 'limit' )
+    cursor = args.get( 'cursor' )
 
     offset = int( offset ) if offset else 0
     limit = int( limit ) if limit else 0
@@ -486,82 +973,466 @@ def search_entry_log():
     elif limit > 100:
         limit = 100
 
-    logs = search_scan_logs( tag, offset, limit )
+    try:
+        filters = parse_entry_log_filters( args )
+        logs = search_scan_logs( tag, offset, limit, cursor,
+            name = name,
+            **filters
+        )
+    except ValueError as e:
+        set_error(
+            response = response,
+            msg = str( e ),
+            status = 400,
+        )
+        return response
+
+    next_cursor = next_entry_cursor( logs, limit )
+    if next_cursor:
+        response.headers[ 'X-Next-Cursor' ] = next_cursor
 
-    out = ''
-    for entry in logs:
-        out += ','.join([
+    out = ''.join(
+        ','.join([
             entry[ 0 ] if entry[ 0 ] else "",
             entry[ 1 ],
-            entry[ 3 ],
+            str( entry[ 3 ] ),
             "1" if entry[ 4 ] else "0",
             "1" if entry[ 5 ] else "0",
             entry[ 2 ] if entry[ 2 ] else "",
         ]) + "\n"
+        for entry in logs
+    )
 
     response.status = 200
     response.content_type = 'text/plain'
     response.set_data( out )
     return response
 
-@app.route( "/v1/dump_active_tags/<permission>", methods = [ "GET" ] )
+EXPORT_FORMATS = {
+    "csv": "text/csv",
+    "ndjson": "application/x-ndjson",
+}
+EXPORT_COLUMNS = [
+    "full_name",
+    "rfid",
+    "entry_time",
+    "is_active_tag",
+    "is_found_tag",
+    "location",
+]
+EXPORT_BATCH_SIZE = 1000
+
+class _LastLine:
+    """Write target for csv.writer that just keeps the last line"""
+    line = ""
+
+    def write( self, line ):
+        self.line = line
+
+def stream_entry_log(
+    stmt,
+    sql_params,
+    export_format: str,
+):
+    """Generator of entry log rows as CSV or NDJSON text
+
+    Rows come from a server-side cursor a batch at a time, so memory use 
+    doesn't grow with the number of rows.
+    """
+    out = _LastLine()
+    writer = csv.writer( out, lineterminator = "\n" )
+    if "csv" == export_format:
+        writer.writerow( EXPORT_COLUMNS )
+        yield out.line
+
+    with get_engine().connect() as conn:
+        result = conn.execution_options(
+            stream_results = True,
+            yield_per = EXPORT_BATCH_SIZE,
+        ).execute( stmt, sql_params )
+
+        for rows in result.partitions():
+            chunk = []
+            for row in rows:
+                if "csv" == export_format:
+                    writer.writerow([
+                        row.full_name,
+                        row.rfid,
+                        row.entry_time.isoformat(),
+                        "1" if row.is_active_tag else "0",
+                        "1" if row.is_found_tag else "0",
+                        row.location,
+                    ])
+                    chunk.append( out.line )
+                else:
+                    chunk.append( flask.json.dumps({
+                        "full_name": row.full_name,
+                        "rfid": row.rfid,
+                        "entry_time": row.entry_time.isoformat(),
+                        "is_active_tag": bool( row.is_active_tag ),
+                        "is_found_tag": bool( row.is_found_tag ),
+                        "location": row.location,
+                    }) + "\n" )
+            yield "".join( chunk )
+
+@app.route( "/v1/export_entry_log", methods = [ "GET" ] )
 @auth_required
-def dump_tags_for_permission( permission ):
-    session = get_session()
-    stmt = select( Doorbot.SQLAlchemy.Permission ).where(
-        Doorbot.SQLAlchemy.Permission.name == permission
+def export_entry_log():
+    """Stream every matching entry log row, newest first
+
+    Takes the same filters as /v1/search_entry_log, but no paging.
+    """
+    args = flask.request.args
+    export_format = args.get( 'format', 'csv' )
+
+    try:
+        if export_format not in EXPORT_FORMATS:
+            raise ValueError( "Unknown export format: " + export_format )
+        filters = parse_entry_log_filters( args )
+        stmt, sql_params = entry_log_statement(
+            get_engine().dialect.name,
+            tag = args.get( 'tag' ),
+            name = args.get( 'name' ),
+            **filters
+        )
+    except ValueError as e:
+        response = flask.make_response()
+        set_error(
+            response = response,
+            msg = str( e ),
+            status = 400,
+        )
+        return response
+
+    response = flask.Response(
+        flask.stream_with_context(
+            stream_entry_log( stmt, sql_params, export_format )
+        ),
+        status = 200,
+        content_type = EXPORT_FORMATS[ export_format ],
     )
-    found_permission = session.scalars( stmt ).one_or_none()
+    response.headers[ 'Content-Disposition' ] = \
+        'attachment; filename="entry_log.' + export_format + '"'
+    return response
+
+DUMP_FORMATS = {
+    "json": "application/json",
+    "sorted": "application/vnd.bodgery.acl",
+    "bloom": "application/vnd.bodgery.acl-bloom",
+}
+
+def dump_format():
+    """Pick the dump format from the 'format' arg, or the Accept header"""
+    dump_format = flask.request.args.get( 'format' )
+    if dump_format is not None:
+        return dump_format if dump_format in DUMP_FORMATS else None
+
+    content_type = flask.request.accept_mimetypes.best_match(
+        list( DUMP_FORMATS.values() ),
+        default = DUMP_FORMATS[ "json" ],
+    )
+    for name, format_type in DUMP_FORMATS.items():
+        if format_type == content_type:
+            return name
 
+def dump_tags_response(
+    snapshot,
+    permission = None,
+):
+    """Dump the active tags for a permission (or all active tags)
+
+    The response carries the ACL version as an ETag, and answers with a 304 
+    if the client already has that version. If a 'since' arg is passed with 
+    a version the client already has, only the tags added and removed since 
+    then are sent. If we no longer know what that version looked like, all 
+    tags are sent as 'added', with 'full' set to tell the client to replace 
+    what it has.
+
+    Besides JSON, tags can be sent in the packed binary formats from 
+    Doorbot.ACLExport, by passing a 'format' arg of 'sorted' or 'bloom', or 
+    asking for their content type in the Accept header.
+    """
     response = flask.make_response()
-    if found_permission is None:
-        session.close()
+    since = flask.request.args.get( 'since' )
+    if since is not None and not MATCH_INT.match( since ):
+        return error_response( "since must be an ACL version number", 400 )
+
+    out_format = dump_format()
+    if out_format is None:
+        return error_response( "Unknown format", 400 )
+    if since is not None and "json" != out_format:
+        return error_response( "since is only supported for JSON", 400 )
+
+    etag = "acl-" + str( snapshot.version ) + "-" + out_format
+    response.set_etag( etag )
+    response.headers[ 'X-ACL-Version' ] = str( snapshot.version )
+    response.vary.add( 'Accept' )
+    if flask.request.if_none_match.contains( etag ):
+        response.status = 304
+        return response
+
+    tags = snapshot.active_tags( permission )
+    if "sorted" == out_format:
+        out = Doorbot.ACLExport.pack_sorted( tags, snapshot.version )
+    elif "bloom" == out_format:
+        export_conf = Doorbot.Config.get( 'acl_export', {} )
+        out = Doorbot.ACLExport.pack_bloom(
+            tags,
+            snapshot.version,
+            export_conf.get( 'bloom_false_positive_rate',
+                Doorbot.ACLExport.DEFAULT_FALSE_POSITIVE_RATE ),
+        )
+    elif since is None:
+        out = flask.json.dumps({ rfid: True for rfid in tags })
+    else:
+        since = int( since )
+        old_snapshot = Doorbot.ACLCache.get_snapshot_at( since )
+
+        if old_snapshot is None:
+            out = {
+                "version": snapshot.version,
+                "since": None,
+                "full": True,
+                "added": list( tags ),
+                "removed": [],
+            }
+        else:
+            old_tags = set( old_snapshot.active_tags( permission ) )
+            new_tags = set( tags )
+            out = {
+                "version": snapshot.version,
+                "since": since,
+                "full": False,
+                "added": sorted( new_tags - old_tags ),
+                "removed": sorted( old_tags - new_tags ),
+            }
+        out = flask.json.dumps( out )
+
+    response.status = 200
+    response.content_type = DUMP_FORMATS[ out_format ]
+    response.set_data( out )
+    return response
+
+@app.route( "/v1/dump_active_tags/<permission>", methods = [ "GET" ] )
+@auth_required
+def dump_tags_for_permission( permission ):
+    # Costs one small query to check the version, but doorbots must never 
+    # be handed a list that's older than one they already have
+    snapshot = Doorbot.ACLCache.get_snapshot( check_version = True )
+
+    if permission not in snapshot.permission_names:
+        response = flask.make_response()
         set_error(
             response = response,
             msg = "Location " + permission + " was not found",
             status = 404,
         )
-    else:
-        members = {}
-        for member in found_permission.all_members_with_permission():
-            rfid = member.rfid
-            members[ rfid ] = True
+        return response
 
-        session.close()
-        json_data = flask.json.dumps( members )
-        response.content_type = 'application/json'
-        response.set_data( json_data )
+    return dump_tags_response( snapshot, permission )
+
+@app.route( "/v1/dump_active_tags", methods = [ "GET" ] )
+@auth_required
+def dump_tags_by_permission():
+    """Active tags for many permissions at once
+
+    Returns a JSON object of permission names to lists of tags. By default 
+    it has every permission. Pass 'permission' args (repeated, or separated 
+    by commas) to get only those. Pass a 'hostname' to get only the 
+    permissions named after that host's locations, so a controller running 
+    several tools can fetch everything it needs in one request.
+    """
+    args = flask.request.args
+    names = set()
+    for arg in args.getlist( 'permission' ):
+        names.update( name.strip() for name in arg.split( ',' )
+            if name.strip() )
+    hostname = args.get( 'hostname' )
+
+    for name in names:
+        if not MATCH_NAME.match( name ):
+            return error_response( "Invalid permission: " + name, 400 )
+    if hostname is not None and not MATCH_NAME.match( hostname ):
+        return error_response( "Invalid hostname: " + hostname, 400 )
+
+    snapshot = Doorbot.ACLCache.get_snapshot( check_version = True )
+
+    unknown = sorted( names - snapshot.permission_names )
+    if unknown:
+        return error_response(
+            "Location " + ", ".join( unknown ) + " was not found", 404 )
+
+    permissions = names if names else snapshot.permission_names
+    if hostname is not None:
+        session = get_request_session()
+        host_locations = set( session.scalars(
+            select( Location.name ).where( Location.hostname == hostname )
+        ) )
+        if not host_locations:
+            return error_response(
+                "Hostname " + hostname + " was not found", 404 )
+        permissions = permissions & host_locations
+
+    # Locations don't change the ACL version, so the ETag also has to 
+    # change when a host is given different permissions
+    selected = hashlib.sha256(
+        ",".join( sorted( permissions ) ).encode( "UTF-8" )
+    ).hexdigest()[:16]
+    response = flask.make_response()
+    etag = "acl-" + str( snapshot.version ) + "-permissions-" + selected
+    response.set_etag( etag )
+    response.headers[ 'X-ACL-Version' ] = str( snapshot.version )
+    if flask.request.if_none_match.contains( etag ):
+        response.status = 304
+        return response
 
+    out = {
+        name: list( tags )
+        for name, tags in snapshot.tags_by_permission( permissions ).items()
+    }
+    response.status = 200
+    response.content_type = 'application/json'
+    response.set_data( flask.json.dumps( out ) )
     return response
 
 @app.route( "/secure/dump_active_tags", methods = [ "GET" ] )
 @auth.login_required
 def dump_tags():
-    session = get_session()
-    stmt = select( Member ).where(
-        Member.active == True
+    snapshot = Doorbot.ACLCache.get_snapshot( check_version = True )
+    return dump_tags_response( snapshot )
+
+STATS_DEFAULT_DAYS = 7
+
+@app.route( "/v1/stats", methods = [ "GET" ] )
+@auth_required
+def scan_stats():
+    """Scan counts from the rollup tables
+
+    With by=location (the default), counts are per location per hour. With 
+    by=member, they're per tag per day. Defaults to the last week.
+    """
+    args = flask.request.args
+    response = flask.make_response()
+    by = args.get( 'by', 'location' )
+    location = args.get( 'location' )
+    tag = args.get( 'tag' )
+
+    try:
+        if by not in ( 'location', 'member' ):
+            raise ValueError( "Unknown stats grouping: " + by )
+        if location and not MATCH_NAME.match( location ):
+            raise ValueError( "Invalid location: " + location )
+        if tag and not MATCH_INT.match( tag ):
+            raise ValueError( "Invalid tag: " + tag )
+        until = parse_entry_log_time( args.get( 'until' ) ) \
+            or datetime.now( timezone.utc )
+        since = parse_entry_log_time( args.get( 'since' ) ) \
+            or until - timedelta( days = STATS_DEFAULT_DAYS )
+    except ValueError as e:
+        set_error(
+            response = response,
+            msg = str( e ),
+            status = 400,
+        )
+        return response
+
+    session = get_request_session()
+    results = []
+    if 'location' == by:
+        locations = dict( session.execute(
+            select( Location.id, Location.name )
+        ).all() )
+        location_id = None
+        if location:
+            location_id = next( ( loc_id
+                for loc_id, name in locations.items()
+                if name == location ), None )
+            if location_id is None:
+                set_error(
+                    response = response,
+                    msg = "Location " + location + " was not found",
+                    status = 404,
+                )
+                return response
+
+        for row in Doorbot.ScanRollups.location_stats( session, since, until,
+            location_id ):
+            results.append({
+                "location": locations.get( row.location ),
+                "hour": row.hour.replace( tzinfo = timezone.utc ).isoformat(),
+                "granted": row.granted,
+                "denied": row.denied,
+                "unknown": row.unknown,
+            })
+    else:
+        for row in Doorbot.ScanRollups.member_stats( session, since, until,
+            tag ):
+            results.append({
+                "rfid": row.rfid,
+                "day": row.day.isoformat(),
+                "granted": row.granted,
+                "denied": row.denied,
+                "unknown": row.unknown,
+            })
+
+    response.status = 200
+    response.content_type = 'application/json'
+    response.set_data( flask.json.dumps( results ) )
+    return response
+
+@app.route( "/v1/location_last_scan", methods = [ "GET" ] )
+@auth_required
+def location_last_scan():
+    """The last scan at every location that has seen one"""
+    stmt = select(
+        Location.name,
+        LocationLastScan.last_scan,
+        LocationLastScan.rfid,
+        LocationLastScan.is_active_tag,
+    ).join(
+        LocationLastScan,
+        LocationLastScan.location == Location.id,
+    ).order_by(
+        Location.name
     )
-    members = session.scalars( stmt ).all()
-    session.close()
 
-    out = {}
-    for member in members:
-        rfid = member.rfid
-        out[ rfid ] = True
+    session = get_request_session()
+    results = [
+        {
+            "location": row.name,
+            "last_scan": format_last_seen( row.last_scan ),
+            "rfid": row.rfid,
+            "is_active_tag": row.is_active_tag,
+        }
+        for row in session.execute( stmt )
+    ]
 
-    return out
+    response = flask.make_response()
+    response.status = 200
+    response.content_type = 'application/json'
+    response.set_data( flask.json.dumps( results ) )
+    return response
 
+@app.route( "/v1/db_pool_stats", methods = [ "GET" ] )
+@auth_required
+def db_pool_stats():
+    stats = Doorbot.DBPool.pool_stats( get_engine() )
+
+    response = flask.make_response()
+    response.status = 200
+    response.content_type = 'application/json'
+    response.set_data( flask.json.dumps( stats ) )
+    return response
 
 @app.route( "/v1/change_passwd/<tag>", methods = [ "PUT" ] )
 @auth_required
 def change_password( tag ):
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     response = flask.make_response()
 
     if member is None:
-        session.close()
         set_error(
             response = response,
             msg = "Member with RFID " + rfid + " was not found",
@@ -572,18 +1443,16 @@ def change_password( tag ):
         pass2 = flask.request.form[ 'new_pass2' ]
 
         if pass1 != pass2:
-            session.close()
             set_error(
                 response = response,
                 msg = "Passwords do not match",
                 status = 400,
             )
         else:
-            password_config = Doorbot.Config.get( 'password_storage' )
+            password_config = Doorbot.BcryptCalibration.storage_config()
             member.set_password( pass1, password_config )
             session.add( member )
             session.commit()
-            session.close()
 
             response.status = 200
 
@@ -592,14 +1461,13 @@ def change_password( tag ):
 @app.route( "/v1/permission/<permission>/<role>", methods = [ "PUT" ] )
 @auth_required
 def add_permission( permission, role ):
-    session = get_session()
+    session = get_request_session()
     role_obj = get_or_create( session, Role, name = role )
     permission_obj = get_or_create( session, Permission, name = permission )
 
     role_obj.permissions.append( permission_obj )
     session.add_all([ role_obj, permission_obj ])
     session.commit()
-    session.close()
 
     response = flask.make_response()
     response.status = 201
@@ -608,20 +1476,18 @@ def add_permission( permission, role ):
 @app.route( "/v1/permission/<permission>/<role>", methods = [ "DELETE" ] )
 @auth_required
 def delete_permission( permission, role ):
-    session = get_session()
+    session = get_request_session()
     role_obj = get( session, Role, name = role )
     permission_obj = get( session, Permission, name = permission )
 
     response = flask.make_response()
     if not role_obj:
-        session.close()
         set_error(
             response = response,
             msg = "Role " + role + " was not found",
             status = 404,
         )
     elif not permission_obj:
-        session.close()
         set_error(
             response = response,
             msg = "Location " + permission + " was not found",
@@ -633,14 +1499,13 @@ def delete_permission( permission, role ):
         role_obj.permissions.remove( permission_obj )
         session.add_all([ role_obj, permission_obj ])
         session.commit()
-        session.close()
 
     return response
 
 @app.route( "/v1/role/<role>/<tag>", methods = [ "PUT" ] )
 @auth_required
 def add_role_to_member( role, tag ):
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     response = flask.make_response()
@@ -654,26 +1519,23 @@ def add_role_to_member( role, tag ):
 
         response.status = 201
 
-    session.close()
     return response
 
 @app.route( "/v1/role/<role>/<tag>", methods = [ "DELETE" ] )
 @auth_required
 def delete_role_from_member( role, tag ):
-    session = get_session()
+    session = get_request_session()
     role_obj = get( session, Role, name = role )
     member_obj = get( session, Member, rfid = tag )
 
     response = flask.make_response()
     if not member_obj:
-        session.close()
         set_error(
             response = response,
             msg = "Member for RFID " + tag + " was not found",
             status = 404,
         )
     elif not role_obj:
-        session.close()
         set_error(
             response = response,
             msg = "Role " + role + " was not found",
@@ -685,7 +1547,6 @@ def delete_role_from_member( role, tag ):
         member_obj.roles.remove( role_obj )
         session.add_all([ member_obj, role_obj ])
         session.commit()
-        session.close()
 
     return response
 
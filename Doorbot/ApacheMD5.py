@@ -0,0 +1,91 @@
+"""Apache's MD5 password hashes ($apr1$), as made by htpasswd
+
+Some old passwords were imported from an htpasswd file. They're checked once
+more on login, then re-encoded with the configured password type. This used
+to run "openssl passwd -apr1", which forked the whole web worker on every
+login by one of these members.
+
+The algorithm is the FreeBSD MD5 crypt, with "$apr1$" in place of "$1$".
+"""
+import hashlib
+import hmac
+
+
+MAGIC = b"$apr1$"
+MAX_SALT_LENGTH = 8
+ROUNDS = 1000
+ITOA64 = "./0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+# Digest bytes are written out three at a time, in this order
+ENCODE_GROUPS = (
+    ( 0, 6, 12 ),
+    ( 1, 7, 13 ),
+    ( 2, 8, 14 ),
+    ( 3, 9, 15 ),
+    ( 4, 10, 5 ),
+)
+
+
+def _to64( value, length ):
+    out = ""
+    for i in range( length ):
+        out += ITOA64[ value & 0x3f ]
+        value >>= 6
+    return out
+
+def encode(
+    password: bytes,
+    salt: bytes,
+):
+    """Hash a password with the given salt, returning the full $apr1$ string
+
+    Only the first 8 characters of the salt are used, like htpasswd.
+    """
+    salt = salt.split( b"$" )[0][ :MAX_SALT_LENGTH ]
+
+    ctx = hashlib.md5( password + MAGIC + salt )
+    alternate = hashlib.md5( password + salt + password ).digest()
+    for i in range( len( password ), 0, -16 ):
+        ctx.update( alternate[ :min( i, 16 ) ] )
+
+    # Yes, it really does alternate between a zero byte and the first byte
+    # of the password
+    i = len( password )
+    while i:
+        ctx.update( b"\x00" if i & 1 else password[ :1 ] )
+        i >>= 1
+    digest = ctx.digest()
+
+    # Deliberately slow things down
+    for i in range( ROUNDS ):
+        ctx = hashlib.md5( password if i & 1 else digest )
+        if i % 3:
+            ctx.update( salt )
+        if i % 7:
+            ctx.update( password )
+        ctx.update( digest if i & 1 else password )
+        digest = ctx.digest()
+
+    out = ""
+    for a, b, c in ENCODE_GROUPS:
+        out += _to64( ( digest[a] << 16 ) | ( digest[b] << 8 ) | digest[c], 4 )
+    out += _to64( digest[11], 2 )
+
+    return ( MAGIC + salt + b"$" ).decode( 'utf-8' ) + out
+
+def does_match(
+    encoded: str,
+    password: bytes,
+):
+    """True if the password matches an $apr1$ string, in constant time"""
+    if not encoded.startswith( MAGIC.decode( 'utf-8' ) ):
+        return False
+    salt = encoded[ len( MAGIC ): ].split( "$" )[0]
+    if not salt:
+        return False
+
+    expected = encode( password, salt.encode( 'utf-8' ) )
+    return hmac.compare_digest(
+        expected.encode( 'utf-8' ),
+        encoded.encode( 'utf-8' ),
+    )
@@ -0,0 +1,115 @@
+"""Shared plumbing for the background queues
+
+EntryLogWriter and PasswordRehash each put work on a queue for a background
+thread. BackgroundWorker holds the parts they have in common: starting the
+thread (again, after a fork), flushing, and stopping.
+
+ProcessSingleton holds the one object of a kind that a process uses, made
+from the config the first time it's asked for.
+"""
+import os
+import queue
+import threading
+
+
+class BackgroundWorker:
+    """A queue worked through by one background thread
+
+    Subclasses set thread_name, and provide:
+
+    * _run(), the thread's loop. It takes items off self._queue, sets any
+      threading.Event it finds once everything before it is done, and
+      returns when it finds None.
+    * _run_now( items ), which does the work for items in the caller's
+      thread. flush() uses it when no thread is running.
+    """
+    thread_name = "background-worker"
+
+    def __init__( self ):
+        self._queue = queue.Queue()
+        self._thread = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def flush(
+        self,
+        timeout: float = None,
+    ):
+        """Block until everything queued so far has been done"""
+        if not self._is_running():
+            self._run_now( self._drain() )
+            return
+
+        done = threading.Event()
+        self._queue.put( done )
+        done.wait( timeout )
+
+    def stop( self ):
+        """Stop the background thread, once it's done what was queued"""
+        if self._is_running():
+            self._queue.put( None )
+            self._thread.join()
+        self._thread = None
+
+    def _is_running( self ):
+        return self._thread is not None \
+            and self._pid == os.getpid() \
+            and self._thread.is_alive()
+
+    def _ensure_running( self ):
+        if self._is_running():
+            return
+
+        with self._start_lock:
+            if self._is_running():
+                return
+
+            # Threads don't survive a fork, so a uwsgi worker needs its own
+            self._pid = os.getpid()
+            self._thread = threading.Thread(
+                target = self._run,
+                name = self.thread_name,
+                daemon = True,
+            )
+            self._thread.start()
+
+    def _drain( self ):
+        """Take everything off the queue without waiting for more
+
+        Events are set, and stop markers dropped. Returns the rest.
+        """
+        items = []
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                return items
+
+            if isinstance( item, threading.Event ):
+                item.set()
+            elif item is not None:
+                items.append( item )
+
+
+class ProcessSingleton:
+    """The one object of a kind for this process, made when first needed"""
+
+    def __init__(
+        self,
+        factory,
+    ):
+        self._factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get( self ):
+        """Get the object, calling the factory to make it if needed"""
+        if self._instance is None:
+            with self._lock:
+                if self._instance is None:
+                    self._instance = self._factory()
+        return self._instance
+
+    def peek( self ):
+        """Get the object, or None if it hasn't been made yet"""
+        return self._instance
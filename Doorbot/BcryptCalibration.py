@@ -0,0 +1,148 @@
+"""Pick a bcrypt difficulty that fits a time budget on this host
+
+Each step up in bcrypt difficulty doubles the time it takes. A hand-picked
+difficulty that's fine on one machine can make logins crawl on a slower one,
+or be weaker than it needs to be on a faster one. calibrate() times
+bcrypt.hashpw at increasing difficulties, and picks the highest one that
+still hashes within bcrypt_calibration.budget_ms.
+
+The result never goes below bcrypt_calibration.min_difficulty, even if this
+host is too slow for the budget. Nor does it go below the difficulty in
+password_storage, so calibrating never weakens stored passwords.
+
+Run calibrate_bcrypt.py to see what a host would pick. With
+bcrypt_calibration.on_startup set, the app calibrates when it starts. New
+hashes then use the higher of the calibrated and configured difficulty, as
+returned by storage_config(), and members are moved to it one by one as they
+log in. Only the calibrated difficulty is remembered, so changes to
+password_storage in a reloaded config still take effect.
+"""
+import bcrypt
+import sys
+import time
+import Doorbot.Config
+
+
+DEFAULT_BUDGET_MS = 250
+DEFAULT_MIN_DIFFICULTY = 10
+DEFAULT_MAX_DIFFICULTY = 16
+DEFAULT_SAMPLES = 3
+
+# bcrypt itself won't go lower than this
+LOWEST_DIFFICULTY = 4
+# Same length as the SHA256 digest in base64 that Member really hashes
+SAMPLE_PASSWORD = b"x" * 44
+
+__CALIBRATED_DIFFICULTY = None
+
+
+def time_difficulty(
+    difficulty: int,
+    samples: int = DEFAULT_SAMPLES,
+):
+    """Fastest of several hashes at this difficulty, in milliseconds"""
+    fastest = None
+    for i in range( samples ):
+        salt = bcrypt.gensalt( difficulty )
+        start = time.perf_counter()
+        bcrypt.hashpw( SAMPLE_PASSWORD, salt )
+        took = ( time.perf_counter() - start ) * 1000
+        if fastest is None or took < fastest:
+            fastest = took
+    return fastest
+
+def calibrate(
+    budget_ms: float = DEFAULT_BUDGET_MS,
+    min_difficulty: int = DEFAULT_MIN_DIFFICULTY,
+    max_difficulty: int = DEFAULT_MAX_DIFFICULTY,
+    samples: int = DEFAULT_SAMPLES,
+    timer = time_difficulty,
+):
+    """Find the highest difficulty that hashes within the budget
+
+    Returns a tuple of the difficulty and a dict of the times measured for
+    each difficulty tried, in milliseconds. The difficulty is at least
+    min_difficulty, even if that's over budget.
+    """
+    min_difficulty = max( min_difficulty, LOWEST_DIFFICULTY )
+    timings = {}
+    best = min_difficulty
+
+    for difficulty in range( min_difficulty, max_difficulty + 1 ):
+        took = timer( difficulty, samples )
+        timings[ difficulty ] = took
+        if took > budget_ms:
+            break
+        best = difficulty
+
+    return best, timings
+
+def calibrate_from_config():
+    """Calibrate using the bcrypt_calibration and password_storage config
+
+    Returns the same as calibrate(). The configured difficulty is used as
+    a floor, along with min_difficulty.
+    """
+    conf = Doorbot.Config.get( 'bcrypt_calibration', {} )
+    storage_conf = Doorbot.Config.get( 'password_storage' )
+    min_difficulty = conf.get( 'min_difficulty', DEFAULT_MIN_DIFFICULTY )
+    if 'bcrypt' == storage_conf.get( 'type' ):
+        min_difficulty = max( min_difficulty,
+            storage_conf[ 'bcrypt' ][ 'difficulty' ] )
+
+    return calibrate(
+        budget_ms = conf.get( 'budget_ms', DEFAULT_BUDGET_MS ),
+        min_difficulty = min_difficulty,
+        max_difficulty = max( min_difficulty,
+            conf.get( 'max_difficulty', DEFAULT_MAX_DIFFICULTY ) ),
+        samples = conf.get( 'samples', DEFAULT_SAMPLES ),
+    )
+
+def use_difficulty(
+    difficulty: int,
+):
+    """Use at least this difficulty for new bcrypt hashes in this process
+
+    Pass None to go back to just the configured difficulty.
+    """
+    global __CALIBRATED_DIFFICULTY
+    __CALIBRATED_DIFFICULTY = difficulty
+
+def storage_config():
+    """The password_storage config, with any calibrated difficulty applied
+
+    Read fresh each time, so it follows config reloads. For bcrypt, the 
+    difficulty is the higher of the configured and calibrated ones.
+    """
+    storage_conf = Doorbot.Config.get( 'password_storage' )
+    calibrated = __CALIBRATED_DIFFICULTY
+    if calibrated is None or 'bcrypt' != storage_conf.get( 'type' ):
+        return storage_conf
+
+    bcrypt_conf = storage_conf.get( 'bcrypt', {} )
+    if bcrypt_conf.get( 'difficulty', 0 ) >= calibrated:
+        return storage_conf
+
+    storage_conf = dict( storage_conf )
+    bcrypt_conf = dict( bcrypt_conf )
+    bcrypt_conf[ 'difficulty' ] = calibrated
+    storage_conf[ 'bcrypt' ] = bcrypt_conf
+    return storage_conf
+
+def calibrate_on_startup():
+    """Calibrate and use the result, if the config asks for it
+
+    Does nothing unless bcrypt_calibration.on_startup is set and passwords
+    are stored with bcrypt. Returns the difficulty picked, or None.
+    """
+    conf = Doorbot.Config.get( 'bcrypt_calibration', {} )
+    if not conf.get( 'on_startup' ):
+        return None
+    if 'bcrypt' != Doorbot.Config.get( 'password_storage' ).get( 'type' ):
+        return None
+
+    difficulty, timings = calibrate_from_config()
+    use_difficulty( difficulty )
+    print( f"Using bcrypt difficulty {difficulty}"
+        + f" ({timings[ difficulty ]:.0f}ms per hash)", file = sys.stderr )
+    return difficulty
@@ -1,32 +1,159 @@
+"""Parsed-once access to config.yml
+
+The file is read and parsed the first time any section is asked for. After
+that, get() is a dict lookup. Sections come back read-only (dicts become
+MappingProxyType, lists become tuples), since they're shared by everything
+in the process.
+
+The file is checked for changes at most every RELOAD_CHECK_SECONDS, and
+reloaded if its mtime moved. After install_sighup_handler(), a SIGHUP forces
+a reload on the next get(). If the new file doesn't parse, the old config is
+kept.
+
+Overrides set with set_override() sit on top of the file, and survive
+reloads. They're for values worked out at startup, not for editing config.
+"""
 from yaml import load, CLoader as Loader
+from types import MappingProxyType
 import pathlib
+import signal
+import sys
+import threading
+import time
 
 
 CONF_FILE = "config.yml"
-CONF = {}
+CONF = MappingProxyType( {} )
 INIT = False
+RELOAD_CHECK_SECONDS = 2
+_NO_DEFAULT = object()
 
+__LOCK = threading.Lock()
+__CONF_PATH = None
+__MTIME = None
+__NEXT_CHECK = 0
+__FILE_CONF = {}
+__OVERRIDES = {}
+__RELOAD_REQUESTED = False
 
-def init(
-    file_path: str = 'config.yml'
-):
+
+def _freeze( value ):
+    if isinstance( value, dict ):
+        return MappingProxyType({
+            key: _freeze( item ) for key, item in value.items()
+        })
+    elif isinstance( value, list ):
+        return tuple( _freeze( item ) for item in value )
+    return value
+
+def _conf_path( file_path ):
     cur_dir = pathlib \
         .Path( __file__ ) \
         .parent \
         .resolve()
-    full_conf_path = pathlib \
-        .PurePath( cur_dir, '..', file_path )
+    return pathlib.Path( pathlib.PurePath( cur_dir, '..', file_path ) )
 
-    yaml_input = pathlib.Path( full_conf_path ).read_text()
+def _publish():
     global CONF
-    CONF = load( yaml_input, Loader = Loader )
+    conf = dict( __FILE_CONF )
+    conf.update( __OVERRIDES )
+    CONF = _freeze( conf )
+
+def init(
+    file_path: str = CONF_FILE,
+):
+    """Read and parse the config file"""
+    global INIT, __CONF_PATH, __MTIME, __NEXT_CHECK, __FILE_CONF
+
+    conf_path = _conf_path( file_path )
+    mtime = conf_path.stat().st_mtime
+    yaml_input = conf_path.read_text()
+
+    with __LOCK:
+        __FILE_CONF = load( yaml_input, Loader = Loader ) or {}
+        __CONF_PATH = conf_path
+        __MTIME = mtime
+        __NEXT_CHECK = time.monotonic() + RELOAD_CHECK_SECONDS
+        _publish()
+        INIT = True
+
+def reload():
+    """Read the config file again, keeping the old config if it's broken"""
+    try:
+        init( __CONF_PATH or CONF_FILE )
+    except Exception as e:
+        print( "Could not reload config, keeping the old one: " + str( e ),
+            file = sys.stderr )
 
-    INIT = True
+def _check_for_changes():
+    global __NEXT_CHECK, __RELOAD_REQUESTED
 
+    now = time.monotonic()
+    if now < __NEXT_CHECK and not __RELOAD_REQUESTED:
+        return
+    __NEXT_CHECK = now + RELOAD_CHECK_SECONDS
+
+    if __RELOAD_REQUESTED:
+        __RELOAD_REQUESTED = False
+        reload()
+        return
+
+    try:
+        mtime = __CONF_PATH.stat().st_mtime
+    except OSError:
+        # Probably in the middle of being replaced. Try again later.
+        return
+    if mtime != __MTIME:
+        reload()
+
+def _on_sighup( signum, frame ):
+    # Only set a flag. Parsing YAML inside a signal handler could interrupt
+    # another thread halfway through reading the config.
+    global __RELOAD_REQUESTED
+    __RELOAD_REQUESTED = True
+
+def install_sighup_handler():
+    """Reload the config on SIGHUP
+
+    Only works from the main thread. Returns False if the handler couldn't
+    be installed.
+    """
+    try:
+        signal.signal( signal.SIGHUP, _on_sighup )
+    except ( ValueError, AttributeError ):
+        return False
+    return True
+
+def set_override(
+    name: str,
+    value,
+):
+    """Replace a top level config section for this process"""
+    if not INIT:
+        init()
+    with __LOCK:
+        __OVERRIDES[ name ] = value
+        _publish()
+
+def clear_overrides():
+    with __LOCK:
+        __OVERRIDES.clear()
+        _publish()
 
 def get(
-    name: str
+    name: str,
+    default = _NO_DEFAULT,
 ):
+    """Fetch a top level config section
+
+    If a default is passed, it's returned when the section is missing.
+    Otherwise, a missing section is a KeyError.
+    """
     if not INIT:
         init()
-    return CONF[ name ]
+    else:
+        _check_for_changes()
+
+    if default is _NO_DEFAULT:
+        return CONF[ name ]
+    return CONF.get( name, default )
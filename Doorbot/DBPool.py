@@ -0,0 +1,90 @@
+"""Connection pool that keeps count of how it's being used
+
+Under uwsgi, each worker has its own pool. When every connection is checked
+out, the next request waits for one to come back, which shows up as a door
+that's slow to open. These counters make that visible.
+"""
+import threading
+import time
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.pool import QueuePool
+
+
+class InstrumentedQueuePool( QueuePool ):
+    """QueuePool that counts checkouts, waits, and new connections
+
+    A wait is a checkout that found no idle connection in the pool, and so
+    had to either open a new one or block until one was returned.
+    """
+
+    def __init__( self, *args, **kwargs ):
+        super().__init__( *args, **kwargs )
+        self._stats_lock = threading.Lock()
+        self._checkouts = 0
+        self._waits = 0
+        self._wait_seconds = 0.0
+        self._max_wait_seconds = 0.0
+        self._timeouts = 0
+        self._connects = 0
+
+    def _create_connection( self ):
+        conn = super()._create_connection()
+        with self._stats_lock:
+            self._connects += 1
+        return conn
+
+    def _do_get( self ):
+        if self.checkedin() > 0:
+            conn = super()._do_get()
+            with self._stats_lock:
+                self._checkouts += 1
+            return conn
+
+        start = time.monotonic()
+        try:
+            conn = super()._do_get()
+        except TimeoutError:
+            with self._stats_lock:
+                self._timeouts += 1
+            raise
+        waited = time.monotonic() - start
+
+        with self._stats_lock:
+            self._checkouts += 1
+            self._waits += 1
+            self._wait_seconds += waited
+            self._max_wait_seconds = max( self._max_wait_seconds, waited )
+        return conn
+
+    def stats( self ):
+        """Dict of the pool's current state and counters"""
+        with self._stats_lock:
+            return {
+                "pool": type( self ).__name__,
+                "size": self.size(),
+                "max_overflow": self._max_overflow,
+                "checked_out": self.checkedout(),
+                "checked_in": self.checkedin(),
+                "overflow": self.overflow(),
+                "checkouts": self._checkouts,
+                "waits": self._waits,
+                "wait_seconds": self._wait_seconds,
+                "max_wait_seconds": self._max_wait_seconds,
+                "timeouts": self._timeouts,
+                "connects": self._connects,
+            }
+
+
+def pool_stats( engine ):
+    """Stats for the engine's pool
+
+    Pools that aren't instrumented, like the one for SQLite tests, only
+    report their type and a status string.
+    """
+    pool = engine.pool
+    if isinstance( pool, InstrumentedQueuePool ):
+        return pool.stats()
+    return {
+        "pool": type( pool ).__name__,
+        "status": pool.status(),
+    }
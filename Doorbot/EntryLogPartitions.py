@@ -0,0 +1,271 @@
+"""Monthly partitions of the entry_log table in Postgres
+
+entry_log is partitioned by range on entry_time, one partition per calendar
+month (UTC), named entry_log_YYYY_MM. Anything that doesn't fit a monthly
+partition lands in entry_log_default, so a missed run never loses a scan.
+
+maintain() creates partitions for this month and the next few, and moves any
+rows that landed in the default partition into their month. Months already
+covered by some other partition are skipped. Right after the migration in
+sql/changes_pg.sql, entry_log_legacy covers everything up to next month.
+
+Months older than the retention period are detached, written to a gzipped
+CSV in the archive directory, and dropped. Run it from cron with
+manage_entry_log_partitions.py.
+"""
+import gzip
+import os
+import pathlib
+import re
+import Doorbot.Config
+from datetime import datetime, timezone
+from sqlalchemy import text
+
+
+DEFAULT_MONTHS_AHEAD = 3
+DEFAULT_RETENTION_MONTHS = 24
+DEFAULT_ARCHIVE_DIR = "entry_log_archive"
+
+PARENT_TABLE = "entry_log"
+DEFAULT_PARTITION = "entry_log_default"
+MATCH_PARTITION = re.compile( r'^entry_log_(\d{4})_(\d{2})$' )
+MATCH_RANGE_BOUND = re.compile( r'^FOR VALUES FROM \((.+)\) TO \((.+)\)$' )
+
+
+def month_start( when ):
+    """First moment of the month, in UTC"""
+    when = when.astimezone( timezone.utc )
+    return datetime( when.year, when.month, 1, tzinfo = timezone.utc )
+
+def add_months( month, count ):
+    index = month.year * 12 + ( month.month - 1 ) + count
+    return datetime( index // 12, index % 12 + 1, 1, tzinfo = timezone.utc )
+
+def partition_name( month ):
+    return PARENT_TABLE + "_" + month.strftime( "%Y_%m" )
+
+def partition_month( name ):
+    """Month a partition covers, or None if it's not a monthly partition"""
+    match = MATCH_PARTITION.match( name )
+    if not match:
+        return None
+    year, month = int( match.group( 1 ) ), int( match.group( 2 ) )
+    if not 1 <= month <= 12:
+        return None
+    return datetime( year, month, 1, tzinfo = timezone.utc )
+
+def months_to_create(
+    now,
+    months_ahead: int,
+):
+    """Months that should have a partition, from this one onward"""
+    start = month_start( now )
+    return [ add_months( start, i ) for i in range( months_ahead + 1 ) ]
+
+def parse_bound_value( value ):
+    """A partition bound from pg_get_expr(), or None for MINVALUE/MAXVALUE"""
+    if value in ( "MINVALUE", "MAXVALUE" ):
+        return None
+    value = value.strip( "'" )
+    # Postgres writes a UTC offset as "+00", which Python wants as "+00:00"
+    if re.search( r'[+-]\d{2}$', value ):
+        value += ":00"
+    return datetime.fromisoformat( value ).astimezone( timezone.utc )
+
+def parse_range_bound( expr ):
+    """Start and end of a range partition, from pg_get_expr()
+
+    Returns None for the default partition. An open start or end is None.
+    """
+    match = MATCH_RANGE_BOUND.match( expr )
+    if not match:
+        return None
+    return (
+        parse_bound_value( match.group( 1 ) ),
+        parse_bound_value( match.group( 2 ) ),
+    )
+
+def is_month_covered( month, bounds ):
+    """True if any of the ( start, end ) bounds overlaps the month"""
+    end = add_months( month, 1 )
+    for bound_start, bound_end in bounds:
+        if ( bound_start is None or bound_start < end ) \
+            and ( bound_end is None or bound_end > month ):
+            return True
+    return False
+
+def partitions_to_archive(
+    names,
+    now,
+    retention_months: int,
+):
+    """Names of monthly partitions that ended before the retention period
+
+    A retention of zero or less keeps everything.
+    """
+    if not retention_months or retention_months <= 0:
+        return []
+    cutoff = add_months( month_start( now ), -retention_months )
+
+    expired = []
+    for name in names:
+        month = partition_month( name )
+        if month is not None and add_months( month, 1 ) <= cutoff:
+            expired.append( name )
+    return sorted( expired )
+
+
+def existing_partitions( conn ):
+    """Names of the partitions attached to entry_log, mapped to their bounds
+
+    Bounds are as parse_range_bound() returns them.
+    """
+    stmt = text( """
+        SELECT child.relname,
+            pg_get_expr( child.relpartbound, child.oid )
+        FROM pg_inherits
+        JOIN pg_class parent ON pg_inherits.inhparent = parent.oid
+        JOIN pg_class child ON pg_inherits.inhrelid = child.oid
+        JOIN pg_namespace ON parent.relnamespace = pg_namespace.oid
+        WHERE parent.relname = :parent
+            AND pg_namespace.nspname = current_schema()
+    """ )
+    return {
+        name: parse_range_bound( bound )
+        for name, bound in conn.execute( stmt, {
+            "parent": PARENT_TABLE,
+        })
+    }
+
+def monthly_tables( conn ):
+    """All tables named like a monthly partition, attached or not
+
+    A table that was detached, but not archived because the archive failed, 
+    shows up here so the next run can finish the job.
+    """
+    stmt = text( """
+        SELECT tablename
+        FROM pg_tables
+        WHERE schemaname = current_schema()
+            AND tablename LIKE :pattern
+    """ )
+    names = [ row[0] for row in conn.execute( stmt, {
+        "pattern": PARENT_TABLE + "\\_%",
+    }) ]
+    return [ name for name in names if partition_month( name ) is not None ]
+
+def create_partition( conn, month ):
+    """Create the partition for a month
+
+    If scans for that month already went into the default partition, they're
+    moved into the new one. Postgres won't attach a partition while the
+    default still holds rows that belong to it, so the default is locked
+    against new scans until the transaction ends. The entry log writer waits
+    for the lock, then writes into the new partition.
+    """
+    name = partition_name( month )
+    params = {
+        "start": month,
+        "end": add_months( month, 1 ),
+    }
+
+    conn.execute( text(
+        "LOCK TABLE " + DEFAULT_PARTITION + " IN SHARE ROW EXCLUSIVE MODE"
+    ) )
+    conn.execute( text(
+        "CREATE TABLE " + name + " ( LIKE " + PARENT_TABLE
+        + " INCLUDING DEFAULTS INCLUDING CONSTRAINTS )"
+    ) )
+    conn.execute( text(
+        "WITH moved AS ( DELETE FROM " + DEFAULT_PARTITION
+        + " WHERE entry_time >= :start AND entry_time < :end RETURNING * )"
+        + " INSERT INTO " + name + " SELECT * FROM moved"
+    ), params )
+    # Bounds can't be bind parameters, so format them as literals
+    conn.execute( text(
+        "ALTER TABLE " + PARENT_TABLE + " ATTACH PARTITION " + name
+        + " FOR VALUES FROM ('" + params[ 'start' ].isoformat() + "')"
+        + " TO ('" + params[ 'end' ].isoformat() + "')"
+    ) )
+
+def archive_partition( engine, name, archive_dir ):
+    """Detach a partition, save it as gzipped CSV, and drop it
+
+    Returns the path to the archive. The table is only dropped once the
+    archive is completely written.
+    """
+    archive_dir = pathlib.Path( archive_dir )
+    archive_dir.mkdir( parents = True, exist_ok = True )
+    archive_path = archive_dir / ( name + ".csv.gz" )
+    tmp_path = archive_dir / ( name + ".csv.gz.tmp" )
+
+    with engine.begin() as conn:
+        if name in existing_partitions( conn ):
+            conn.execute( text(
+                "ALTER TABLE " + PARENT_TABLE + " DETACH PARTITION " + name
+            ) )
+
+    # COPY isn't exposed by SQLAlchemy, so use the psycopg2 connection
+    raw_conn = engine.raw_connection()
+    try:
+        with gzip.open( tmp_path, 'wb' ) as out:
+            cursor = raw_conn.cursor()
+            cursor.copy_expert(
+                "COPY " + name + " TO STDOUT WITH CSV HEADER",
+                out,
+            )
+            cursor.close()
+        os.replace( tmp_path, archive_path )
+
+        cursor = raw_conn.cursor()
+        cursor.execute( "DROP TABLE " + name )
+        cursor.close()
+        raw_conn.commit()
+    finally:
+        raw_conn.close()
+
+    return archive_path
+
+def maintain(
+    engine,
+    now = None,
+    dry_run: bool = False,
+):
+    """Create upcoming partitions and archive expired ones
+
+    Returns a dict listing the partitions created and archived.
+    """
+    conf = Doorbot.Config.get( 'entry_log', {} )
+    months_ahead = conf.get( 'partition_months_ahead', DEFAULT_MONTHS_AHEAD )
+    retention = conf.get( 'retention_months', DEFAULT_RETENTION_MONTHS )
+    archive_dir = conf.get( 'archive_dir', DEFAULT_ARCHIVE_DIR )
+    if now is None:
+        now = datetime.now( timezone.utc )
+
+    with engine.connect() as conn:
+        existing = existing_partitions( conn )
+        tables = monthly_tables( conn )
+    bounds = [ bound for bound in existing.values() if bound is not None ]
+
+    created = []
+    for month in months_to_create( now, months_ahead ):
+        name = partition_name( month )
+        if name in existing:
+            continue
+        # Attaching a partition that overlaps another one would fail
+        if is_month_covered( month, bounds ):
+            continue
+        if not dry_run:
+            with engine.begin() as conn:
+                create_partition( conn, month )
+        created.append( name )
+
+    archived = partitions_to_archive( tables, now, retention )
+    if not dry_run:
+        for name in archived:
+            archive_partition( engine, name, archive_dir )
+
+    return {
+        "created": created,
+        "archived": archived,
+    }
@@ -0,0 +1,200 @@
+"""Write-behind queue for the entry log
+
+Logging a scan shouldn't make the doorbot wait on a database commit. Entries
+are put on a queue and answered right away, and a background thread writes
+them out in batches. A batch is written when it reaches entry_log.batch_size
+rows, or when the oldest entry in it has waited entry_log.flush_seconds,
+whichever comes first.
+
+Each batch also bumps the scan rollups (see Doorbot.ScanRollups) and last 
+seen times (see Doorbot.LastSeen) in the same transaction.
+
+Anything still queued is written out when the process exits. Under uwsgi,
+this needs --enable-threads, or the background thread never gets to run.
+"""
+import atexit
+import queue
+import sys
+import threading
+import time
+import Doorbot.Config
+import Doorbot.LastSeen
+import Doorbot.ScanRollups
+from Doorbot.BackgroundWorker import BackgroundWorker
+from Doorbot.BackgroundWorker import ProcessSingleton
+from Doorbot.SQLAlchemy import EntryLog
+from Doorbot.SQLAlchemy import get_engine
+from datetime import datetime, timezone
+from sqlalchemy import insert
+
+
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_FLUSH_SECONDS = 2
+DEFAULT_MAX_PENDING = 10000
+
+
+class EntryLogWriter( BackgroundWorker ):
+    """Batches up EntryLog rows and writes them from a background thread"""
+    thread_name = "entry-log-writer"
+
+    def __init__(
+        self,
+        batch_size: int = DEFAULT_BATCH_SIZE,
+        flush_seconds: float = DEFAULT_FLUSH_SECONDS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.batch_size = batch_size
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+
+        super().__init__()
+        # Rows from a batch that failed to write. They go out with the next
+        # batch.
+        self._failed = []
+
+    def add(
+        self,
+        rfid: str,
+        location_id: int,
+        is_active_tag: bool,
+        is_found_tag: bool,
+        entry_time: datetime = None,
+    ):
+        """Queue up an entry to be written"""
+        if entry_time is None:
+            entry_time = datetime.now( timezone.utc )
+
+        self._queue.put({
+            "rfid": rfid,
+            "location": location_id,
+            "is_active_tag": is_active_tag,
+            "is_found_tag": is_found_tag,
+            "entry_time": entry_time,
+        })
+        self._ensure_running()
+
+    def stop( self ):
+        """Write out anything left and stop the background thread"""
+        super().stop()
+        self._write_batch( self._drain() )
+
+    def _run_now(
+        self,
+        batch: list,
+    ):
+        self._write_batch( batch )
+
+    def _run( self ):
+        while True:
+            # Wait as long as it takes for the first entry of a batch
+            item = self._queue.get()
+            batch = []
+            waiting = []
+            is_stopping = False
+            deadline = time.monotonic() + self.flush_seconds
+
+            # Then give it flush_seconds to fill up
+            while True:
+                if item is None:
+                    is_stopping = True
+                    break
+                elif isinstance( item, threading.Event ):
+                    waiting.append( item )
+                    break
+                else:
+                    batch.append( item )
+                    if len( batch ) >= self.batch_size:
+                        break
+
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get( timeout = remaining )
+                except queue.Empty:
+                    break
+
+            self._write_batch( batch )
+            for event in waiting:
+                event.set()
+
+            if is_stopping:
+                return
+
+    def _write_batch(
+        self,
+        batch: list,
+    ):
+        rows = self._failed + batch
+        self._failed = []
+        if not rows:
+            return
+
+        try:
+            with get_engine().begin() as conn:
+                # Sent as a multi-row INSERT where the driver supports it
+                conn.execute( insert( EntryLog ), rows )
+                Doorbot.ScanRollups.add_to_rollups( conn, rows )
+                Doorbot.LastSeen.update_last_seen( conn, rows )
+        except Exception as err:
+            print( f"Could not write {len( rows )} entry log rows: {err}",
+                file = sys.stderr )
+
+            # Hang on to them for the next try, but don't let a dead
+            # database eat all our memory
+            if len( rows ) > self.max_pending:
+                dropped = len( rows ) - self.max_pending
+                print( f"Dropping {dropped} oldest entry log rows",
+                    file = sys.stderr )
+                rows = rows[ dropped: ]
+            self._failed = rows
+
+
+def _make_writer():
+    conf = Doorbot.Config.get( 'entry_log', {} )
+    return EntryLogWriter(
+        batch_size = conf.get( 'batch_size', DEFAULT_BATCH_SIZE ),
+        flush_seconds = conf.get( 'flush_seconds', DEFAULT_FLUSH_SECONDS ),
+        max_pending = conf.get( 'max_pending', DEFAULT_MAX_PENDING ),
+    )
+
+__WRITER = ProcessSingleton( _make_writer )
+
+
+def get_writer():
+    """Get the process-wide writer, creating it from the config if needed"""
+    return __WRITER.get()
+
+def log_entry(
+    rfid: str,
+    location_id: int,
+    is_active_tag: bool,
+    is_found_tag: bool,
+):
+    """Queue up an entry log row to be written in the background"""
+    get_writer().add(
+        rfid = rfid,
+        location_id = location_id,
+        is_active_tag = is_active_tag,
+        is_found_tag = is_found_tag,
+    )
+
+def flush():
+    """Block until all queued entries have been written"""
+    writer = __WRITER.peek()
+    if writer is not None:
+        writer.flush()
+
+def shutdown():
+    """Write out everything queued and stop the background thread"""
+    writer = __WRITER.peek()
+    if writer is not None:
+        writer.stop()
+
+
+atexit.register( shutdown )
+try:
+    import uwsgi
+    uwsgi.atexit = shutdown
+except ImportError:
+    pass
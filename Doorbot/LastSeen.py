@@ -0,0 +1,124 @@
+"""When each tag and each location was last scanned
+
+Finding a member's last scan would otherwise mean searching the entry log
+backwards for their tag. Every batch the entry log writer saves also updates
+member_last_seen and location_last_scan, in the same transaction, so "last
+seen" is a lookup by primary key, and "not seen in six months" is a range
+scan on an index.
+
+Updates only ever move the time forward, so batches can be written in any
+order, and backfill() can safely run while scans are being logged.
+"""
+import calendar
+from datetime import datetime, timezone
+from Doorbot.SQLAlchemy import EntryLog
+from Doorbot.SQLAlchemy import LocationLastScan
+from Doorbot.SQLAlchemy import MemberLastSeen
+from Doorbot.SQLAlchemy import to_utc
+from Doorbot.SQLAlchemy import upsert_in_key_order
+from Doorbot.SQLAlchemy import upsert_insert
+from sqlalchemy import select
+
+
+BACKFILL_BATCH_SIZE = 10000
+
+
+def latest_rows( rows ):
+    """Pick out the newest entry log row for each tag and each location
+
+    Rows are dicts with the same keys as EntryLog columns. Returns a tuple
+    of two lists of dicts, ready to upsert into member_last_seen and
+    location_last_scan.
+    """
+    by_member = {}
+    by_location = {}
+
+    for row in rows:
+        entry_time = to_utc( row[ 'entry_time' ] )
+
+        seen = by_member.get( row[ 'rfid' ] )
+        if seen is None or seen[ 'last_seen' ] < entry_time:
+            by_member[ row[ 'rfid' ] ] = {
+                "rfid": row[ 'rfid' ],
+                "last_seen": entry_time,
+                "location": row[ 'location' ],
+                "is_active_tag": row[ 'is_active_tag' ],
+            }
+
+        if row[ 'location' ] is None:
+            continue
+        scan = by_location.get( row[ 'location' ] )
+        if scan is None or scan[ 'last_scan' ] < entry_time:
+            by_location[ row[ 'location' ] ] = {
+                "location": row[ 'location' ],
+                "last_scan": entry_time,
+                "rfid": row[ 'rfid' ],
+                "is_active_tag": row[ 'is_active_tag' ],
+            }
+
+    return list( by_member.values() ), list( by_location.values() )
+
+def _upsert_newer( conn, model, key_column, time_column, values ):
+    if not values:
+        return
+
+    stmt = upsert_insert( conn, model )
+    table = model.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements = [ key_column ],
+        set_ = {
+            column.name: stmt.excluded[ column.name ]
+            for column in table.columns
+            if column.name != key_column
+        },
+        # An older batch never overwrites a newer scan
+        where = table.c[ time_column ] < stmt.excluded[ time_column ],
+    )
+    upsert_in_key_order( conn, stmt, values, [ key_column ] )
+
+def update_last_seen(
+    conn,
+    rows: list,
+):
+    """Move last seen times forward for newly logged entry log rows"""
+    by_member, by_location = latest_rows( rows )
+    _upsert_newer( conn, MemberLastSeen, "rfid", "last_seen", by_member )
+    _upsert_newer( conn, LocationLastScan, "location", "last_scan",
+        by_location )
+
+def backfill( engine ):
+    """Fill in last seen times from the whole entry log
+
+    Returns the number of entry log rows read.
+    """
+    stmt = select(
+        EntryLog.rfid,
+        EntryLog.location,
+        EntryLog.entry_time,
+        EntryLog.is_active_tag,
+    )
+
+    total = 0
+    with engine.begin() as conn:
+        result = conn.execution_options(
+            stream_results = True,
+            yield_per = BACKFILL_BATCH_SIZE,
+        ).execute( stmt )
+        for rows in result.mappings().partitions():
+            update_last_seen( conn, rows )
+            total += len( rows )
+
+    return total
+
+def inactive_cutoff(
+    months: int,
+    now: datetime = None,
+):
+    """The time that's the given number of calendar months before now"""
+    if now is None:
+        now = datetime.now( timezone.utc )
+    year, month = divmod( now.year * 12 + now.month - 1 - months, 12 )
+    month += 1
+    # The 31st of a shorter month is its last day
+    day = min( now.day, calendar.monthrange( year, month )[1] )
+    return now.replace( year = year, month = month, day = day )
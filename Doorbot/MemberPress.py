@@ -0,0 +1,128 @@
+"""Fetch members from the MemberPress API
+
+The members list comes back a page at a time, and the API doesn't say how
+many pages there are. Pages are fetched several at once, over one HTTP
+session so connections are kept alive, in rounds of memberpress.workers
+pages. A page that comes back short means it was the last one.
+
+Requests that fail with a connection error, or a 429 or 5xx status, are tried
+again up to memberpress.retries times, waiting longer each time.
+"""
+import concurrent.futures
+import requests
+import Doorbot.Config
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+
+MEMBERS_PATH = '/wp-json/mp/v1/members'
+
+DEFAULT_PER_PAGE = 100
+DEFAULT_WORKERS = 4
+DEFAULT_RETRIES = 3
+DEFAULT_BACKOFF_SECONDS = 1
+DEFAULT_TIMEOUT_SECONDS = 30
+RETRY_STATUSES = ( 429, 500, 502, 503, 504 )
+
+
+class MemberPressClient:
+    """Fetches pages of members over a shared session"""
+
+    def __init__(
+        self,
+        base_url: str,
+        user: str,
+        passwd: str,
+        per_page: int = DEFAULT_PER_PAGE,
+        workers: int = DEFAULT_WORKERS,
+        retries: int = DEFAULT_RETRIES,
+        backoff_seconds: float = DEFAULT_BACKOFF_SECONDS,
+        timeout_seconds: float = DEFAULT_TIMEOUT_SECONDS,
+        session = None,
+    ):
+        self.members_url = base_url + MEMBERS_PATH
+        self.per_page = per_page
+        self.workers = workers
+        self.timeout_seconds = timeout_seconds
+
+        if session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(
+                # One kept-alive connection per worker
+                pool_connections = 1,
+                pool_maxsize = workers,
+                max_retries = Retry(
+                    total = retries,
+                    backoff_factor = backoff_seconds,
+                    status_forcelist = RETRY_STATUSES,
+                    allowed_methods = [ "GET" ],
+                    raise_on_status = False,
+                ),
+            )
+            session.mount( "http://", adapter )
+            session.mount( "https://", adapter )
+        session.auth = ( user, passwd )
+        self.session = session
+
+    def fetch_page(
+        self,
+        page: int,
+    ):
+        """Fetch one page of members. Raises for an error status."""
+        response = self.session.get(
+            self.members_url,
+            params = {
+                "page": page,
+                "per_page": self.per_page,
+            },
+            timeout = self.timeout_seconds,
+        )
+        response.raise_for_status()
+        return response.json()
+
+    def fetch_all_members(
+        self,
+        on_page = None,
+    ):
+        """Fetch every member, in page order
+
+        on_page, if given, is called with each page number as it arrives.
+        """
+        all_members = []
+        next_page = 1
+
+        with concurrent.futures.ThreadPoolExecutor(
+            max_workers = self.workers,
+        ) as executor:
+            while True:
+                pages = range( next_page, next_page + self.workers )
+                futures = [ executor.submit( self.fetch_page, page )
+                    for page in pages ]
+                next_page += self.workers
+
+                for page, future in zip( pages, futures ):
+                    members = future.result()
+                    if on_page is not None:
+                        on_page( page )
+                    all_members.extend( members )
+
+                    # A short page is the last one. Anything after it in
+                    # this round came back empty.
+                    if len( members ) != self.per_page:
+                        return all_members
+
+def client_from_config():
+    """Make a client from the memberpress config"""
+    conf = Doorbot.Config.get( 'memberpress' )
+    return MemberPressClient(
+        base_url = conf[ 'base_url' ],
+        user = conf[ 'user' ],
+        passwd = conf[ 'passwd' ],
+        per_page = conf.get( 'per_page', DEFAULT_PER_PAGE ),
+        workers = conf.get( 'workers', DEFAULT_WORKERS ),
+        retries = conf.get( 'retries', DEFAULT_RETRIES ),
+        backoff_seconds = conf.get( 'backoff_seconds',
+            DEFAULT_BACKOFF_SECONDS ),
+        timeout_seconds = conf.get( 'timeout_seconds',
+            DEFAULT_TIMEOUT_SECONDS ),
+    )
@@ -0,0 +1,112 @@
+"""Remember what MemberPress members looked like on the last sync
+
+The snapshot is a JSON file of members keyed by MMS ID. Each entry has the
+member as build_cache2.py reformats them, and a hash of that. Comparing the
+hashes against a fresh fetch picks out the members that were added, changed,
+or removed since the last run, so only those need to be checked against the
+database.
+
+Members are hashed after reformatting, not as MemberPress sends them. Fields
+we don't look at (like the last login time) then can't make a member look
+changed.
+
+The MemberPress API can't be asked for only the members changed since some
+time, so every page is still fetched. What's saved is the work done with
+them, and the size of what's reported.
+"""
+import hashlib
+import json
+import os
+
+
+SNAPSHOT_VERSION = 1
+
+
+def member_hash(
+    member: dict,
+):
+    """Hash of a member's fields, the same no matter their order"""
+    encoded = json.dumps( member, sort_keys = True, separators = ( ',', ':' ) )
+    return hashlib.sha256( encoded.encode( 'utf-8' ) ).hexdigest()
+
+def build_snapshot(
+    members,
+):
+    """Make a snapshot from a list of reformatted members"""
+    return {
+        str( member[ 'mms_id' ] ): {
+            'hash': member_hash( member ),
+            'member': member,
+        }
+        for member in members
+    }
+
+def load_snapshot(
+    path: str,
+):
+    """Read a snapshot, or None if there isn't one yet
+
+    A snapshot written by a different version of this module is ignored,
+    so the next run compares against nothing and sees every member as added.
+    """
+    try:
+        with open( path, 'r' ) as f:
+            data = json.load( f )
+    except FileNotFoundError:
+        return None
+
+    if data.get( 'version' ) != SNAPSHOT_VERSION:
+        return None
+    return data[ 'members' ]
+
+def save_snapshot(
+    path: str,
+    snapshot: dict,
+):
+    """Write a snapshot, replacing the old one all at once
+
+    Written to a temp file first, so a run that dies part way through leaves
+    the old snapshot alone.
+    """
+    tmp_path = path + '.tmp'
+    with open( tmp_path, 'w' ) as f:
+        json.dump({
+            'version': SNAPSHOT_VERSION,
+            'members': snapshot,
+        }, f )
+    os.replace( tmp_path, path )
+
+def diff(
+    old_snapshot: dict,
+    new_snapshot: dict,
+):
+    """Members added, changed, and removed between two snapshots
+
+    Returns a dict of lists. "added" and "removed" hold members; "changed"
+    holds dicts of the "previous" and "current" member. An old_snapshot of
+    None counts as empty.
+    """
+    if old_snapshot is None:
+        old_snapshot = {}
+
+    added = []
+    changed = []
+    for mms_id, entry in new_snapshot.items():
+        old_entry = old_snapshot.get( mms_id )
+        if old_entry is None:
+            added.append( entry[ 'member' ] )
+        elif old_entry[ 'hash' ] != entry[ 'hash' ]:
+            changed.append({
+                'previous': old_entry[ 'member' ],
+                'current': entry[ 'member' ],
+            })
+
+    removed = [ entry[ 'member' ]
+        for mms_id, entry in old_snapshot.items()
+        if mms_id not in new_snapshot ]
+
+    return {
+        'added': added,
+        'changed': changed,
+        'removed': removed,
+    }
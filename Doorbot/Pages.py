@@ -7,10 +7,12 @@ from Doorbot.SQLAlchemy import Member
 from Doorbot.SQLAlchemy import Permission
 from Doorbot.SQLAlchemy import Role
 from Doorbot.SQLAlchemy import get_engine
-from Doorbot.SQLAlchemy import get_session
+from Doorbot.SQLAlchemy import get_request_session
+from Doorbot.SQLAlchemy import to_utc
 from datetime import datetime, timedelta, timezone
 from flask_stache import render_template
 from sqlalchemy import select
+from sqlalchemy.orm import selectinload
 from sqlalchemy.sql import text
 from urllib.parse import urlparse
 import pathlib
@@ -107,12 +109,11 @@ def login():
     username = request.form[ 'username' ]
     password = request.form[ 'password' ]
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_username( username, session )
 
     response = flask.make_response()
     if not member:
-        session.close()
         return error_page(
             response,
             msgs = [ "Incorrect Login" ],
@@ -121,7 +122,6 @@ def login():
             status = 404,
         )
     elif not member.check_password( password, session ):
-        session.close()
         return error_page(
             response,
             msgs = [ "Incorrect Login" ],
@@ -130,7 +130,6 @@ def login():
             status = 404,
         )
     else:
-        session.close()
         flask.session[ 'username' ] = username
         return home_page()
 
@@ -159,7 +158,7 @@ def add_tag():
     rfid = request.form[ 'rfid' ]
     name = request.form[ 'name' ]
 
-    session = get_session()
+    session = get_request_session()
 
     errors = []
     if not Doorbot.API.MATCH_INT.match( rfid ):
@@ -174,7 +173,6 @@ def add_tag():
 
     response = flask.make_response()
     if errors:
-        session.close()
         return error_page(
             response,
             msgs = errors,
@@ -190,7 +188,6 @@ def add_tag():
         )
         session.add( member )
         session.commit()
-        session.close()
 
         return render_tmpl(
             'add_tag',
@@ -200,14 +197,16 @@ def add_tag():
         )
 
 def controller_list_main(**args): # List of Controller Groups and Controllers
-    session = get_session()
-    groups = session.query(Role)
+    session = get_request_session()
+    groups = session.query(Role).options(
+        selectinload( Role.permissions ),
+        selectinload( Role.members ),
+    )
     formatted_groups = list(map(lambda z: {
         "controller_group": z.name,
         "controllers": ', '.join(list(map(lambda x: x.name, z.permissions))),
         "user_count": len(z.members) if len(z.members) != 0 else None,
     }, groups ))
-    session.close()
 
     username = flask.session.get( 'username' )
     return render_tmpl(
@@ -229,7 +228,7 @@ def controller_list():
 def controller_group_add():
     add_controller_group = flask.request.form[ 'add_controller_group' ]
 
-    session = get_session()
+    session = get_request_session()
 
     errors = []
     if not Doorbot.API.MATCH_NAME.match( add_controller_group ):
@@ -243,7 +242,6 @@ def controller_group_add():
                 'New Controller Group "' + add_controller_group + '" already exists')
 
     if errors:
-        session.close()
         return controller_list_main(
             has_errors = True,
             errors = errors,
@@ -252,7 +250,6 @@ def controller_group_add():
     else:
         session.add( Role(name = add_controller_group) )
         session.commit()
-        session.close()
         return controller_list_main(
             has_errors = True,
             errors = [ 'New Controller Group "' + add_controller_group + '" added' ],
@@ -264,11 +261,10 @@ def controller_group_add():
 def controller_group_delete():
     del_controller_group = flask.request.form[ 'del_controller_group' ]
 
-    session = get_session()
+    session = get_request_session()
 
     ddg = session.query(Role).filter_by(name=del_controller_group).one_or_none()
     if ddg is None:
-        session.close()
         return controller_list_main(
             has_errors = True,
             errors = [ 'Cannot delete "' + del_controller_group + '", not found' ],
@@ -277,7 +273,6 @@ def controller_group_delete():
     else:
         session.delete(ddg)
         session.commit()
-        session.close()
         return controller_list_main(
             has_errors = True,
             errors = [ 'Controller Group "' + del_controller_group + '" deleted' ],
@@ -293,13 +288,12 @@ def edit_controllers_main(**args): # List of Controllers with add & delete actio
     else:
         controller_group = flask.request.args.get( 'controller_group' )
 
-    session = get_session()
+    session = get_request_session()
     controllers = session.query(Permission).join(
         Role, Permission.roles).where((Role.name==controller_group))
     formatted_controllers = list(map(lambda z: {
         "controller_name": z.name
     }, controllers ))
-    session.close()
 
     return render_tmpl(
         'edit_controllers',
@@ -323,7 +317,7 @@ def controller_add():
     add_controller = request.form[ 'add_controller' ]
     controller_group = request.form[ 'controller_group' ]
 
-    session = get_session()
+    session = get_request_session()
     controller_group_obj = session.query(Role).filter_by(name=controller_group).one_or_none()
 
     errors = []
@@ -339,7 +333,6 @@ def controller_add():
             errors.append('New Controller "' + add_controller + '" already exists')
 
     if errors:
-        session.close()
         return edit_controllers_main(
             has_errors = True,
             errors = errors,
@@ -351,7 +344,6 @@ def controller_add():
         controller_group_obj.permissions.append( controller_obj )
         session.add_all([ controller_group_obj, controller_obj ])
         session.commit()
-        session.close()
         return edit_controllers_main(
             has_errors = True,
             errors = [ 'New Controller "' + add_controller + '" added' ],
@@ -366,7 +358,7 @@ def controller_delete():
     del_controller = request.form[ 'del_controller' ]
     controller_group = request.form[ 'controller_group' ]
 
-    session = get_session()
+    session = get_request_session()
     controller_group_obj = session.query(Role).filter_by(name=controller_group).one_or_none()
 
     errors = []
@@ -376,7 +368,6 @@ def controller_delete():
     if dev is None:
         errors.append('Cannot delete "' + del_controller + '", not found')
     if errors:
-        session.close()
         return edit_controllers_main(
             has_errors = True,
             errors = errors,
@@ -386,7 +377,6 @@ def controller_delete():
     else:
         session.delete(dev)
         session.commit()
-        session.close()
         return edit_controllers_main(
             has_errors = True,
             errors = [ 'Controller "' + del_controller + '" deleted' ],
@@ -403,7 +393,7 @@ def edit_group_users_main(**args): # List of Controller Group Users with add & d
     else:
         controller_group = flask.request.args.get( 'controller_group' )
 
-    session = get_session()
+    session = get_request_session()
     users = session.query(Role).filter_by(name=controller_group).one_or_none().members
     formatted_users = list(map(lambda z: {
         "group_user_name": z.full_name
@@ -431,7 +421,7 @@ def group_users_add():
     add_group_user = request.form[ 'add_group_user' ]
     controller_group = request.form[ 'controller_group' ]
 
-    session = get_session()
+    session = get_request_session()
     controller_group_obj = session.query(Role).filter_by(name=controller_group).one_or_none()
 
     errors = []
@@ -450,7 +440,6 @@ def group_users_add():
             '" already exists in "' + controller_group + ' "')
 
     if errors:
-        session.close()
         return edit_group_users_main(
             has_errors = True,
             errors = errors,
@@ -461,7 +450,6 @@ def group_users_add():
         group_users_obj.roles.append( controller_group_obj )
         session.add_all([ controller_group_obj, group_users_obj ])
         session.commit()
-        session.close()
         return edit_group_users_main(
             has_errors = True,
             errors = [ 'New User "' + add_group_user + '" added' ],
@@ -476,7 +464,7 @@ def group_users_delete():
     del_group_user = request.form[ 'del_group_user' ]
     controller_group = request.form[ 'controller_group' ]
 
-    session = get_session()
+    session = get_request_session()
     controller_group_obj = session.query(Role).filter_by(name=controller_group).one_or_none()
 
     errors = []
@@ -486,7 +474,6 @@ def group_users_delete():
     if usr is None:
         errors.append('Cannot delete "' + del_group_user + '", not found')
     if errors:
-        session.close()
         return edit_group_users_main(
             has_errors = True,
             errors = errors,
@@ -497,7 +484,6 @@ def group_users_delete():
         usr.roles.remove( controller_group_obj )
         session.add_all([ usr, controller_group_obj ])
         session.commit()
-        session.close()
         return edit_group_users_main(
             has_errors = True,
             errors = [ 'User "' + del_group_user + '" deleted' ],
@@ -510,12 +496,16 @@ def group_users_delete():
 def search_scan_logs():
     args = flask.request.args
     rfid = args.get( 'search_rfid' )
+    name = args.get( 'search_name' )
     offset = args.get( 'offset' )
     limit = args.get( 'limit' )
+    cursor = args.get( 'cursor' )
 
     # Normalize the data
     rfid = "" if rfid is None else rfid
     rfid = rfid.strip()
+    name = "" if name is None else name
+    name = name.strip()
 
     offset = int( offset ) if offset else 0
     limit = int( limit ) if limit else 0
@@ -528,11 +518,32 @@ def search_scan_logs():
     elif limit > 100:
         limit = 100
 
-    logs = Doorbot.API.search_scan_logs( rfid, offset, limit )
-
     tz_name = Doorbot.Config.get( 'timezone' )
     local_tz = pytz.timezone( tz_name )
 
+    errors = []
+    logs = []
+    next_cursor = None
+    try:
+        # Times typed into the form are in local time
+        filters = Doorbot.API.parse_entry_log_filters( args, local_tz )
+    except ValueError as e:
+        errors.append( str( e ) )
+
+    if not errors:
+        try:
+            logs = Doorbot.API.search_scan_logs( rfid, offset, limit, cursor,
+                name = name,
+                **filters
+            )
+        except ValueError:
+            # Bad cursor, so start over from the first page
+            logs = Doorbot.API.search_scan_logs( rfid, 0, limit,
+                name = name,
+                **filters
+            )
+        next_cursor = Doorbot.API.next_entry_cursor( logs, limit )
+
     def convert_entry( tag ):
         dt = tag.entry_time
         # Convert to local time
@@ -549,16 +560,25 @@ def search_scan_logs():
 
     logs = list ( map( convert_entry, logs ) )
 
-    next_offset = offset + limit
-
+    granted = args.get( 'granted', '' )
     username = flask.session.get( 'username' )
     return render_tmpl(
         'search_scan_logs',
         page_name = "Search Scan Logs",
         tags = logs,
         username = username,
+        has_errors = True if errors else False,
+        errors = errors,
         search_rfid = rfid,
-        next_offset = next_offset,
+        search_name = name,
+        location = args.get( 'location', '' ),
+        since = args.get( 'since', '' ),
+        until = args.get( 'until', '' ),
+        granted = granted,
+        granted_yes = granted == "1",
+        granted_no = granted == "0",
+        unknown = args.get( 'unknown', '' ),
+        next_cursor = next_cursor,
         limit = limit,
     )
 
@@ -590,16 +610,34 @@ def view_tag_list():
 
     next_offset = offset + limit
 
-    members = Doorbot.API.search_tag_list( name, rfid, offset, limit )
-    formatted_members = list( map(
-        lambda member: {
+    errors = []
+    inactive = args.get( 'inactive_months', '' )
+    try:
+        inactive_months = Doorbot.API.parse_inactive_months( inactive )
+    except ValueError as e:
+        errors.append( str( e ) )
+        inactive_months = None
+
+    tz_name = Doorbot.Config.get( 'timezone' )
+    local_tz = pytz.timezone( tz_name )
+
+    def convert_member( member ):
+        last_seen = member.last_seen
+        if last_seen is not None:
+            last_seen = to_utc( last_seen ) \
+                .astimezone( tz = local_tz ) \
+                .strftime( "%Y-%m-%d %H:%M" )
+        return {
             "full_name": member.full_name,
             "tag": member.rfid,
             "is_active": member.active,
             "mms_id": member.mms_id if member.mms_id else "",
-        },
-        members,
-    ))
+            "last_seen": last_seen if last_seen else "Never",
+        }
+
+    members = Doorbot.API.search_tag_list( name, rfid, offset, limit,
+        inactive_months )
+    formatted_members = list( map( convert_member, members ) )
 
     username = flask.session.get( 'username' )
     return render_tmpl(
@@ -607,10 +645,15 @@ def view_tag_list():
         page_name = "Search Tag List",
         tags = formatted_members,
         username = username,
+        has_errors = True if errors else False,
+        errors = errors,
         next_offset = next_offset,
         limit = limit,
         search_name = name,
         search_rfid = rfid,
+        inactive_months = inactive_months if inactive_months else "",
+        inactive_6 = inactive_months == 6,
+        inactive_12 = inactive_months == 12,
     )
 
 @app.route( "/edit-tag", methods = [ "GET" ] )
@@ -653,11 +696,10 @@ def edit_tag_submit():
             username = username,
         )
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( current_tag, session )
 
     if not member:
-        session.close()
         return error_page(
             response,
             tmpl = 'edit_tag',
@@ -670,7 +712,6 @@ def edit_tag_submit():
     member.rfid = new_tag
     session.add( member )
     session.commit()
-    session.close()
 
     return render_tmpl(
         'edit_tag',
@@ -721,11 +762,10 @@ def edit_name_submit():
             username = username,
         )
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( current_tag, session )
 
     if not member:
-        session.close()
         return error_page(
             response,
             tmpl = 'edit_name',
@@ -738,7 +778,6 @@ def edit_name_submit():
     member.full_name = new_name
     session.add( member )
     session.commit()
-    session.close()
 
     return render_tmpl(
         'edit_name',
@@ -774,11 +813,10 @@ def activate_tag_submit():
             username = username,
         )
 
-    session = get_session()
+    session = get_request_session()
     member = Member.get_by_tag( tag, session )
 
     if not member:
-        session.close()
         return error_page(
             response,
             tmpl = 'activate_tag',
@@ -795,7 +833,6 @@ def activate_tag_submit():
     action = "Activated tag" if activate else "Deactivated tag"
     action = action + " " + tag + " for " + member.full_name
 
-    session.close()
     return render_tmpl(
         'activate_tag',
         page_name = page_name,
@@ -842,7 +879,7 @@ def create_oauth():
     request = flask.request
     name = request.form[ 'name' ]
 
-    session = get_session()
+    session = get_request_session()
 
     errors = []
     if not Doorbot.API.MATCH_NAME.match( name ):
@@ -850,7 +887,6 @@ def create_oauth():
 
     response = flask.make_response()
     if errors:
-        session.close()
         return error_page(
             response,
             msgs = errors,
@@ -876,7 +912,6 @@ def create_oauth():
 
         session.add( token )
         session.commit()
-        session.close()
 
         return render_tmpl(
             'create_oauth_submit',
@@ -0,0 +1,121 @@
+"""Bounded worker pool for password hashing
+
+bcrypt is slow on purpose. A burst of logins, or doorbots sending Basic auth,
+could otherwise tie up every request thread in a uwsgi worker hashing
+passwords, and leave none free to answer tag checks. Hashing and checking
+passwords go through a small pool of threads instead:
+
+* At most password_pool.max_workers hashes run at once
+* At most password_pool.max_queued more wait for a free worker
+* A hash that can't start within password_pool.queue_seconds is given up
+
+When the pool is full, or a hash waited too long, PasswordPoolBusy is raised.
+The API turns it into a 503, so the client can try again later.
+
+The limits are per process, not for the whole server: each uwsgi worker has
+its own pool, and N workers can hash N * max_workers passwords at once. The
+pool only does anything when uwsgi runs several request threads per worker
+(see --threads in run_app.sh). With one thread per worker, requests already
+wait their turn, and the pool never fills. Keep max_workers + max_queued
+below the thread count, so some threads are always left for tag checks.
+
+Threads don't survive a fork, so a worker makes its own pool the first time
+it needs one.
+"""
+import concurrent.futures
+import os
+import threading
+import Doorbot.Config
+from Doorbot.BackgroundWorker import ProcessSingleton
+
+
+DEFAULT_MAX_WORKERS = 2
+DEFAULT_MAX_QUEUED = 4
+DEFAULT_QUEUE_SECONDS = 2
+
+
+class PasswordPoolBusy( Exception ):
+    """Too many passwords are already being hashed"""
+    pass
+
+
+class PasswordPool:
+    """Runs password hashing on a fixed number of threads"""
+
+    def __init__(
+        self,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        max_queued: int = DEFAULT_MAX_QUEUED,
+        queue_seconds: float = DEFAULT_QUEUE_SECONDS,
+    ):
+        self.max_workers = max_workers
+        self.max_queued = max_queued
+        self.queue_seconds = queue_seconds
+
+        # Held from when a job is accepted until it's finished
+        self._slots = threading.BoundedSemaphore( max_workers + max_queued )
+        self._executor = None
+        self._pid = None
+        self._start_lock = threading.Lock()
+
+    def run( self, func, *args ):
+        """Call func( *args ) on the pool, and wait for the result
+
+        Raises PasswordPoolBusy if the pool is full, or the call couldn't
+        start within queue_seconds. Exceptions from func are raised as is.
+        """
+        if not self._slots.acquire( blocking = False ):
+            raise PasswordPoolBusy( "Too many password checks in progress" )
+
+        started = threading.Event()
+
+        def job():
+            started.set()
+            return func( *args )
+
+        try:
+            future = self._get_executor().submit( job )
+            if not started.wait( self.queue_seconds ) and future.cancel():
+                raise PasswordPoolBusy( "Timed out waiting to check password" )
+            # Once it's started, there's no stopping it, so see it through
+            return future.result()
+        finally:
+            self._slots.release()
+
+    def shutdown( self ):
+        if self._executor is not None:
+            self._executor.shutdown( wait = True )
+        self._executor = None
+
+    def _get_executor( self ):
+        if self._executor is not None and self._pid == os.getpid():
+            return self._executor
+
+        with self._start_lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._pid = os.getpid()
+                self._executor = concurrent.futures.ThreadPoolExecutor(
+                    max_workers = self.max_workers,
+                    thread_name_prefix = "password-pool",
+                )
+        return self._executor
+
+
+def _make_pool():
+    conf = Doorbot.Config.get( 'password_pool', {} )
+    return PasswordPool(
+        max_workers = conf.get( 'max_workers', DEFAULT_MAX_WORKERS ),
+        max_queued = conf.get( 'max_queued', DEFAULT_MAX_QUEUED ),
+        queue_seconds = conf.get( 'queue_seconds', DEFAULT_QUEUE_SECONDS ),
+    )
+
+__POOL = ProcessSingleton( _make_pool )
+
+
+def get_pool():
+    """Get the process-wide pool, creating it from the config if needed"""
+    return __POOL.get()
+
+def run( func, *args ):
+    """Call func( *args ) on the process-wide pool"""
+    return get_pool().run( func, *args )
@@ -0,0 +1,220 @@
+"""Background queue for upgrading password hashes
+
+When a member logs in with a password stored some older way (plaintext,
+Apache MD5, or bcrypt at a lower difficulty than password_storage asks for),
+it gets re-encoded. Doing that in the login request would make it hash twice
+and write to the database before answering. Instead, the upgrade is queued,
+and a background thread does it.
+
+Only one upgrade per member is queued at a time. The new hash is only saved
+if the member's stored hash hasn't changed since the login, so a password
+change that lands in between always wins. An upgrade that fails (the
+database is down, or the password pool is busy) is tried again after
+password_rehash.retry_seconds, up to password_rehash.max_retries times. One
+that still fails is dropped; the member's next login queues it again.
+
+Queued upgrades hold the plaintext password in memory until they're done.
+Anything still queued when the process exits is dropped, not written.
+"""
+import queue
+import sys
+import threading
+import time
+import Doorbot.Config
+from Doorbot.BackgroundWorker import BackgroundWorker
+from Doorbot.BackgroundWorker import ProcessSingleton
+from Doorbot.SQLAlchemy import Member
+from Doorbot.SQLAlchemy import get_engine
+from Doorbot.SQLAlchemy import on_engine_change
+from sqlalchemy import update
+
+
+DEFAULT_MAX_RETRIES = 3
+DEFAULT_RETRY_SECONDS = 5
+DEFAULT_MAX_PENDING = 1000
+
+
+class PasswordRehasher( BackgroundWorker ):
+    """Re-encodes passwords from a background thread"""
+    thread_name = "password-rehash"
+
+    def __init__(
+        self,
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_seconds: float = DEFAULT_RETRY_SECONDS,
+        max_pending: int = DEFAULT_MAX_PENDING,
+    ):
+        self.max_retries = max_retries
+        self.retry_seconds = retry_seconds
+        self.max_pending = max_pending
+
+        super().__init__()
+        self._lock = threading.Lock()
+        # Member ID to the upgrade queued for them
+        self._pending = {}
+        # Upgrades waiting to be tried again, as ( monotonic time, member ID )
+        self._retries = []
+
+    def submit(
+        self,
+        member_id: int,
+        encoded_password: str,
+        password_plaintext: str,
+        config: dict,
+    ):
+        """Queue up re-encoding a member's password
+
+        encoded_password is what's stored for them now. Returns False if an
+        upgrade for them is already queued, or the queue is full.
+        """
+        with self._lock:
+            if member_id in self._pending:
+                return False
+            if len( self._pending ) >= self.max_pending:
+                return False
+            self._pending[ member_id ] = {
+                "member_id": member_id,
+                "encoded_password": encoded_password,
+                "password_plaintext": password_plaintext,
+                "config": config,
+                "attempts": 0,
+            }
+
+        self._queue.put( member_id )
+        self._ensure_running()
+        return True
+
+    def stop( self ):
+        """Stop the background thread, dropping anything still queued"""
+        super().stop()
+        self.discard()
+
+    def discard( self ):
+        """Drop all queued upgrades"""
+        with self._lock:
+            self._pending.clear()
+            self._retries.clear()
+
+    def _run_now(
+        self,
+        member_ids: list,
+    ):
+        for member_id in member_ids:
+            self._rehash( member_id )
+
+    def _next_retry_wait( self ):
+        with self._lock:
+            if not self._retries:
+                return None
+            return max( 0, self._retries[0][0] - time.monotonic() )
+
+    def _queue_due_retries( self ):
+        now = time.monotonic()
+        with self._lock:
+            while self._retries and self._retries[0][0] <= now:
+                _, member_id = self._retries.pop( 0 )
+                self._queue.put( member_id )
+
+    def _run( self ):
+        while True:
+            try:
+                item = self._queue.get( timeout = self._next_retry_wait() )
+            except queue.Empty:
+                self._queue_due_retries()
+                continue
+
+            if item is None:
+                return
+            elif isinstance( item, threading.Event ):
+                item.set()
+            else:
+                self._rehash( item )
+            self._queue_due_retries()
+
+    def _rehash(
+        self,
+        member_id: int,
+    ):
+        with self._lock:
+            job = self._pending.get( member_id )
+        if job is None:
+            return
+
+        try:
+            # Not added to a session; it's only here to do the encoding
+            encoder = Member()
+            encoder.set_password( job[ 'password_plaintext' ], job[ 'config' ] )
+
+            # Only if the password is still the one they logged in with
+            stmt = update( Member ).where(
+                Member.id == member_id,
+                Member.encoded_password == job[ 'encoded_password' ],
+            ).values(
+                password_type = encoder.password_type,
+                encoded_password = encoder.encoded_password,
+            )
+            with get_engine().begin() as conn:
+                conn.execute( stmt )
+        except Exception as err:
+            job[ 'attempts' ] += 1
+            if job[ 'attempts' ] <= self.max_retries:
+                retry_at = time.monotonic() \
+                    + self.retry_seconds * job[ 'attempts' ]
+                with self._lock:
+                    self._retries.append(( retry_at, member_id ))
+                    self._retries.sort()
+                return
+
+            print( f"Could not re-encode password for member {member_id}:"
+                + f" {err}", file = sys.stderr )
+
+        with self._lock:
+            # Might have been discarded and queued again while this ran
+            if self._pending.get( member_id ) is job:
+                del self._pending[ member_id ]
+
+
+def _make_rehasher():
+    conf = Doorbot.Config.get( 'password_rehash', {} )
+    return PasswordRehasher(
+        max_retries = conf.get( 'max_retries', DEFAULT_MAX_RETRIES ),
+        retry_seconds = conf.get( 'retry_seconds', DEFAULT_RETRY_SECONDS ),
+        max_pending = conf.get( 'max_pending', DEFAULT_MAX_PENDING ),
+    )
+
+__REHASHER = ProcessSingleton( _make_rehasher )
+
+
+def get_rehasher():
+    """Get the process-wide rehasher, creating it from the config if needed"""
+    return __REHASHER.get()
+
+def submit(
+    member_id: int,
+    encoded_password: str,
+    password_plaintext: str,
+    config: dict,
+):
+    """Queue up re-encoding a member's password in the background"""
+    return get_rehasher().submit(
+        member_id,
+        encoded_password,
+        password_plaintext,
+        config,
+    )
+
+def flush():
+    """Block until all queued upgrades have been tried once"""
+    rehasher = __REHASHER.peek()
+    if rehasher is not None:
+        rehasher.flush()
+
+def discard():
+    """Drop all queued upgrades"""
+    rehasher = __REHASHER.peek()
+    if rehasher is not None:
+        rehasher.discard()
+
+
+# Queued member IDs belong to the old database
+on_engine_change( discard )
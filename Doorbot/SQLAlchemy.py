@@ -1,19 +1,34 @@
+import atexit
 import base64
 import bcrypt
+import contextlib
+import flask
 import hashlib
+import os
 import re
-import subprocess
+import tempfile
 import urllib
+from datetime import timezone
+import Doorbot.ApacheMD5
+import Doorbot.BcryptCalibration
 import Doorbot.Config
+import Doorbot.PasswordPool
+from Doorbot.DBPool import InstrumentedQueuePool
 from typing import List
 from typing import Optional
 from sqlalchemy import Column
+from sqlalchemy import Index
 from sqlalchemy import Table
 from sqlalchemy import ForeignKey
-from sqlalchemy import Boolean, Date, DateTime, String
+from sqlalchemy import BigInteger, Boolean, Date, DateTime, String
 from sqlalchemy import create_engine
+from sqlalchemy import event
 from sqlalchemy import select
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.sql import func
+from sqlalchemy.sql import text
+from sqlalchemy import inspect
 from sqlalchemy.orm import DeclarativeBase
 from sqlalchemy.orm import Mapped
 from sqlalchemy.orm import mapped_column
@@ -26,6 +41,9 @@ PASSWORD_TYPE_BCRYPT = "bcrypt"
 PASSWORD_TYPE_APACHE_MD5 = "apache_md5"
 
 __ENGINE = None
+__SQLITE_FILE = None
+__CHANGE_LISTENERS = []
+__ENGINE_LISTENERS = []
 
 def __connect_pg():
     pg_conf = Doorbot.Config.get( 'postgresql' )
@@ -43,16 +61,65 @@ def __connect_pg():
         "@" + host + ":" + str( port ) + \
         "/" + database
 
-    engine = create_engine( conn_str )
+    engine = create_engine(
+        conn_str,
+        poolclass = InstrumentedQueuePool,
+        pool_size = pg_conf.get( 'pool_size', 5 ),
+        max_overflow = pg_conf.get( 'max_overflow', 10 ),
+        pool_timeout = pg_conf.get( 'pool_timeout', 30 ),
+        pool_recycle = pg_conf.get( 'pool_recycle', -1 ),
+        pool_pre_ping = pg_conf.get( 'pool_pre_ping', False ),
+    )
     return engine
 
 def set_engine_sqlite():
-    """Set the engine to use SQLite instead of Pg"""
+    """Set the engine to use SQLite instead of Pg
 
-    global __ENGINE
-    __ENGINE = create_engine( "sqlite://" )
+    Each call starts with a fresh, empty database in a temporary file. 
+    Background threads, like the entry log writer, get their own 
+    connections to it, the same as they would on Pg. An in-memory database 
+    would force every thread to share one connection, where one thread's 
+    rollback can throw away another's transaction.
+    """
+
+    global __ENGINE, __SQLITE_FILE
+    _remove_sqlite_file()
+
+    fd, __SQLITE_FILE = tempfile.mkstemp(
+        prefix = "doorbot-",
+        suffix = ".sqlite",
+    )
+    os.close( fd )
+    __ENGINE = create_engine(
+        "sqlite:///" + __SQLITE_FILE,
+        connect_args = {
+            "check_same_thread": False,
+            "timeout": 30,
+        },
+    )
     Base.metadata.create_all( __ENGINE )
 
+    # Anything cached from the old database is meaningless now
+    for models, callback in __CHANGE_LISTENERS:
+        callback()
+    for callback in __ENGINE_LISTENERS:
+        callback()
+
+def _remove_sqlite_file():
+    global __SQLITE_FILE
+    if __SQLITE_FILE is None:
+        return
+
+    if __ENGINE is not None:
+        __ENGINE.dispose()
+    try:
+        os.unlink( __SQLITE_FILE )
+    except OSError:
+        pass
+    __SQLITE_FILE = None
+
+atexit.register( _remove_sqlite_file )
+
 def get_engine():
     """Get the SQLAlchemy engine"""
 
@@ -70,6 +137,131 @@ def get_session():
     session = Session( engine )
     return session
 
+def get_request_session():
+    """Get the session for the current Flask request
+
+    Everything in a request shares this one session, and so one database 
+    connection. It's closed when the request ends, so callers shouldn't 
+    close it themselves. Outside of a request, this is the same as 
+    get_session(), and the caller has to close it.
+    """
+    if not flask.has_app_context():
+        return get_session()
+
+    session = flask.g.get( 'db_session' )
+    if session is None:
+        session = get_session()
+        session.info[ 'is_request' ] = True
+        flask.g.db_session = session
+    return session
+
+@event.listens_for( Session, "after_begin" )
+def _set_request_statement_timeout( session, transaction, connection ):
+    # Only for web requests. Maintenance scripts share the engine, and their 
+    # long statements (archiving, backfills) must not be cut off.
+    if not session.info.get( 'is_request' ):
+        return
+    if 'postgresql' != connection.dialect.name:
+        return
+    pg_conf = Doorbot.Config.get( 'postgresql' )
+    statement_timeout_ms = pg_conf.get( 'statement_timeout_ms' )
+    if statement_timeout_ms:
+        connection.exec_driver_sql( "SET LOCAL statement_timeout = "
+            + str( int( statement_timeout_ms ) ) )
+
+def close_request_session():
+    """Close the session for the current Flask request, if there is one"""
+    session = flask.g.pop( 'db_session', None )
+    if session is not None:
+        session.close()
+
+@contextlib.contextmanager
+def request_or_own_session():
+    """Session to use for a quick lookup, as a context manager
+
+    Inside a request, this is the request's session, so the lookup doesn't 
+    take a second pooled connection. Outside of one, it's a new session 
+    that's closed afterwards.
+    """
+    if flask.has_app_context():
+        yield get_request_session()
+    else:
+        session = get_session()
+        try:
+            yield session
+        finally:
+            session.close()
+
+def on_committed_change(
+    models,
+    callback,
+):
+    """Call callback() after any commit that changed one of the given models
+
+    This lets in-process caches throw away their copy of the data when it's 
+    modified through the ORM, no matter which endpoint or script did it. The 
+    callback takes no arguments. It's also called when the engine is replaced.
+    """
+    __CHANGE_LISTENERS.append( ( tuple( models ), callback ) )
+
+def on_engine_change(
+    callback,
+):
+    """Call callback() when the engine is replaced with a different database"""
+    __ENGINE_LISTENERS.append( callback )
+
+@event.listens_for( Session, "after_flush" )
+def _collect_change_callbacks( session, flush_context ):
+    # The new/dirty/deleted lists still show the pre-flush state here
+    changed = list( session.new ) \
+        + list( session.dirty ) \
+        + list( session.deleted )
+    pending = session.info.setdefault( 'change_callbacks', [] )
+
+    for models, callback in __CHANGE_LISTENERS:
+        if callback in pending:
+            continue
+        if any( isinstance( obj, models ) for obj in changed ):
+            pending.append( callback )
+
+@event.listens_for( Session, "after_commit" )
+def _run_change_callbacks( session ):
+    pending = session.info.pop( 'change_callbacks', [] )
+    for callback in pending:
+        callback()
+
+@event.listens_for( Session, "after_rollback" )
+def _discard_change_callbacks( session ):
+    session.info.pop( 'change_callbacks', None )
+
+
+def upsert_insert( conn, model ):
+    """INSERT for the connection's dialect, with on_conflict_do_update()"""
+    dialect = conn.dialect.name
+    if 'postgresql' == dialect:
+        return pg_insert( model )
+    elif 'sqlite' == dialect:
+        return sqlite_insert( model )
+    raise ValueError( "Upserts are not supported for the "
+        + dialect + " dialect" )
+
+def upsert_in_key_order( conn, stmt, values, key_columns ):
+    """Run an upsert for many rows, sorted by their key columns
+
+    Rows are locked in key order, so two writers upserting overlapping keys 
+    wait on each other instead of deadlocking.
+    """
+    values = sorted( values,
+        key = lambda row: tuple( row[ column ] for column in key_columns ) )
+    conn.execute( stmt, values )
+
+def to_utc( when ):
+    """Make a time from the database timezone aware, in UTC"""
+    # SQLite hands back naive datetimes, which are stored as UTC
+    if when.tzinfo is None:
+        return when.replace( tzinfo = timezone.utc )
+    return when.astimezone( timezone.utc )
+
 
 class Base( DeclarativeBase ):
     pass
@@ -178,66 +370,80 @@ class Member( Base ):
         member = session.scalars( stmt ).one_or_none()
         return member
 
+    def _are_permissions_loaded( self ):
+        if 'roles' in inspect( self ).unloaded:
+            return False
+        for role in self.roles:
+            if 'permissions' in inspect( role ).unloaded:
+                return False
+        return True
+
     def has_permission( self, permission ):
         """Returns true if this member has access to the named permission"""
-
-        session = get_session()
-
         if isinstance( permission, Permission ):
             permission = permission.name
-            stmt = select( Permission ).where(
-                Permission.name == permission
+
+        if self._are_permissions_loaded():
+            return any(
+                permission == role_permission.name
+                for role in self.roles
+                for role_permission in role.permissions
             )
-            permission = session.scalars( stmt ).one()
-
-        result = session.query(
-                Permission.name
-            ).filter(
-                member_role_association.c.member_id == self.id
-            ).filter(
-                member_role_association.c.role_id == Role.id
-            ).filter(
-                role_permission_association.c.role_id == Role.id
-            ).filter(
-                role_permission_association.c.permission_id == Permission.id
-            ).filter(
-                Permission.name == permission
-            ).first()
-        session.close()
+
+        with request_or_own_session() as session:
+            result = session.query(
+                    Permission.name
+                ).filter(
+                    member_role_association.c.member_id == self.id
+                ).filter(
+                    member_role_association.c.role_id == Role.id
+                ).filter(
+                    role_permission_association.c.role_id == Role.id
+                ).filter(
+                    role_permission_association.c.permission_id == Permission.id
+                ).filter(
+                    Permission.name == permission
+                ).first()
 
         return result is not None
 
     def all_permissions( self ):
         """Fetch a list of all permissions for this member"""
-        session = get_session()
-
-        result = session.query(
-                Permission
-            ).filter(
-                member_role_association.c.member_id == self.id
-            ).filter(
-                member_role_association.c.role_id == Role.id
-            ).filter(
-                role_permission_association.c.role_id == Role.id
-            ).filter(
-                role_permission_association.c.permission_id == Permission.id
-            ).all()
-        session.close()
+        if self._are_permissions_loaded():
+            permissions = {}
+            for role in self.roles:
+                for permission in role.permissions:
+                    permissions[ permission.id ] = permission
+            return list( permissions.values() )
+
+        with request_or_own_session() as session:
+            result = session.query(
+                    Permission
+                ).filter(
+                    member_role_association.c.member_id == self.id
+                ).filter(
+                    member_role_association.c.role_id == Role.id
+                ).filter(
+                    role_permission_association.c.role_id == Role.id
+                ).filter(
+                    role_permission_association.c.permission_id == Permission.id
+                ).all()
 
         return result
 
     def all_roles( self ):
         """Fetch a list of all roles for this member"""
-        session = get_session()
-
-        result = session.query(
-                Role
-            ).filter(
-                member_role_association.c.member_id == self.id
-            ).filter(
-                member_role_association.c.role_id == Role.id
-            ).all()
-        session.close()
+        if 'roles' not in inspect( self ).unloaded:
+            return list( self.roles )
+
+        with request_or_own_session() as session:
+            result = session.query(
+                    Role
+                ).filter(
+                    member_role_association.c.member_id == self.id
+                ).filter(
+                    member_role_association.c.role_id == Role.id
+                ).all()
 
         return result
 
@@ -289,7 +495,8 @@ class Member( Base ):
                 hashlib.sha256( password_plaintext.encode( 'utf-8' ) ).digest()
             )
             # Need to decode utf-8 here to avoid a corrupt string
-            encoded = bcrypt.hashpw(
+            encoded = Doorbot.PasswordPool.run(
+                bcrypt.hashpw,
                 hashed_pass,
                 bcrypt.gensalt( options[ 'bcrypt' ][ 'difficulty' ] ),
             ).decode( 'utf-8' )
@@ -306,13 +513,16 @@ class Member( Base ):
 
         This will pull information out of the 'password_storage' config. It 
         compares the stored type in the database with the type in the config.
-        If they do not match, then the password will be automatically 
-        re-encoded to the type specified in the configuration.
+        If they do not match, then the password will be re-encoded to the 
+        type specified in the configuration. That happens in the background 
+        (see Doorbot.PasswordRehash), so this doesn't wait on it.
 
-        Needs a session, since it may change the database.
+        The session is left alone for a member that's already saved. Only a 
+        member that hasn't been saved yet is re-encoded right away, added to 
+        the session, and committed.
         """
         if self._password_does_match( password_plaintext ):
-            target_config = Doorbot.Config.get( 'password_storage' )
+            target_config = Doorbot.BcryptCalibration.storage_config()
             current_config = self._password_current_config()
 
             # Might be encrypted with an old way of doing things. Check the 
@@ -321,12 +531,22 @@ class Member( Base ):
                 current_config,
                 target_config,
             ):
-                self.set_password(
-                    password_plaintext,
-                    target_config,
-                )
-                session.add( self )
-                session.commit()
+                if self.id is not None:
+                    # Imported here, since it needs Member from this module
+                    from Doorbot import PasswordRehash
+                    PasswordRehash.submit(
+                        self.id,
+                        self.encoded_password,
+                        password_plaintext,
+                        target_config,
+                    )
+                else:
+                    self.set_password(
+                        password_plaintext,
+                        target_config,
+                    )
+                    session.add( self )
+                    session.commit()
 
             return True
 
@@ -360,7 +580,10 @@ class Member( Base ):
     ):
         if current_config[ "type" ] == target_config[ "type" ]:
             if PASSWORD_TYPE_BCRYPT == target_config[ "type" ]:
-                if current_config[ "bcrypt" ][ "difficulty" ] == target_config[ "bcrypt" ][ "difficulty" ]:
+                # A stronger hash than we ask for is fine. Otherwise, hosts 
+                # that calibrate to different difficulties would keep 
+                # re-encoding the same members back and forth.
+                if current_config[ "bcrypt" ][ "difficulty" ] >= target_config[ "bcrypt" ][ "difficulty" ]:
                     return True
                 else:
                     return False
@@ -392,7 +615,11 @@ class Member( Base ):
             hashed_pass = base64.b64encode(
                 hashlib.sha256( password_plaintext ).digest()
             )
-            return bcrypt.checkpw( hashed_pass, password_encoded )
+            return Doorbot.PasswordPool.run(
+                bcrypt.checkpw,
+                hashed_pass,
+                password_encoded,
+            )
         elif PASSWORD_TYPE_APACHE_MD5 == password_type:
             return self._password_does_match_apache_md5(
                 password_encoded, password_plaintext )
@@ -405,36 +632,10 @@ class Member( Base ):
         password_encoded,
         password_plaintext,
     ):
-        password_encoded = password_encoded.decode( 'utf-8' )
-        password_plaintext = password_plaintext.decode( 'utf-8' )
-
-
-        matched = re.match( r'^\$apr1\$([^\$]+)', password_encoded )
-        if matched:
-            salt = matched.group( 1 )
-        else:
-            # Doesn't seem to be a valid Apache MD5 password string, so fail
-            return False
-
-        # TODO This puts the password on the command line, where it could be 
-        # captured by 'ps aux' or some such. However, since this is a one 
-        # time thing for backwards compatibility, the threat is small.
-        cmd = [
-            "openssl",
-            "passwd",
-            "-apr1",
-            "-salt", salt,
+        return Doorbot.ApacheMD5.does_match(
+            password_encoded.decode( 'utf-8' ),
             password_plaintext,
-        ];
-        process = subprocess.run(
-            cmd,
-            stdout = subprocess.PIPE,
         )
-        expected_passwd = process.stdout.decode( 'utf-8' ).rstrip()
-
-        # TODO Constant time matching algorithm. Or don't; this is only 
-        # used to convert some old passwords.
-        return expected_passwd == password_encoded
 
 
 class Location( Base ):
@@ -458,6 +659,43 @@ class Location( Base ):
 class EntryLog( Base ):
     """A log of all scans"""
     __tablename__ = "entry_log"
+    __table_args__ = (
+        # Keyset pagination, newest first
+        Index(
+            "entry_log_entry_time_id_idx",
+            text( "entry_time DESC" ),
+            text( "id DESC" ),
+        ),
+        # Filters in search_scan_logs(), each keeping the same order so a 
+        # page can be read straight off the index
+        Index(
+            "entry_log_rfid_entry_time_id_idx",
+            "rfid",
+            text( "entry_time DESC" ),
+            text( "id DESC" ),
+        ),
+        Index(
+            "entry_log_location_entry_time_id_idx",
+            "location",
+            text( "entry_time DESC" ),
+            text( "id DESC" ),
+        ),
+        # Denied and unknown scans are a small part of the log
+        Index(
+            "entry_log_denied_entry_time_id_idx",
+            text( "entry_time DESC" ),
+            text( "id DESC" ),
+            postgresql_where = text( "NOT is_active_tag" ),
+            sqlite_where = text( "NOT is_active_tag" ),
+        ),
+        Index(
+            "entry_log_unknown_entry_time_id_idx",
+            text( "entry_time DESC" ),
+            text( "id DESC" ),
+            postgresql_where = text( "NOT is_found_tag" ),
+            sqlite_where = text( "NOT is_found_tag" ),
+        ),
+    )
 
     id: Mapped[ int ] = mapped_column( primary_key = True )
     rfid: Mapped[ str ] = mapped_column(
@@ -509,39 +747,40 @@ class Role( Base ):
     )
 
     def has_permission( self, permission ):
-        session = get_session()
-
         if isinstance( permission, Permission ):
             permission = permission.name
-            stmt = select( Permission ).where(
-                Permission.name == permission
-            )
-            permission = session.scalars( stmt ).one()
-
-        query = session.query( Permission ).join(
-                Role,
-                Permission.roles,
-            ).where(
-                (Permission.name == permission) &
-                (Role.id == self.id)
+
+        if 'permissions' not in inspect( self ).unloaded:
+            return any(
+                permission == role_permission.name
+                for role_permission in self.permissions
             )
-        result = query.first()
 
-        session.close()
+        with request_or_own_session() as session:
+            query = session.query( Permission ).join(
+                    Role,
+                    Permission.roles,
+                ).where(
+                    (Permission.name == permission) &
+                    (Role.id == self.id)
+                )
+            result = query.first()
+
         return result is not None
 
     def all_permissions( self ):
-        session = get_session()
+        if 'permissions' not in inspect( self ).unloaded:
+            return list( self.permissions )
+
+        with request_or_own_session() as session:
+            result = session.query(
+                    Permission
+                ).filter(
+                    role_permission_association.c.role_id == self.id
+                ).filter(
+                    role_permission_association.c.permission_id == Permission.id
+                ).all()
 
-        result = session.query(
-                Permission
-            ).filter(
-                role_permission_association.c.role_id == self.id
-            ).filter(
-                role_permission_association.c.permission_id == Permission.id
-            ).all()
-
-        session.close()
         return result
 
 class Permission( Base ):
@@ -564,24 +803,23 @@ class Permission( Base ):
         self,
         do_allow_inactive = False,
     ):
-        session = get_session()
+        with request_or_own_session() as session:
+            query = session.query(
+                    Member
+                ).filter(
+                    role_permission_association.c.permission_id == self.id
+                ).filter(
+                    role_permission_association.c.role_id == Role.id
+                ).filter(
+                    member_role_association.c.role_id == Role.id
+                ).filter(
+                    member_role_association.c.member_id == Member.id
+                )
+            if not do_allow_inactive:
+                query = query.filter( Member.active == True )
 
-        query = session.query(
-                Member
-            ).filter(
-                role_permission_association.c.permission_id == self.id
-            ).filter(
-                role_permission_association.c.role_id == Role.id
-            ).filter(
-                member_role_association.c.role_id == Role.id
-            ).filter(
-                member_role_association.c.member_id == Member.id
-            )
-        if not do_allow_inactive:
-            query = query.filter( Member.active == True )
+            result = query.all()
 
-        result = query.all()
-        session.close()
         return result
 
 class OauthToken( Base ):
@@ -608,3 +846,212 @@ class OauthToken( Base ):
     member: Mapped[ "Member" ] = relationship(
         back_populates = "tokens"
     )
+
+
+class LocationHourlyScans( Base ):
+    """Scans at each location, counted by the hour (UTC)
+
+    Kept up to date as scans are logged. See Doorbot.ScanRollups.
+    """
+    __tablename__ = "location_hourly_scans"
+    __table_args__ = (
+        Index( "location_hourly_scans_hour_idx", "hour" ),
+    )
+
+    location: Mapped[ int ] = mapped_column(
+        ForeignKey( "locations.id" ),
+        primary_key = True,
+    )
+    hour: Mapped[ str ] = mapped_column(
+        DateTime(),
+        primary_key = True,
+    )
+    granted: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+    denied: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+    unknown: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+
+class MemberDailyScans( Base ):
+    """Scans of each tag, counted by the day (UTC)
+
+    Keyed by RFID tag rather than member, like the entry log, so unknown 
+    tags are counted too. Kept up to date as scans are logged. See 
+    Doorbot.ScanRollups.
+    """
+    __tablename__ = "member_daily_scans"
+    __table_args__ = (
+        Index( "member_daily_scans_day_idx", "day" ),
+    )
+
+    rfid: Mapped[ str ] = mapped_column(
+        String(),
+        primary_key = True,
+    )
+    day: Mapped[ str ] = mapped_column(
+        Date(),
+        primary_key = True,
+    )
+    granted: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+    denied: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+    unknown: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+
+class MemberLastSeen( Base ):
+    """The last time each tag was scanned, and where
+
+    Keyed by RFID tag, like the entry log. Kept up to date as scans are 
+    logged. See Doorbot.LastSeen.
+    """
+    __tablename__ = "member_last_seen"
+    __table_args__ = (
+        Index( "member_last_seen_last_seen_idx", "last_seen" ),
+    )
+
+    rfid: Mapped[ str ] = mapped_column(
+        String(),
+        primary_key = True,
+    )
+    last_seen: Mapped[ str ] = mapped_column(
+        DateTime( timezone = True ),
+        nullable = False,
+    )
+    location: Mapped[ int ] = mapped_column(
+        ForeignKey( "locations.id" ),
+        nullable = True,
+    )
+    is_active_tag: Mapped[ bool ] = mapped_column(
+        Boolean(),
+        nullable = False,
+    )
+
+class LocationLastScan( Base ):
+    """The last scan at each location, and whose tag it was
+
+    Kept up to date as scans are logged. See Doorbot.LastSeen.
+    """
+    __tablename__ = "location_last_scan"
+
+    location: Mapped[ int ] = mapped_column(
+        ForeignKey( "locations.id" ),
+        primary_key = True,
+    )
+    last_scan: Mapped[ str ] = mapped_column(
+        DateTime( timezone = True ),
+        nullable = False,
+    )
+    rfid: Mapped[ str ] = mapped_column(
+        String(),
+        nullable = False,
+    )
+    is_active_tag: Mapped[ bool ] = mapped_column(
+        Boolean(),
+        nullable = False,
+    )
+
+class SingleRowCounter:
+    """A table with one row, whose version is bumped by triggers
+
+    Being in the database, the triggers also catch changes made outside the 
+    ORM, like Core updates, the sync scripts, or SQL run by hand. Caches can 
+    cheaply tell if anything changed since they last looked.
+    """
+    id: Mapped[ int ] = mapped_column( primary_key = True )
+    version: Mapped[ int ] = mapped_column(
+        BigInteger(),
+        nullable = False,
+        default = 0,
+    )
+
+    @classmethod
+    def get_current( cls, session ):
+        """Fetch the current version"""
+        stmt = select( cls.version ).where(
+            cls.id == 1
+        )
+        version = session.scalar( stmt )
+        return version if version is not None else 0
+
+class AclVersion( SingleRowCounter, Base ):
+    """Counts changes to who can access what
+
+    Bumped by every statement that changes roles, permissions, the links 
+    between them, or a member's tag, name, or active flag. Doorbots get it 
+    as the ETag of the tag dumps.
+    """
+    __tablename__ = "acl_version"
+
+class AuthVersion( SingleRowCounter, Base ):
+    """Counts changes to how members and API clients log in
+
+    Bumped by every statement that changes OAuth tokens, or a member's 
+    username, password, or active flag. The API's token and password caches 
+    check it, so they don't have to move the ACL version along.
+    """
+    __tablename__ = "auth_version"
+
+
+# Statements on each table that bump each counter
+VERSION_TRIGGERS = {
+    "acl_version": [
+        # Only the columns that go in the ACL snapshot
+        ( "members", [
+            "INSERT",
+            "UPDATE OF rfid, active, full_name",
+            "DELETE",
+        ] ),
+        ( "roles", [ "INSERT", "UPDATE", "DELETE" ] ),
+        ( "role_members", [ "INSERT", "UPDATE", "DELETE" ] ),
+        ( "permissions", [ "INSERT", "UPDATE", "DELETE" ] ),
+        ( "role_permissions", [ "INSERT", "UPDATE", "DELETE" ] ),
+    ],
+    "auth_version": [
+        ( "members", [
+            "UPDATE OF username, password_type, encoded_password, active",
+            "DELETE",
+        ] ),
+        ( "oauth_tokens", [ "INSERT", "UPDATE", "DELETE" ] ),
+    ],
+}
+
+@event.listens_for( Base.metadata, "after_create" )
+def _create_version_triggers( target, connection, **kw ):
+    # Pg gets its triggers from sql/pg.sql. SQLite, which the tests use, is 
+    # only ever set up through create_all().
+    if 'sqlite' != connection.dialect.name:
+        return
+
+    for counter, triggers in VERSION_TRIGGERS.items():
+        connection.execute( text(
+            "INSERT INTO " + counter + " (id, version) VALUES (1, 0)"
+        ) )
+        for table, actions in triggers:
+            for action in actions:
+                connection.execute( text(
+                    "CREATE TRIGGER " + table + "_"
+                    + action.split()[0].lower() + "_" + counter
+                    + " AFTER " + action + " ON " + table
+                    + " BEGIN UPDATE " + counter
+                    + " SET version = version + 1 WHERE id = 1; END"
+                ) )
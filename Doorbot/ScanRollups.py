@@ -0,0 +1,187 @@
+"""Scan counts rolled up by location and hour, and by tag and day
+
+Questions like "how busy is the woodshop on Tuesday nights" would otherwise
+mean adding up raw entry_log rows. Every batch the entry log writer saves
+also bumps the counts here, in the same transaction, so they always agree
+with the log.
+
+Each scan counts as exactly one of:
+
+* granted: the tag was let in (is_active_tag)
+* denied: the tag is known, but wasn't let in
+* unknown: the tag isn't in the database (not is_found_tag)
+
+Buckets are in UTC. backfill() rebuilds the counts from the entry log, for
+history logged before the rollups existed.
+"""
+from collections import defaultdict
+from datetime import datetime, timedelta, timezone
+from Doorbot.SQLAlchemy import EntryLog
+from Doorbot.SQLAlchemy import LocationHourlyScans
+from Doorbot.SQLAlchemy import MemberDailyScans
+from Doorbot.SQLAlchemy import to_utc
+from Doorbot.SQLAlchemy import upsert_in_key_order
+from Doorbot.SQLAlchemy import upsert_insert
+from sqlalchemy import delete
+from sqlalchemy import select
+
+
+BACKFILL_BATCH_SIZE = 10000
+COUNTS = ( "granted", "denied", "unknown" )
+
+
+def classify( is_active_tag, is_found_tag ):
+    """Which count a scan goes under"""
+    if is_active_tag:
+        return "granted"
+    elif is_found_tag:
+        return "denied"
+    return "unknown"
+
+def _as_utc( entry_time ):
+    # The rollup columns have no time zone, and hold UTC
+    return to_utc( entry_time ).replace( tzinfo = None )
+
+def hour_bucket( entry_time ):
+    return _as_utc( entry_time ).replace( minute = 0, second = 0,
+        microsecond = 0 )
+
+def day_bucket( entry_time ):
+    return _as_utc( entry_time ).date()
+
+def count_rows( rows ):
+    """Add up entry log rows into rollup counts
+
+    Rows are dicts with the same keys as EntryLog columns. Returns a tuple
+    of two dicts, for locations and members. Each maps its primary key to a
+    dict of counts.
+    """
+    by_location = defaultdict( lambda: dict.fromkeys( COUNTS, 0 ) )
+    by_member = defaultdict( lambda: dict.fromkeys( COUNTS, 0 ) )
+
+    for row in rows:
+        kind = classify( row[ 'is_active_tag' ], row[ 'is_found_tag' ] )
+        if row[ 'location' ] is not None:
+            key = ( row[ 'location' ], hour_bucket( row[ 'entry_time' ] ) )
+            by_location[ key ][ kind ] += 1
+        key = ( row[ 'rfid' ], day_bucket( row[ 'entry_time' ] ) )
+        by_member[ key ][ kind ] += 1
+
+    return by_location, by_member
+
+def _upsert( conn, model, key_columns, counts ):
+    if not counts:
+        return
+
+    values = []
+    for key, row_counts in counts.items():
+        row = dict( zip( key_columns, key ) )
+        row.update( row_counts )
+        values.append( row )
+
+    stmt = upsert_insert( conn, model )
+    table = model.__table__
+    stmt = stmt.on_conflict_do_update(
+        index_elements = key_columns,
+        set_ = {
+            count: table.c[ count ] + stmt.excluded[ count ]
+            for count in COUNTS
+        },
+    )
+    upsert_in_key_order( conn, stmt, values, key_columns )
+
+def add_to_rollups(
+    conn,
+    rows: list,
+):
+    """Bump the rollup counts for newly logged entry log rows"""
+    by_location, by_member = count_rows( rows )
+    _upsert( conn, LocationHourlyScans, [ "location", "hour" ], by_location )
+    _upsert( conn, MemberDailyScans, [ "rfid", "day" ], by_member )
+
+def backfill(
+    engine,
+    until: datetime = None,
+):
+    """Rebuild the rollups from the entry log
+
+    Only scans before until are counted, and rollups from until onward are
+    left alone. It's rounded down to the start of a UTC day, so no daily 
+    count is half rebuilt. It defaults to today, so scans logged while this 
+    runs are counted once, by the entry log writer. Returns the number of 
+    entry log rows counted.
+    """
+    if until is None:
+        until = datetime.now( timezone.utc )
+    until_naive = datetime.combine( day_bucket( until ),
+        datetime.min.time() )
+    until = until_naive.replace( tzinfo = timezone.utc )
+
+    stmt = select(
+        EntryLog.rfid,
+        EntryLog.location,
+        EntryLog.entry_time,
+        EntryLog.is_active_tag,
+        EntryLog.is_found_tag,
+    ).where(
+        EntryLog.entry_time < until
+    )
+
+    total = 0
+    with engine.begin() as conn:
+        conn.execute( delete( LocationHourlyScans ).where(
+            LocationHourlyScans.hour < until_naive
+        ) )
+        conn.execute( delete( MemberDailyScans ).where(
+            MemberDailyScans.day < until_naive.date()
+        ) )
+
+        result = conn.execution_options(
+            stream_results = True,
+            yield_per = BACKFILL_BATCH_SIZE,
+        ).execute( stmt )
+        for rows in result.mappings().partitions():
+            add_to_rollups( conn, rows )
+            total += len( rows )
+
+    return total
+
+def location_stats(
+    session,
+    since: datetime,
+    until: datetime,
+    location_id: int = None,
+):
+    """Hourly counts for locations, oldest first"""
+    stmt = select( LocationHourlyScans ).where(
+        LocationHourlyScans.hour >= hour_bucket( since ),
+        LocationHourlyScans.hour < _as_utc( until ),
+    )
+    if location_id is not None:
+        stmt = stmt.where( LocationHourlyScans.location == location_id )
+    stmt = stmt.order_by(
+        LocationHourlyScans.hour,
+        LocationHourlyScans.location,
+    )
+    return session.scalars( stmt ).all()
+
+def member_stats(
+    session,
+    since: datetime,
+    until: datetime,
+    rfid: str = None,
+):
+    """Daily counts for tags, oldest first"""
+    # Days that start before until
+    last_day = day_bucket( until - timedelta( microseconds = 1 ) )
+    stmt = select( MemberDailyScans ).where(
+        MemberDailyScans.day >= day_bucket( since ),
+        MemberDailyScans.day <= last_day,
+    )
+    if rfid is not None:
+        stmt = stmt.where( MemberDailyScans.rfid == rfid )
+    stmt = stmt.order_by(
+        MemberDailyScans.day,
+        MemberDailyScans.rfid,
+    )
+    return session.scalars( stmt ).all()
@@ -0,0 +1,66 @@
+"""Small thread-safe cache with a size limit and per-entry expiry"""
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Maps keys to values for at most ttl seconds
+
+    Once there are more than max_size entries, the least recently used one is
+    dropped. None can't be stored as a value, since get() uses it to mean the
+    key wasn't found.
+    """
+
+    def __init__(
+        self,
+        max_size: int,
+        ttl: float,
+    ):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get( self, key ):
+        """Fetch the value for key, or None if it's missing or expired"""
+        with self._lock:
+            item = self._data.get( key )
+            if item is None:
+                return None
+
+            value, expires = item
+            if time.monotonic() >= expires:
+                del self._data[ key ]
+                return None
+
+            self._data.move_to_end( key )
+            return value
+
+    def set(
+        self,
+        key,
+        value,
+        ttl: float = None,
+    ):
+        """Store a value. The ttl can be shortened for this entry."""
+        if ttl is None or ttl > self.ttl:
+            ttl = self.ttl
+        expires = time.monotonic() + ttl
+
+        with self._lock:
+            self._data[ key ] = ( value, expires )
+            self._data.move_to_end( key )
+            while len( self._data ) > self.max_size:
+                self._data.popitem( last = False )
+
+    def delete( self, key ):
+        with self._lock:
+            self._data.pop( key, None )
+
+    def clear( self ):
+        with self._lock:
+            self._data.clear()
+
+    def __len__( self ):
+        return len( self._data )
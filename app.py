@@ -1,12 +1,22 @@
 #!/usr/bin/python3
 import flask
 import psycopg2
+import Doorbot.BcryptCalibration
 import Doorbot.Config
 import Doorbot.Pages
 import Doorbot.SQLAlchemy
 from Doorbot.API import app
 from datetime import timedelta
 
+try:
+    # uwsgi uses SIGHUP to reload its workers, so leave it alone there. The 
+    # config file is still reloaded when it changes.
+    import uwsgi
+except ImportError:
+    Doorbot.Config.install_sighup_handler()
+
+# Done before uwsgi forks its workers, so they all use the same difficulty
+Doorbot.BcryptCalibration.calibrate_on_startup()
 
 session_conf = Doorbot.Config.get( 'session' )
 app.secret_key = session_conf[ 'key' ]
@@ -0,0 +1,37 @@
+#!/usr/bin/python3
+# Rebuild the scan rollup tables, and fill in last seen times, from the 
+# entry log. Run this once after adding the tables, or any time the counts 
+# look wrong:
+#
+#     python3 backfill_scan_rollups.py [--until 2024-06-01]
+#
+# Scans from the start of the --until day (default today, UTC) onward are 
+# left to the entry log writer, which keeps the rollups up to date. Last 
+# seen times always come from the whole log, since they only move forward.
+import argparse
+import Doorbot.Config
+import Doorbot.LastSeen
+import Doorbot.ScanRollups
+import Doorbot.SQLAlchemy
+from datetime import datetime, timezone
+
+
+parser = argparse.ArgumentParser(
+    description = "Rebuild scan rollups and last seen times from the entry log",
+)
+parser.add_argument( '--until',
+    help = "Only count scans before this UTC date (YYYY-MM-DD)",
+)
+args = parser.parse_args()
+
+until = None
+if args.until:
+    until = datetime.fromisoformat( args.until ) \
+        .replace( tzinfo = timezone.utc )
+
+engine = Doorbot.SQLAlchemy.get_engine()
+total = Doorbot.ScanRollups.backfill( engine, until )
+print( f"Counted {total} entry log rows" )
+
+total = Doorbot.LastSeen.backfill( engine )
+print( f"Read {total} entry log rows for last seen times" )
@@ -17,60 +17,36 @@ TODO/ISSUES:
   As a double-check, it could/should look for and report duplicate rfid db names
     and duplicate mms names that have recent_transactions.
   This has not been tested to see if it behaves well if no entries are found.
+INCREMENTAL:
+  With --changes, members are compared against the snapshot saved by the last
+    --changes run (memberpress.snapshot_file), and only those added, changed,
+    or removed in the MMS since then are checked against the database. The
+    output has "added", "changed", and "removed" lists, plus the usual
+    categories for just those members. Changes made only in the database
+    aren't noticed this way; the full report still covers those.
 """
-import requests
+import argparse
 import json
+import os
 import sys
 import Doorbot.Config
+import Doorbot.MemberPress
+import Doorbot.MemberSnapshot
 from Doorbot.SQLAlchemy import Member
 from Doorbot.SQLAlchemy import get_session
 from sqlalchemy import select
 
-conf = Doorbot.Config.get( 'memberpress' )
-user = conf[ 'user' ]
-passwd = conf[ 'passwd' ]
-base_url = conf[ 'base_url' ]
-
-members_url = base_url + '/wp-json/mp/v1/members'
-
-
-def fetch_member_mms_page(
-    page = 1,
-    per_page = 100,
-):
-    print('.', end='', file=sys.stderr, flush=True)
-    response = requests.get(
-        members_url + f'?page={page}&per_page={per_page}',
-        auth = (
-            user,
-            passwd,
-        ),
-    )
-    if 200 == response.status_code:
-        data = response.json()
-        return data
-
-def fetch_all_mms_members():
-    is_still_more = True
-    page = 1
-    per_page = 100
-    all_members = []
-
-    while is_still_more:
-        members = fetch_member_mms_page( page, per_page )
-
-        if len( members ) != per_page:
-            # If we didn't get as many members as expected, assume we've
-            # reached the end of the list. Unfortunately, the MemberPress
-            # API doesn't have any other way for us to know this.
-            is_still_more = False
+DB_BATCH_SIZE = 1000
+DEFAULT_SNAPSHOT_FILE = os.path.join( os.path.dirname(
+    os.path.realpath( __file__ ) ), 'cache_files', 'mms_snapshot.json' )
 
-        if len( members ) != 0:
-            all_members = all_members +  members
 
-        page += 1
-
-    return all_members
+def fetch_all_mms_members():
+    client = Doorbot.MemberPress.client_from_config()
+    return client.fetch_all_members(
+        on_page = lambda page: print( '.', end = '', file = sys.stderr,
+            flush = True ),
+    )
 
 def reformat_mms_members( members ):
     results = {}
@@ -101,24 +77,30 @@ def reformat_mms_members( members ):
 
     return results
 
-def fetch_members_db():
-    session = get_session()
-    stmt = select( Member )
-    members = session.scalars( stmt ).all()
+def fetch_members_db( names = None ):
+    # Only the columns we compare, streamed in batches rather than loading 
+    # every Member object at once. With names, only members by those names.
+    stmt = select(
+        Member.rfid,
+        Member.full_name,
+        Member.active,
+        Member.mms_id,
+    ).execution_options(
+        yield_per = DB_BATCH_SIZE,
+    )
+    if names is not None:
+        stmt = stmt.where( Member.full_name.in_( list( names ) ) )
 
+    session = get_session()
     results = {}
-    for member in members:
-        rfid = member.rfid
-        name = member.full_name
-        active = True if member.active else False
-        mms_id = member.mms_id if member.mms_id else ""
-
+    for rfid, name, active, mms_id in session.execute( stmt ):
         results[ name ] = {
             'display_name': name,
-            'mms_id': mms_id,
-            'active_tag': active,
+            'mms_id': mms_id if mms_id else "",
+            'active_tag': True if active else False,
             'rfid': rfid,
         }
+    session.close()
 
     return results
 
@@ -221,22 +203,84 @@ def handle_no_mms_id_in_db_members( members ):
     return list( no_mms_id_in_db_members )
 
 
+def format_members( db_members, mms_members ):
+    clear_members, wrong_name_members, wrong_rfid_name_members, \
+        wrong_active_members, no_mms_id_in_db_members = filter_members(
+            db_members, mms_members )
+
+    return {
+        'clear_members': handle_clear_members( clear_members ),
+        'wrong_name_members': handle_wrong_name_members( wrong_name_members ),
+        'wrong_rfid_name_members': handle_wrong_rfid_name_members( wrong_rfid_name_members ),
+        'wrong_active_members': handle_wrong_active_members( wrong_active_members ),
+        'no_mms_id_in_db_members': handle_no_mms_id_in_db_members( no_mms_id_in_db_members ),
+    }
+
+def format_changes( changes, mms_members ):
+    # Only members touched since the last snapshot are checked. That's their
+    # current names, and any names they've gone by before.
+    touched_mms = {}
+    for member in changes[ 'added' ]:
+        touched_mms[ member[ 'display_name' ] ] = member
+    for change in changes[ 'changed' ]:
+        touched_mms[ change[ 'current' ][ 'display_name' ] ] = change[ 'current' ]
+
+    touched_names = set( touched_mms.keys() )
+    for change in changes[ 'changed' ]:
+        touched_names.add( change[ 'previous' ][ 'display_name' ] )
+    for member in changes[ 'removed' ]:
+        touched_names.add( member[ 'display_name' ] )
+
+    db_members = fetch_members_db( touched_names )
+    formatted_members = format_members( db_members, touched_mms )
+
+    # An old name might still belong to someone else in the MMS who didn't
+    # change, so they aren't missing after all
+    formatted_members[ 'wrong_rfid_name_members' ] = [
+        _ for _ in formatted_members[ 'wrong_rfid_name_members' ]
+        if not _[ 'name_rfid' ] in mms_members
+    ]
+
+    formatted_members.update( changes )
+    return formatted_members
+
+
+parser = argparse.ArgumentParser(
+    description = "Compare MemberPress members against the database",
+)
+parser.add_argument( '--changes',
+    action = 'store_true',
+    help = "Only report members changed in the MMS since the last --changes run",
+)
+parser.add_argument( '--snapshot',
+    help = "Snapshot file for --changes (default from memberpress.snapshot_file)",
+)
+args = parser.parse_args()
+
 print('reading mms.', end='', file=sys.stderr, flush=True)
 members_raw = fetch_all_mms_members()
 print(' ', end='', file=sys.stderr, flush=True)
 members_list = reformat_mms_members( members_raw )
 
-db_members_list = fetch_members_db()
-
-clear_members, wrong_name_members, wrong_rfid_name_members, wrong_active_members, \
-    no_mms_id_in_db_members = filter_members( db_members_list, members_list )
-
-formatted_members = {
-    'clear_members': handle_clear_members( clear_members ),
-    'wrong_name_members': handle_wrong_name_members( wrong_name_members ),
-    'wrong_rfid_name_members': handle_wrong_rfid_name_members( wrong_rfid_name_members ),
-    'wrong_active_members': handle_wrong_active_members( wrong_active_members ),
-    'no_mms_id_in_db_members': handle_no_mms_id_in_db_members( no_mms_id_in_db_members ),
-}
-json.dump( formatted_members, sys.stdout )
+if args.changes:
+    snapshot_file = args.snapshot
+    if snapshot_file is None:
+        snapshot_file = Doorbot.Config.get( 'memberpress' ).get(
+            'snapshot_file', DEFAULT_SNAPSHOT_FILE )
+
+    old_snapshot = Doorbot.MemberSnapshot.load_snapshot( snapshot_file )
+    new_snapshot = Doorbot.MemberSnapshot.build_snapshot(
+        members_list.values() )
+    changes = Doorbot.MemberSnapshot.diff( old_snapshot, new_snapshot )
+
+    formatted_members = format_changes( changes, members_list )
+    json.dump( formatted_members, sys.stdout )
+    sys.stdout.flush()
+
+    # Only once the changes are out, so a failed run reports them again
+    Doorbot.MemberSnapshot.save_snapshot( snapshot_file, new_snapshot )
+else:
+    db_members_list = fetch_members_db()
+    formatted_members = format_members( db_members_list, members_list )
+    json.dump( formatted_members, sys.stdout )
 print('done.', file=sys.stderr, flush=True)
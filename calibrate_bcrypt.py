@@ -0,0 +1,31 @@
+#!/usr/bin/python3
+# Time bcrypt on this host, and show the highest difficulty that fits the 
+# budget in the bcrypt_calibration config:
+#
+#     python3 calibrate_bcrypt.py [--budget-ms 250]
+#
+# Put the result in password_storage.bcrypt.difficulty, or set 
+# bcrypt_calibration.on_startup to have the app do this when it starts.
+import argparse
+import Doorbot.BcryptCalibration
+import Doorbot.Config
+
+
+parser = argparse.ArgumentParser(
+    description = "Pick a bcrypt difficulty for this host",
+)
+parser.add_argument( '--budget-ms',
+    type = float,
+    help = "Longest a hash should take, in milliseconds",
+)
+args = parser.parse_args()
+
+if args.budget_ms is not None:
+    conf = dict( Doorbot.Config.get( 'bcrypt_calibration', {} ) )
+    conf[ 'budget_ms' ] = args.budget_ms
+    Doorbot.Config.set_override( 'bcrypt_calibration', conf )
+
+difficulty, timings = Doorbot.BcryptCalibration.calibrate_from_config()
+for tried, took in timings.items():
+    print( f"Difficulty {tried}: {took:.1f}ms" )
+print( f"Use difficulty {difficulty}" )
@@ -0,0 +1,33 @@
+#!/usr/bin/python3
+# Create upcoming monthly entry_log partitions, and archive expired ones. 
+# Run daily from cron:
+#
+#     python3 manage_entry_log_partitions.py
+#
+# Pass --dry-run to only print what would be done.
+import argparse
+import Doorbot.Config
+import Doorbot.EntryLogPartitions
+import Doorbot.SQLAlchemy
+
+
+parser = argparse.ArgumentParser(
+    description = "Maintain monthly entry_log partitions",
+)
+parser.add_argument( '--dry-run',
+    action = 'store_true',
+    help = "Print what would be done without changing anything",
+)
+args = parser.parse_args()
+
+engine = Doorbot.SQLAlchemy.get_engine()
+result = Doorbot.EntryLogPartitions.maintain(
+    engine,
+    dry_run = args.dry_run,
+)
+
+prefix = "Would have " if args.dry_run else ""
+for name in result[ 'created' ]:
+    print( prefix + "Created partition " + name )
+for name in result[ 'archived' ]:
+    print( prefix + "Archived partition " + name )
@@ -1,4 +1,6 @@
 #!/bin/bash
 uwsgi \
+    --enable-threads \
+    --threads 8 \
     --http-socket :5002 \
     --module app:app
@@ -1 +1,141 @@
 ALTER TABLE locations ADD hostname TEXT;
+
+CREATE TABLE acl_version (
+    id INT PRIMARY KEY NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO acl_version (id, version) VALUES (1, 0);
+
+CREATE TABLE auth_version (
+    id INT PRIMARY KEY NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO auth_version (id, version) VALUES (1, 0);
+
+-- Keyset pagination on the entry log sorts by both columns
+CREATE INDEX entry_log_entry_time_id_idx ON entry_log (entry_time DESC, id DESC);
+DROP INDEX IF EXISTS entry_log_entry_time_idx;
+
+-- Partition entry_log by month. The existing table becomes the partition for 
+-- everything before next month, so no rows are copied. It already holds 
+-- some of this month's scans, so it has to cover the whole month. Run 
+-- manage_entry_log_partitions.py afterwards to create the monthly partitions; 
+-- it skips months already covered, like this one.
+ALTER TABLE entry_log RENAME TO entry_log_legacy;
+ALTER INDEX entry_log_entry_time_id_idx RENAME TO entry_log_legacy_entry_time_id_idx;
+CREATE TABLE entry_log (
+    id              INT NOT NULL DEFAULT nextval( 'entry_log_id_seq' ),
+    rfid            TEXT NOT NULL,
+    entry_time      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
+    is_active_tag   BOOLEAN NOT NULL,
+    is_found_tag    BOOLEAN NOT NULL,
+    location        INT REFERENCES locations (id),
+    PRIMARY KEY (id, entry_time)
+) PARTITION BY RANGE (entry_time);
+ALTER SEQUENCE entry_log_id_seq OWNED BY entry_log.id;
+ALTER TABLE entry_log_legacy ALTER COLUMN id DROP DEFAULT;
+CREATE INDEX entry_log_entry_time_id_idx ON entry_log (entry_time DESC, id DESC);
+DO $$
+DECLARE
+    cutoff TIMESTAMP WITH TIME ZONE :=
+        date_trunc( 'month', NOW() AT TIME ZONE 'UTC' ) AT TIME ZONE 'UTC'
+        + INTERVAL '1 month';
+BEGIN
+    EXECUTE format(
+        'ALTER TABLE entry_log ATTACH PARTITION entry_log_legacy'
+        ' FOR VALUES FROM (MINVALUE) TO (%L)',
+        cutoff
+    );
+END $$;
+CREATE TABLE entry_log_default PARTITION OF entry_log DEFAULT;
+
+-- Indexes for filtering the entry log search
+CREATE INDEX entry_log_rfid_entry_time_id_idx
+    ON entry_log (rfid, entry_time DESC, id DESC);
+CREATE INDEX entry_log_location_entry_time_id_idx
+    ON entry_log (location, entry_time DESC, id DESC);
+CREATE INDEX entry_log_denied_entry_time_id_idx
+    ON entry_log (entry_time DESC, id DESC) WHERE NOT is_active_tag;
+CREATE INDEX entry_log_unknown_entry_time_id_idx
+    ON entry_log (entry_time DESC, id DESC) WHERE NOT is_found_tag;
+
+-- Scan counts, kept up to date by the entry log writer. Times are UTC. 
+-- backfill_scan_rollups.py rebuilds them from the entry log.
+CREATE TABLE location_hourly_scans (
+    location        INT NOT NULL REFERENCES locations (id),
+    hour            TIMESTAMP NOT NULL,
+    granted         BIGINT NOT NULL DEFAULT 0,
+    denied          BIGINT NOT NULL DEFAULT 0,
+    unknown         BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (location, hour)
+);
+CREATE INDEX ON location_hourly_scans (hour);
+
+CREATE TABLE member_daily_scans (
+    rfid            TEXT NOT NULL,
+    day             DATE NOT NULL,
+    granted         BIGINT NOT NULL DEFAULT 0,
+    denied          BIGINT NOT NULL DEFAULT 0,
+    unknown         BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (rfid, day)
+);
+CREATE INDEX ON member_daily_scans (day);
+
+-- Last scan of each tag, and at each location, kept up to date by the entry 
+-- log writer. backfill_scan_rollups.py fills them in from the entry log.
+CREATE TABLE member_last_seen (
+    rfid            TEXT PRIMARY KEY NOT NULL,
+    last_seen       TIMESTAMP WITH TIME ZONE NOT NULL,
+    location        INT REFERENCES locations (id),
+    is_active_tag   BOOLEAN NOT NULL
+);
+CREATE INDEX member_last_seen_last_seen_idx ON member_last_seen (last_seen);
+
+CREATE TABLE location_last_scan (
+    location        INT PRIMARY KEY NOT NULL REFERENCES locations (id),
+    last_scan       TIMESTAMP WITH TIME ZONE NOT NULL,
+    rfid            TEXT NOT NULL,
+    is_active_tag   BOOLEAN NOT NULL
+);
+
+-- Every statement that changes who can access what bumps the version, even 
+-- ones from outside the app. Members only count for the columns that go in 
+-- the ACL snapshot, so a new password or phone number doesn't.
+CREATE FUNCTION bump_acl_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE acl_version SET version = version + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER members_acl_version
+    AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF rfid, active, full_name
+    ON members
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER roles_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON roles
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER role_members_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON role_members
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER permissions_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON permissions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER role_permissions_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON role_permissions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+
+-- Same again for anything that changes how members and API clients log in
+CREATE FUNCTION bump_auth_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE auth_version SET version = version + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER members_auth_version
+    AFTER DELETE OR TRUNCATE
+        OR UPDATE OF username, password_type, encoded_password, active
+    ON members
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_auth_version();
+CREATE TRIGGER oauth_tokens_auth_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON oauth_tokens
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_auth_version();
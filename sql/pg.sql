@@ -31,17 +31,35 @@ INSERT INTO locations (name) VALUES
     ,( 'woodshop.door' )
     ,( 'dummy' );
 
+-- Partitioned by month. Partitions are named entry_log_YYYY_MM, and are 
+-- created ahead of time by manage_entry_log_partitions.py, which also 
+-- archives old ones. Scans outside of any monthly partition go in the 
+-- default one.
 CREATE TABLE entry_log (
-    id              SERIAL PRIMARY KEY NOT NULL,
+    id              SERIAL NOT NULL,
     -- This could be some random RFID tag, which we may not have in our 
     -- database.  So don't reference tags in bodgery_rfid directly.
     rfid            TEXT NOT NULL,
     entry_time      TIMESTAMP WITH TIME ZONE NOT NULL DEFAULT NOW(),
     is_active_tag   BOOLEAN NOT NULL,
     is_found_tag    BOOLEAN NOT NULL,
-    location        INT REFERENCES locations (id)
-);
-CREATE INDEX ON entry_log (entry_time DESC);
+    location        INT REFERENCES locations (id),
+    -- Unique keys on a partitioned table have to include the partition key
+    PRIMARY KEY (id, entry_time)
+) PARTITION BY RANGE (entry_time);
+CREATE INDEX ON entry_log (entry_time DESC, id DESC);
+-- For filtering the log search. Each keeps the same order as above, so a 
+-- page can be read straight off the index.
+CREATE INDEX entry_log_rfid_entry_time_id_idx
+    ON entry_log (rfid, entry_time DESC, id DESC);
+CREATE INDEX entry_log_location_entry_time_id_idx
+    ON entry_log (location, entry_time DESC, id DESC);
+-- Denied and unknown scans are a small part of the log
+CREATE INDEX entry_log_denied_entry_time_id_idx
+    ON entry_log (entry_time DESC, id DESC) WHERE NOT is_active_tag;
+CREATE INDEX entry_log_unknown_entry_time_id_idx
+    ON entry_log (entry_time DESC, id DESC) WHERE NOT is_found_tag;
+CREATE TABLE entry_log_default PARTITION OF entry_log DEFAULT;
 
 CREATE TABLE roles (
     id SERIAL PRIMARY KEY NOT NULL,
@@ -78,3 +96,99 @@ CREATE TABLE oauth_tokens (
     member_id INT NOT NULL REFERENCES members (id)
 );
 CREATE INDEX ON oauth_tokens (member_id);
+
+-- Goes up on every change to who can access what. Only ever has one row.
+CREATE TABLE acl_version (
+    id INT PRIMARY KEY NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO acl_version (id, version) VALUES (1, 0);
+
+-- Goes up on every change to OAuth tokens, or to members' usernames, 
+-- passwords, or active flags. Only ever has one row.
+CREATE TABLE auth_version (
+    id INT PRIMARY KEY NOT NULL,
+    version BIGINT NOT NULL DEFAULT 0
+);
+INSERT INTO auth_version (id, version) VALUES (1, 0);
+
+-- Every statement that changes who can access what bumps the version, even 
+-- ones from outside the app. Members only count for the columns that go in 
+-- the ACL snapshot, so a new password or phone number doesn't.
+CREATE FUNCTION bump_acl_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE acl_version SET version = version + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER members_acl_version
+    AFTER INSERT OR DELETE OR TRUNCATE OR UPDATE OF rfid, active, full_name
+    ON members
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER roles_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON roles
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER role_members_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON role_members
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER permissions_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON permissions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+CREATE TRIGGER role_permissions_acl_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON role_permissions
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_acl_version();
+
+-- Same again for anything that changes how members and API clients log in
+CREATE FUNCTION bump_auth_version() RETURNS trigger AS $$
+BEGIN
+    UPDATE auth_version SET version = version + 1 WHERE id = 1;
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+CREATE TRIGGER members_auth_version
+    AFTER DELETE OR TRUNCATE
+        OR UPDATE OF username, password_type, encoded_password, active
+    ON members
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_auth_version();
+CREATE TRIGGER oauth_tokens_auth_version
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON oauth_tokens
+    FOR EACH STATEMENT EXECUTE FUNCTION bump_auth_version();
+
+-- Scan counts, kept up to date by the entry log writer. Times are UTC. 
+-- backfill_scan_rollups.py rebuilds them from the entry log.
+CREATE TABLE location_hourly_scans (
+    location        INT NOT NULL REFERENCES locations (id),
+    hour            TIMESTAMP NOT NULL,
+    granted         BIGINT NOT NULL DEFAULT 0,
+    denied          BIGINT NOT NULL DEFAULT 0,
+    unknown         BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (location, hour)
+);
+CREATE INDEX ON location_hourly_scans (hour);
+
+CREATE TABLE member_daily_scans (
+    rfid            TEXT NOT NULL,
+    day             DATE NOT NULL,
+    granted         BIGINT NOT NULL DEFAULT 0,
+    denied          BIGINT NOT NULL DEFAULT 0,
+    unknown         BIGINT NOT NULL DEFAULT 0,
+    PRIMARY KEY (rfid, day)
+);
+CREATE INDEX ON member_daily_scans (day);
+
+-- Last scan of each tag, and at each location, kept up to date by the entry 
+-- log writer. backfill_scan_rollups.py fills them in from the entry log.
+CREATE TABLE member_last_seen (
+    rfid            TEXT PRIMARY KEY NOT NULL,
+    last_seen       TIMESTAMP WITH TIME ZONE NOT NULL,
+    location        INT REFERENCES locations (id),
+    is_active_tag   BOOLEAN NOT NULL
+);
+CREATE INDEX member_last_seen_last_seen_idx ON member_last_seen (last_seen);
+
+CREATE TABLE location_last_scan (
+    location        INT PRIMARY KEY NOT NULL REFERENCES locations (id),
+    last_scan       TIMESTAMP WITH TIME ZONE NOT NULL,
+    rfid            TEXT NOT NULL,
+    is_active_tag   BOOLEAN NOT NULL
+);
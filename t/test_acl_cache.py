@@ -0,0 +1,215 @@
+import unittest
+import psycopg2
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+import Doorbot.ACLCache
+import Doorbot.Config
+import Doorbot.SQLAlchemy
+from sqlalchemy import delete
+from sqlalchemy import event
+from sqlalchemy import insert
+from sqlalchemy import select
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+
+
+RFID_FOO = "1234"
+RFID_BAR = "2345"
+RFID_BAZ = "3456"
+
+
+class TestACLCache( unittest.TestCase ):
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+
+        permission_front_door = Doorbot.SQLAlchemy.Permission(
+            name = "front.door",
+        )
+        permission_wood_bandsaw = Doorbot.SQLAlchemy.Permission(
+            name = "woodshop.bandsaw",
+        )
+
+        role_doors = Doorbot.SQLAlchemy.Role(
+            name = "doors",
+        )
+        role_doors.permissions.append( permission_front_door )
+
+        role_wood = Doorbot.SQLAlchemy.Role(
+            name = "woodshop",
+        )
+        role_wood.permissions.append( permission_wood_bandsaw )
+
+        member_foo = Doorbot.SQLAlchemy.Member(
+            full_name = "foo",
+            rfid = RFID_FOO,
+        )
+        member_foo.roles.append( role_doors )
+
+        member_bar = Doorbot.SQLAlchemy.Member(
+            full_name = "bar",
+            rfid = RFID_BAR,
+            active = False,
+        )
+        member_bar.roles.append( role_doors )
+
+        session = Session( engine )
+        session.add_all([
+            permission_front_door,
+            permission_wood_bandsaw,
+            role_doors,
+            role_wood,
+            member_foo,
+            member_bar,
+        ])
+        session.commit()
+        session.close()
+
+    def test_snapshot_contents( self ):
+        snapshot = Doorbot.ACLCache.get_snapshot()
+
+        entry = snapshot.get( RFID_FOO )
+        self.assertEqual( entry.full_name, "foo", "Fetched full name" )
+        self.assertTrue( entry.active, "Member is active" )
+        self.assertEqual( entry.permissions, frozenset([ "front.door" ]),
+            "Permissions found as expected" )
+
+        self.assertTrue( snapshot.has_permission( RFID_FOO, "front.door" ),
+            "Member has front.door permission via role" )
+        self.assertFalse( snapshot.has_permission( RFID_FOO, "woodshop.bandsaw" ),
+            "Member does not have woodshop.bandsaw permission" )
+        self.assertFalse( snapshot.has_permission( RFID_BAR, "front.door" ),
+            "Inactive member does not get permission" )
+        self.assertIsNone( snapshot.get( "9999" ), "Unknown tag not found" )
+
+    def test_check_does_not_query( self ):
+        Doorbot.ACLCache.get_snapshot()
+
+        statements = []
+        def count_statement( *args ):
+            statements.append( args )
+        event.listen( engine, "before_cursor_execute", count_statement )
+
+        snapshot = Doorbot.ACLCache.get_snapshot()
+        snapshot.has_permission( RFID_FOO, "front.door" )
+
+        event.remove( engine, "before_cursor_execute", count_statement )
+        self.assertEqual( len( statements ), 0, "No SQL run for cached check" )
+
+    def test_rebuilt_after_commit( self ):
+        snapshot = Doorbot.ACLCache.get_snapshot()
+        self.assertIsNone( snapshot.get( RFID_BAZ ), "Tag not there yet" )
+
+        session = Session( engine )
+        role_wood = session.scalars(
+            select( Doorbot.SQLAlchemy.Role ).where(
+                Doorbot.SQLAlchemy.Role.name == "woodshop"
+            )
+        ).one()
+        member_baz = Doorbot.SQLAlchemy.Member(
+            full_name = "baz",
+            rfid = RFID_BAZ,
+        )
+        member_baz.roles.append( role_wood )
+        session.add( member_baz )
+        session.commit()
+        session.close()
+
+        snapshot = Doorbot.ACLCache.get_snapshot()
+        self.assertTrue( snapshot.has_permission( RFID_BAZ, "woodshop.bandsaw" ),
+            "New member shows up after commit" )
+
+    def test_not_rebuilt_after_rollback( self ):
+        snapshot = Doorbot.ACLCache.get_snapshot()
+
+        session = Session( engine )
+        session.add( Doorbot.SQLAlchemy.Member(
+            full_name = "qux",
+            rfid = "4567",
+        ) )
+        session.flush()
+        session.rollback()
+        session.close()
+
+        self.assertIs( Doorbot.ACLCache.get_snapshot(), snapshot,
+            "Snapshot kept after rollback" )
+
+    def test_version_bumped_outside_orm( self ):
+        snapshot = Doorbot.ACLCache.get_snapshot( check_version = True )
+        self.assertFalse( snapshot.has_permission( RFID_BAR, "front.door" ),
+            "Inactive member does not get permission" )
+
+        # A Core update, like the sync scripts make, doesn't go through the 
+        # ORM's commit hooks
+        def set_bar_active( active ):
+            with engine.begin() as conn:
+                conn.execute( update( Doorbot.SQLAlchemy.Member ).where(
+                    Doorbot.SQLAlchemy.Member.rfid == RFID_BAR,
+                ).values(
+                    active = active,
+                ) )
+
+        set_bar_active( True )
+        try:
+            snapshot = Doorbot.ACLCache.get_snapshot( check_version = True )
+            self.assertTrue( snapshot.has_permission( RFID_BAR, "front.door" ),
+                "Change outside the ORM seen with a version check" )
+        finally:
+            set_bar_active( False )
+
+    def test_token_change_leaves_acl_version( self ):
+        def versions():
+            with Session( engine ) as session:
+                return (
+                    Doorbot.SQLAlchemy.AclVersion.get_current( session ),
+                    Doorbot.SQLAlchemy.AuthVersion.get_current( session ),
+                )
+
+        acl_before, auth_before = versions()
+        with engine.begin() as conn:
+            member_id = conn.scalar( select( Doorbot.SQLAlchemy.Member.id )
+                .where( Doorbot.SQLAlchemy.Member.rfid == RFID_FOO ) )
+            conn.execute( insert( Doorbot.SQLAlchemy.OauthToken ).values(
+                name = "acl_cache_token",
+                token = "acl_cache_token",
+                expiration_date = datetime.now( timezone.utc ),
+                member_id = member_id,
+            ) )
+            conn.execute( delete( Doorbot.SQLAlchemy.OauthToken ).where(
+                Doorbot.SQLAlchemy.OauthToken.token == "acl_cache_token"
+            ) )
+        acl_after, auth_after = versions()
+
+        self.assertEqual( acl_after, acl_before,
+            "Tokens don't change doorbot ETags" )
+        self.assertGreater( auth_after, auth_before,
+            "Tokens bump the auth version" )
+
+    def test_only_snapshot_columns_bump_version( self ):
+        def acl_version():
+            with Session( engine ) as session:
+                return Doorbot.SQLAlchemy.AclVersion.get_current( session )
+
+        def update_bar( **values ):
+            with engine.begin() as conn:
+                conn.execute( update( Doorbot.SQLAlchemy.Member ).where(
+                    Doorbot.SQLAlchemy.Member.rfid == RFID_BAR,
+                ).values( **values ) )
+
+        before = acl_version()
+        update_bar( notes = "not in the snapshot" )
+        self.assertEqual( acl_version(), before,
+            "Columns outside the snapshot leave the version alone" )
+
+        update_bar( full_name = "bar2" )
+        try:
+            self.assertGreater( acl_version(), before,
+                "Columns in the snapshot bump the version" )
+        finally:
+            update_bar( full_name = "bar" )
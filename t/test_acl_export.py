@@ -0,0 +1,45 @@
+import unittest
+import struct
+import Doorbot.ACLExport
+
+
+TAGS = [ "0001234", "5678", "42", "user", "0042" ]
+
+
+class TestACLExport( unittest.TestCase ):
+    def test_pack_sorted( self ):
+        data = Doorbot.ACLExport.pack_sorted( TAGS, 7 )
+
+        kind, version, count = Doorbot.ACLExport.unpack_header( data )
+        self.assertEqual( kind, Doorbot.ACLExport.KIND_SORTED, "Sorted kind" )
+        self.assertEqual( version, 7, "ACL version in header" )
+        self.assertEqual( count, 3, "Non-numeric and duplicate tags dropped" )
+
+        header_size = Doorbot.ACLExport.HEADER.size
+        self.assertEqual( len( data ), header_size + 3 * 8,
+            "Fixed width entries" )
+        tags = struct.unpack_from( "<3Q", data, header_size )
+        self.assertEqual( tags, ( 42, 1234, 5678 ), "Tags sorted by number" )
+
+    def test_pack_bloom( self ):
+        tags = [ str( tag ) for tag in range( 1000, 2000 ) ]
+        data = Doorbot.ACLExport.pack_bloom( tags, 3, 0.01 )
+
+        kind, version, count = Doorbot.ACLExport.unpack_header( data )
+        self.assertEqual( kind, Doorbot.ACLExport.KIND_BLOOM, "Bloom kind" )
+        self.assertEqual( count, 1000, "All tags counted" )
+
+        for tag in tags:
+            self.assertTrue( Doorbot.ACLExport.bloom_contains( data, tag ),
+                "Tag " + tag + " is in the filter" )
+
+        false_positives = sum(
+            1 for tag in range( 10000, 20000 )
+            if Doorbot.ACLExport.bloom_contains( data, str( tag ) )
+        )
+        self.assertLess( false_positives, 300,
+            "False positive rate is in the right range" )
+
+    def test_bad_header( self ):
+        with self.assertRaises( ValueError ):
+            Doorbot.ACLExport.unpack_header( b"NOPE" + bytes( 16 ) )
@@ -0,0 +1,59 @@
+import unittest
+import random
+import shutil
+import subprocess
+import Doorbot.ApacheMD5
+
+
+KNOWN_PASS = "foobar123"
+APACHE_MD5_KNOWN_PASS = "$apr1$123/abCD$qVXnv7ltJwsWk3Y9JhLA1/"
+SALT_CHARS = Doorbot.ApacheMD5.ITOA64
+
+
+def openssl_apr1( password, salt ):
+    """What openssl makes of it, to check our version against"""
+    process = subprocess.run(
+        [ "openssl", "passwd", "-apr1", "-salt", salt, password ],
+        stdout = subprocess.PIPE,
+        check = True,
+    )
+    return process.stdout.decode( 'utf-8' ).rstrip()
+
+
+class TestApacheMD5( unittest.TestCase ):
+    def test_known_pass( self ):
+        self.assertTrue( Doorbot.ApacheMD5.does_match(
+            APACHE_MD5_KNOWN_PASS, KNOWN_PASS.encode( 'utf-8' ) ) )
+        self.assertFalse( Doorbot.ApacheMD5.does_match(
+            APACHE_MD5_KNOWN_PASS, b"foobar124" ) )
+
+    def test_not_apr1( self ):
+        self.assertFalse( Doorbot.ApacheMD5.does_match(
+            "$1$123/abCD$qVXnv7ltJwsWk3Y9JhLA1/", KNOWN_PASS.encode( 'utf-8' ) ) )
+        self.assertFalse( Doorbot.ApacheMD5.does_match(
+            "$apr1$", KNOWN_PASS.encode( 'utf-8' ) ) )
+
+    @unittest.skipUnless( shutil.which( "openssl" ), "Needs openssl" )
+    def test_matches_openssl( self ):
+        rand = random.Random( 1234 )
+        # Lengths around the 16 byte MD5 block, and long salts that get cut
+        # down to 8 characters
+        for length in [ 0, 1, 7, 15, 16, 17, 31, 32, 33, 80 ]:
+            password = "".join( rand.choice( SALT_CHARS + " !@#" )
+                for _ in range( length ) )
+            salt = "".join( rand.choice( SALT_CHARS )
+                for _ in range( rand.randint( 1, 10 ) ) )
+
+            self.assertEqual(
+                Doorbot.ApacheMD5.encode( password.encode( 'utf-8' ),
+                    salt.encode( 'utf-8' ) ),
+                openssl_apr1( password, salt ),
+                f"Same as openssl for a {length} character password",
+            )
+
+        password = "pässwörd"
+        self.assertEqual(
+            Doorbot.ApacheMD5.encode( password.encode( 'utf-8' ), b"abcdefgh" ),
+            openssl_apr1( password, "abcdefgh" ),
+            "Same as openssl for non-ASCII passwords",
+        )
@@ -10,6 +10,7 @@ import Doorbot.Config
 import Doorbot.API
 import Doorbot.SQLAlchemy
 from sqlalchemy import select
+from sqlalchemy import update
 from sqlalchemy.orm import Session
 from test_oauth_token import add_bearer_token, bearer_header
 
@@ -157,6 +158,44 @@ class TestAPI( flask_unittest.ClientTestCase ):
         rv = client.get( '/check_tag/0123', auth = USER_PASS )
         self.assertStatus( rv, 200 )
 
+    def test_deactivated_by_other_worker( self, client ):
+        session = Session( engine )
+        session.add( Doorbot.SQLAlchemy.Member(
+            full_name = "Quux Corge",
+            rfid = "0124",
+        ) )
+        session.commit()
+        session.close()
+
+        rv = client.get( '/check_tag/0124', auth = USER_PASS )
+        self.assertStatus( rv, 200 )
+
+        # Another worker's commit never reaches this process's commit hooks, 
+        # so this one only finds out through the ACL version
+        with engine.begin() as conn:
+            conn.execute( update( Doorbot.SQLAlchemy.Member ).where(
+                Doorbot.SQLAlchemy.Member.rfid == "0124",
+            ).values(
+                active = False,
+            ) )
+
+        acl_conf = dict( Doorbot.Config.get( 'acl_cache', {} ) )
+        try:
+            acl_conf[ 'version_check_seconds' ] = 3600
+            Doorbot.Config.set_override( 'acl_cache', acl_conf )
+            rv = client.get( '/check_tag/0124', auth = USER_PASS )
+            self.assertStatus( rv, 200 )
+
+            acl_conf[ 'version_check_seconds' ] = 0
+            Doorbot.Config.set_override( 'acl_cache', acl_conf )
+            rv = client.get( '/check_tag/0124', auth = USER_PASS )
+            self.assertStatus( rv, 403 )
+            rv = client.get( '/v1/check_tag/0124/cleanroom.door',
+                headers = bearer_header( TOKEN ) )
+            self.assertStatus( rv, 403 )
+        finally:
+            Doorbot.Config.clear_overrides()
+
     def test_search_tags( self, client ):
         members = [
             Doorbot.SQLAlchemy.Member(
@@ -255,7 +294,8 @@ class TestAPI( flask_unittest.ClientTestCase ):
         session.add_all( entries )
         session.commit()
 
-        rv = client.get( '/v1/search_entry_log?tag=09876&offset=0&limit=1',
+        # Both entries may have the same time, and ties go to the newest
+        rv = client.get( '/v1/search_entry_log?tag=09876&offset=0&limit=2',
             headers = bearer_header( TOKEN )
         )
         data = rv.data.decode( "UTF-8" )
@@ -0,0 +1,141 @@
+import unittest
+import flask_unittest
+import flask.globals
+from flask import json
+import os
+import psycopg2
+import re
+import sqlite3
+import Doorbot.Config
+import Doorbot.API
+import Doorbot.SQLAlchemy
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID1 = "1234"
+RFID2 = "2345"
+RFID3 = "3456"
+RFID_UNKNOWN = "9999"
+TOKEN = "0123456789abcdef"
+
+class TestCheckTagsAPI( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+    engine = None
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+
+        permission_front_door = Doorbot.SQLAlchemy.Permission(
+            name = "front.door",
+        )
+        permission_wood_tablesaw = Doorbot.SQLAlchemy.Permission(
+            name = "woodshop.tablesaw",
+        )
+
+        role_doors = Doorbot.SQLAlchemy.Role(
+            name = "doors",
+        )
+        role_wood = Doorbot.SQLAlchemy.Role(
+            name = "woodshop",
+        )
+        role_doors.permissions.append( permission_front_door )
+        role_wood.permissions.append( permission_wood_tablesaw )
+
+        members = [
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Foo Foo",
+                rfid = RFID1,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Baz",
+                rfid = RFID2,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Qux",
+                rfid = RFID3,
+                active = False,
+            ),
+        ]
+        members[0].roles.append( role_doors )
+        members[0].roles.append( role_wood )
+        members[1].roles.append( role_doors )
+        members[2].roles.append( role_wood )
+
+        session = Session( engine )
+        add_bearer_token( TOKEN, members[0], session )
+        session.add_all( members )
+        session.add_all([
+            permission_front_door,
+            permission_wood_tablesaw,
+            role_doors,
+            role_wood,
+        ])
+        session.commit()
+
+    def test_check_tags( self, client ):
+        rv = client.get( '/v1/check_tags?' + '&'.join([
+                'tag=' + RFID1,
+                'tag=' + RFID2,
+                'tag=' + RFID3,
+                'tag=' + RFID_UNKNOWN,
+                'permission=woodshop.tablesaw',
+            ]),
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        results = { item[ 'rfid' ]: item for item in data }
+        self.assertEqual( len( data ), 4, "One result per tag" )
+
+        self.assertTrue( results[ RFID1 ][ 'allowed' ],
+            "First user can use woodshop" )
+        self.assertEqual( results[ RFID1 ][ 'full_name' ], "Foo Foo",
+            "Fetched full name" )
+        self.assertFalse( results[ RFID2 ][ 'allowed' ],
+            "Second user lacks permission for woodshop" )
+        self.assertTrue( results[ RFID2 ][ 'active' ],
+            "Second user is still active" )
+        self.assertFalse( results[ RFID3 ][ 'allowed' ],
+            "Third user has permission, but inactive" )
+        self.assertFalse( results[ RFID_UNKNOWN ][ 'found' ],
+            "Unknown tag not found" )
+
+    def test_check_tags_many_permissions( self, client ):
+        rv = client.get( '/v1/check_tags?' + '&'.join([
+                'tag=' + RFID2,
+                'permission=front.door',
+                'permission=woodshop.tablesaw',
+            ]),
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        results = { item[ 'location' ]: item[ 'allowed' ] for item in data }
+        self.assertEqual( results, {
+            "front.door": True,
+            "woodshop.tablesaw": False,
+        }, "One result per permission" )
+
+    def test_check_tags_bad_input( self, client ):
+        rv = client.get( '/v1/check_tags?permission=front.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 400 )
+
+        rv = client.get( '/v1/check_tags?tag=foobar',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 400 )
+
+        rv = client.get( '/v1/check_tags?tag=' + RFID1 )
+        self.assertStatus( rv, 401 )
@@ -7,6 +7,7 @@ import psycopg2
 import re
 import sqlite3
 import Doorbot.Config
+import Doorbot.ACLExport
 import Doorbot.API
 import Doorbot.SQLAlchemy
 from sqlalchemy import select
@@ -94,6 +95,20 @@ class TestDumpTagsByLocationAPI( flask_unittest.ClientTestCase ):
             role_doors,
             role_wood,
         ])
+        session.add_all([
+            Doorbot.SQLAlchemy.Location(
+                name = "back.door",
+                hostname = "doors.local",
+            ),
+            Doorbot.SQLAlchemy.Location(
+                name = "front.door",
+                hostname = "doors.local",
+            ),
+            Doorbot.SQLAlchemy.Location(
+                name = "woodshop.tablesaw",
+                hostname = "woodshop.local",
+            ),
+        ])
         session.commit()
 
     def test_dump_active_tags_for_doors( self, client ):
@@ -125,3 +140,143 @@ class TestDumpTagsByLocationAPI( flask_unittest.ClientTestCase ):
             headers = bearer_header( TOKEN )
         )
         self.assertStatus( rv, 404 )
+
+    def test_dump_active_tags_etag( self, client ):
+        rv = client.get( '/v1/dump_active_tags/back.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        etag = rv.headers[ 'ETag' ]
+
+        rv = client.get( '/v1/dump_active_tags/back.door',
+            headers = bearer_header( TOKEN, { 'If-None-Match': etag } )
+        )
+        self.assertStatus( rv, 304 )
+
+    def test_dump_active_tags_since( self, client ):
+        rv = client.get( '/v1/dump_active_tags/front.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        version = rv.headers[ 'X-ACL-Version' ]
+
+        rv = client.get( '/v1/dump_active_tags/front.door?since=' + version,
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertEqual( data[ 'added' ], [], "Nothing added yet" )
+        self.assertEqual( data[ 'removed' ], [], "Nothing removed yet" )
+
+        # Deactivate the second user, and reactivate the third
+        rv = client.post( '/v1/deactivate_tag/' + RFID2,
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        rv = client.post( '/v1/reactivate_tag/' + RFID3,
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+
+        rv = client.get( '/v1/dump_active_tags/front.door?since=' + version,
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertFalse( data[ 'full' ], "Sent only the changes" )
+        self.assertEqual( data[ 'added' ], [ RFID3 ], "Third user added" )
+        self.assertEqual( data[ 'removed' ], [ RFID2 ], "Second user removed" )
+        self.assertGreater( data[ 'version' ], int( version ),
+            "Version went up" )
+
+        # Unknown version sends everything
+        rv = client.get( '/v1/dump_active_tags/front.door?since=99999',
+            headers = bearer_header( TOKEN )
+        )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertTrue( data[ 'full' ], "Sent the full list" )
+        self.assertEqual( data[ 'added' ], [ RFID1, RFID3 ],
+            "Full list of active tags" )
+
+        # Put things back for the other tests
+        client.post( '/v1/reactivate_tag/' + RFID2,
+            headers = bearer_header( TOKEN )
+        )
+        client.post( '/v1/deactivate_tag/' + RFID3,
+            headers = bearer_header( TOKEN )
+        )
+
+    def test_dump_active_tags_binary( self, client ):
+        rv = client.get( '/v1/dump_active_tags/back.door?format=sorted',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        self.assertEqual( rv.content_type, "application/vnd.bodgery.acl" )
+
+        kind, version, count = Doorbot.ACLExport.unpack_header( rv.data )
+        self.assertEqual( count, 2, "Two active users can open doors" )
+        self.assertEqual( str( version ), rv.headers[ 'X-ACL-Version' ],
+            "Header has the ACL version" )
+
+        rv = client.get( '/v1/dump_active_tags/back.door',
+            headers = bearer_header( TOKEN, {
+                'Accept': 'application/vnd.bodgery.acl-bloom',
+            })
+        )
+        self.assertStatus( rv, 200 )
+        self.assertTrue( Doorbot.ACLExport.bloom_contains( rv.data, RFID1 ),
+            "First user in Bloom filter" )
+
+        rv = client.get( '/v1/dump_active_tags/back.door?format=foo',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 400 )
+
+    def test_dump_active_tags_all_permissions( self, client ):
+        rv = client.get( '/v1/dump_active_tags',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertEqual( data, {
+            "back.door": [ RFID1, RFID2 ],
+            "front.door": [ RFID1, RFID2 ],
+            "woodshop.tablesaw": [ RFID1 ],
+        })
+
+        rv = client.get( '/v1/dump_active_tags',
+            headers = bearer_header( TOKEN,
+                { 'If-None-Match': rv.headers[ 'ETag' ] } )
+        )
+        self.assertStatus( rv, 304 )
+
+    def test_dump_active_tags_some_permissions( self, client ):
+        rv = client.get( '/v1/dump_active_tags'
+            + '?permission=back.door,woodshop.tablesaw',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertEqual( data, {
+            "back.door": [ RFID1, RFID2 ],
+            "woodshop.tablesaw": [ RFID1 ],
+        })
+
+        rv = client.get( '/v1/dump_active_tags?permission=no_such.permission',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 404 )
+
+    def test_dump_active_tags_for_hostname( self, client ):
+        rv = client.get( '/v1/dump_active_tags?hostname=doors.local',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertEqual( sorted( data.keys() ),
+            [ "back.door", "front.door" ] )
+
+        rv = client.get( '/v1/dump_active_tags?hostname=nowhere.local',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 404 )
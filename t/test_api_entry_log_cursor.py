@@ -0,0 +1,82 @@
+import unittest
+import flask_unittest
+import os
+import Doorbot.API
+import Doorbot.SQLAlchemy
+from datetime import datetime, timedelta
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID = "1234"
+TOKEN = "0123456789abcdef"
+ENTRY_COUNT = 7
+
+class TestEntryLogCursor( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        engine = Doorbot.SQLAlchemy.get_engine()
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "Foo Foo",
+            rfid = RFID,
+        )
+
+        # Some entries share a time, so the id has to break the tie
+        start = datetime( 2024, 1, 1, 12, 0, 0 )
+        entries = [
+            Doorbot.SQLAlchemy.EntryLog(
+                rfid = RFID,
+                entry_time = start + timedelta( minutes = i // 2 ),
+                is_active_tag = True,
+                is_found_tag = True,
+            )
+            for i in range( ENTRY_COUNT )
+        ]
+
+        session = Session( engine )
+        add_bearer_token( TOKEN, member, session )
+        session.add( member )
+        session.add_all( entries )
+        session.commit()
+        session.close()
+
+    def test_follow_cursor( self, client ):
+        seen = []
+        url = '/v1/search_entry_log?tag=' + RFID + '&limit=3'
+        cursor = None
+        pages = 0
+        while True:
+            rv = client.get(
+                url + ( '&cursor=' + cursor if cursor else '' ),
+                headers = bearer_header( TOKEN ),
+            )
+            self.assertStatus( rv, 200 )
+            lines = rv.data.decode( "UTF-8" ).splitlines()
+            seen.extend( line.split( ',' )[2] for line in lines )
+            pages += 1
+
+            cursor = rv.headers.get( 'X-Next-Cursor' )
+            if not cursor:
+                break
+
+        self.assertEqual( len( seen ), ENTRY_COUNT, "Saw every entry once" )
+        self.assertEqual( seen, sorted( seen, reverse = True ),
+            "Newest first" )
+        self.assertEqual( pages, 3 )
+
+    def test_cursor_round_trip( self, client ):
+        entry_time = datetime( 2024, 1, 1, 12, 0, 0 )
+        cursor = Doorbot.API.encode_entry_cursor( entry_time, 42 )
+        self.assertEqual( Doorbot.API.decode_entry_cursor( cursor ),
+            ( entry_time, 42 ) )
+
+    def test_bad_cursor( self, client ):
+        rv = client.get( '/v1/search_entry_log?cursor=foobar',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 400 )
@@ -0,0 +1,112 @@
+import unittest
+import flask_unittest
+import os
+import Doorbot.API
+import Doorbot.SQLAlchemy
+from datetime import datetime
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID_FOO = "1234"
+RFID_BAR = "2345"
+RFID_UNKNOWN = "9999"
+TOKEN = "0123456789abcdef"
+
+class TestEntryLogFilters( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        engine = Doorbot.SQLAlchemy.get_engine()
+        members = [
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Foo Foo",
+                rfid = RFID_FOO,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Baz",
+                rfid = RFID_BAR,
+                active = False,
+            ),
+        ]
+        front = Doorbot.SQLAlchemy.Location( name = "front.door" )
+        wood = Doorbot.SQLAlchemy.Location( name = "woodshop.door" )
+
+        def entry( rfid, location, day, active, found ):
+            return Doorbot.SQLAlchemy.EntryLog(
+                rfid = rfid,
+                mapped_location = location,
+                entry_time = datetime( 2024, 1, day, 12, 0, 0 ),
+                is_active_tag = active,
+                is_found_tag = found,
+            )
+
+        entries = [
+            entry( RFID_FOO, front, 1, True, True ),
+            entry( RFID_FOO, wood, 2, True, True ),
+            entry( RFID_BAR, front, 3, False, True ),
+            entry( RFID_UNKNOWN, wood, 4, False, False ),
+        ]
+
+        session = Session( engine )
+        add_bearer_token( TOKEN, members[0], session )
+        session.add_all( members )
+        session.add_all([ front, wood ])
+        session.add_all( entries )
+        session.commit()
+        session.close()
+
+    def search( self, client, query ):
+        rv = client.get( '/v1/search_entry_log?' + query,
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        return [
+            ( line.split( ',' )[1], line.split( ',' )[5] )
+            for line in rv.data.decode( "UTF-8" ).splitlines()
+        ]
+
+    def test_location( self, client ):
+        self.assertEqual( self.search( client, 'location=woodshop.door' ), [
+            ( RFID_UNKNOWN, "woodshop.door" ),
+            ( RFID_FOO, "woodshop.door" ),
+        ])
+
+    def test_time_range( self, client ):
+        results = self.search( client,
+            'since=2024-01-02T00:00:00&until=2024-01-04T00:00:00' )
+        self.assertEqual( [ r[0] for r in results ], [ RFID_BAR, RFID_FOO ] )
+
+        # Same range, written in UTC-6
+        results = self.search( client, 'since=2024-01-01T18:00:00-06:00'
+            + '&until=2024-01-03T18:00:00-06:00' )
+        self.assertEqual( [ r[0] for r in results ], [ RFID_BAR, RFID_FOO ] )
+
+    def test_granted( self, client ):
+        results = self.search( client, 'granted=0' )
+        self.assertEqual( [ r[0] for r in results ], [ RFID_UNKNOWN, RFID_BAR ] )
+
+        results = self.search( client, 'granted=1' )
+        self.assertEqual( [ r[0] for r in results ], [ RFID_FOO, RFID_FOO ] )
+
+    def test_unknown( self, client ):
+        results = self.search( client, 'unknown=1' )
+        self.assertEqual( [ r[0] for r in results ], [ RFID_UNKNOWN ] )
+
+    def test_name( self, client ):
+        results = self.search( client, 'name=bar' )
+        self.assertEqual( [ r[0] for r in results ], [ RFID_BAR ] )
+
+    def test_combined( self, client ):
+        results = self.search( client, 'location=front.door&granted=1' )
+        self.assertEqual( results, [ ( RFID_FOO, "front.door" ) ] )
+
+    def test_bad_filters( self, client ):
+        for query in [ 'since=yesterday', 'granted=maybe', 'location=a;b' ]:
+            rv = client.get( '/v1/search_entry_log?' + query,
+                headers = bearer_header( TOKEN ) )
+            self.assertStatus( rv, 400 )
@@ -0,0 +1,99 @@
+import unittest
+import csv
+import flask_unittest
+import io
+import os
+import Doorbot.API
+import Doorbot.SQLAlchemy
+from datetime import datetime, timedelta
+from flask import json
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID_FOO = "1234"
+RFID_UNKNOWN = "9999"
+TOKEN = "0123456789abcdef"
+ENTRY_COUNT = 25
+
+class TestExportEntryLog( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        engine = Doorbot.SQLAlchemy.get_engine()
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "Foo, Foo",
+            rfid = RFID_FOO,
+        )
+        location = Doorbot.SQLAlchemy.Location( name = "front.door" )
+
+        start = datetime( 2024, 1, 1, 12, 0, 0 )
+        entries = [
+            Doorbot.SQLAlchemy.EntryLog(
+                rfid = RFID_FOO,
+                mapped_location = location,
+                entry_time = start + timedelta( hours = i ),
+                is_active_tag = True,
+                is_found_tag = True,
+            )
+            for i in range( ENTRY_COUNT )
+        ]
+        entries.append( Doorbot.SQLAlchemy.EntryLog(
+            rfid = RFID_UNKNOWN,
+            entry_time = start,
+            is_active_tag = False,
+            is_found_tag = False,
+        ) )
+
+        session = Session( engine )
+        add_bearer_token( TOKEN, member, session )
+        session.add( member )
+        session.add( location )
+        session.add_all( entries )
+        session.commit()
+        session.close()
+
+    def setUp( self, client ):
+        # Small batches, so the stream has to go through several
+        self.batch_size = Doorbot.API.EXPORT_BATCH_SIZE
+        Doorbot.API.EXPORT_BATCH_SIZE = 10
+
+    def tearDown( self, client ):
+        Doorbot.API.EXPORT_BATCH_SIZE = self.batch_size
+
+    def test_export_csv( self, client ):
+        rv = client.get( '/v1/export_entry_log?tag=' + RFID_FOO,
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        self.assertEqual( rv.mimetype, "text/csv" )
+
+        rows = list( csv.reader( io.StringIO( rv.data.decode( "UTF-8" ) ) ) )
+        self.assertEqual( rows[0], Doorbot.API.EXPORT_COLUMNS )
+        self.assertEqual( len( rows ), ENTRY_COUNT + 1, "Every row exported" )
+        self.assertEqual( rows[1][0], "Foo, Foo", "Commas are quoted" )
+        self.assertEqual( rows[1][5], "front.door" )
+
+    def test_export_ndjson( self, client ):
+        rv = client.get( '/v1/export_entry_log?format=ndjson&unknown=1',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+
+        rows = [ json.loads( line )
+            for line in rv.data.decode( "UTF-8" ).splitlines() ]
+        self.assertEqual( len( rows ), 1 )
+        self.assertEqual( rows[0][ 'rfid' ], RFID_UNKNOWN )
+        self.assertFalse( rows[0][ 'is_found_tag' ] )
+        self.assertIsNone( rows[0][ 'location' ] )
+
+    def test_export_bad_args( self, client ):
+        rv = client.get( '/v1/export_entry_log?format=xml',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 400 )
+
+        rv = client.get( '/v1/export_entry_log' )
+        self.assertStatus( rv, 401 )
@@ -0,0 +1,137 @@
+import unittest
+import flask_unittest
+import flask.globals
+from flask import json
+import os
+import psycopg2
+import re
+import sqlite3
+import Doorbot.Config
+import Doorbot.API
+import Doorbot.EntryLogWriter
+import Doorbot.SQLAlchemy
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID1 = "1234"
+RFID2 = "2345"
+RFID3 = "3456"
+TOKEN = "0123456789abcdef"
+
+class TestScanAPI( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+    engine = None
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+
+        permission_wood_door = Doorbot.SQLAlchemy.Permission(
+            name = "woodshop.door",
+        )
+        role_wood = Doorbot.SQLAlchemy.Role(
+            name = "woodshop",
+        )
+        role_wood.permissions.append( permission_wood_door )
+
+        members = [
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Foo Foo",
+                rfid = RFID1,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Baz",
+                rfid = RFID2,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Qux",
+                rfid = RFID3,
+                active = False,
+            ),
+        ]
+        members[0].roles.append( role_wood )
+        members[2].roles.append( role_wood )
+
+        session = Session( engine )
+        add_bearer_token( TOKEN, members[0], session )
+        session.add_all( members )
+        session.add_all([
+            permission_wood_door,
+            role_wood,
+            Doorbot.SQLAlchemy.Location(
+                name = "woodshop.door",
+            ),
+            Doorbot.SQLAlchemy.Location(
+                name = "cleanroom.door",
+            ),
+        ])
+        session.commit()
+
+    def test_scan( self, client ):
+        rv = client.get( '/v1/scan/' + RFID1 + '/woodshop.door' )
+        self.assertStatus( rv, 401 )
+
+        rv = client.get( '/v1/scan/' + RFID1 + '/woodshop.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 200 )
+        data = rv.data.decode( "UTF-8" )
+        self.assertRegex( data, r'"full_name":\s*"Foo Foo"' )
+
+        rv = client.get( '/v1/scan/' + RFID2 + '/woodshop.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 403 )
+
+        rv = client.get( '/v1/scan/' + RFID3 + '/woodshop.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 403 )
+
+        rv = client.get( '/v1/scan/1111/woodshop.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 404 )
+
+        # No permission for this location, so nobody gets in
+        rv = client.get( '/v1/scan/' + RFID1 + '/cleanroom.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 403 )
+
+        rv = client.get( '/v1/scan/' + RFID1 + '/no_such.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 404 )
+
+        rv = client.get( '/v1/scan/foobar/woodshop.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 400 )
+
+    def test_scan_logged( self, client ):
+        rv = client.get( '/v1/scan/' + RFID2 + '/woodshop.door',
+            headers = bearer_header( TOKEN )
+        )
+        self.assertStatus( rv, 403 )
+
+        Doorbot.EntryLogWriter.flush()
+
+        session = Session( engine )
+        entry = session.scalars(
+            select( Doorbot.SQLAlchemy.EntryLog ).where(
+                Doorbot.SQLAlchemy.EntryLog.rfid == RFID2
+            )
+        ).first()
+        self.assertFalse( entry.is_active_tag, "Logged as not allowed" )
+        self.assertTrue( entry.is_found_tag, "Logged as found" )
+        self.assertEqual( entry.mapped_location.name, "woodshop.door",
+            "Logged the location" )
+        session.close()
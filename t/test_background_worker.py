@@ -0,0 +1,61 @@
+import unittest
+import threading
+from Doorbot.BackgroundWorker import BackgroundWorker, ProcessSingleton
+
+
+class ListWorker( BackgroundWorker ):
+    thread_name = "test-list-worker"
+
+    def __init__( self ):
+        super().__init__()
+        self.done = []
+
+    def add( self, item ):
+        self._queue.put( item )
+        self._ensure_running()
+
+    def _run( self ):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            elif isinstance( item, threading.Event ):
+                item.set()
+            else:
+                self.done.append( item )
+
+    def _run_now( self, items ):
+        self.done.extend( items )
+
+
+class TestBackgroundWorker( unittest.TestCase ):
+    def test_flush( self ):
+        worker = ListWorker()
+        worker.add( 1 )
+        worker.add( 2 )
+        worker.flush()
+        self.assertEqual( worker.done, [ 1, 2 ] )
+        worker.stop()
+        self.assertFalse( worker._is_running() )
+
+    def test_flush_without_thread( self ):
+        worker = ListWorker()
+        worker._queue.put( 1 )
+        worker.flush()
+        self.assertEqual( worker.done, [ 1 ], "Done in the caller's thread" )
+
+
+class TestProcessSingleton( unittest.TestCase ):
+    def test_made_once( self ):
+        made = []
+        singleton = ProcessSingleton( lambda: made.append( 1 ) or object() )
+        self.assertIsNone( singleton.peek() )
+
+        first = singleton.get()
+        self.assertIs( singleton.get(), first )
+        self.assertIs( singleton.peek(), first )
+        self.assertEqual( len( made ), 1 )
+
+
+if __name__ == '__main__':
+    unittest.main()
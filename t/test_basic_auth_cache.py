@@ -0,0 +1,115 @@
+import unittest
+import unittest.mock
+import flask_unittest
+import os
+import psycopg2
+import re
+import sqlite3
+import Doorbot.Config
+import Doorbot.API
+import Doorbot.SQLAlchemy
+from sqlalchemy import update
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+USER_PASS = ( "user", "pass" )
+RFID = "1234"
+NEW_PASS = "pass2"
+TOKEN = "0123456789abcdef"
+
+
+class TestBasicAuthCache( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+    engine = None
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "_tester",
+            rfid = RFID,
+            username = USER_PASS[0],
+        )
+        member.set_password( USER_PASS[1], {
+            "type": "plaintext",
+        })
+
+        session = Session( engine )
+        add_bearer_token( TOKEN, member, session )
+        session.add( member )
+        session.commit()
+        session.close()
+
+    def test_credentials_cached( self, client ):
+        rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+        self.assertStatus( rv, 200 )
+
+        with unittest.mock.patch.object(
+            Doorbot.SQLAlchemy.Member,
+            'check_password',
+        ) as check_password:
+            rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+            self.assertStatus( rv, 200 )
+            self.assertFalse( check_password.called,
+                "Password not checked again for cached credentials" )
+
+            rv = client.get( '/check_tag/' + RFID,
+                auth = ( USER_PASS[0], USER_PASS[1] + "foo" ) )
+            self.assertTrue( check_password.called,
+                "Wrong password is not served from the cache" )
+
+    def test_cache_cleared_on_password_change( self, client ):
+        rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+        self.assertStatus( rv, 200 )
+
+        rv = client.put( '/v1/change_passwd/' + RFID, data = {
+            "new_pass": NEW_PASS,
+            "new_pass2": NEW_PASS,
+        }, headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+
+        rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+        self.assertStatus( rv, 401 )
+
+        rv = client.get( '/check_tag/' + RFID,
+            auth = ( USER_PASS[0], NEW_PASS ) )
+        self.assertStatus( rv, 200 )
+
+        # Put it back for the other tests
+        rv = client.put( '/v1/change_passwd/' + RFID, data = {
+            "new_pass": USER_PASS[1],
+            "new_pass2": USER_PASS[1],
+        }, headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+
+    def test_cache_cleared_by_other_worker( self, client ):
+        rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+        self.assertStatus( rv, 200 )
+
+        # Changed outside this process's ORM, like another worker would, so 
+        # only the auth version tells us
+        def set_password( password ):
+            with engine.begin() as conn:
+                conn.execute( update( Doorbot.SQLAlchemy.Member ).where(
+                    Doorbot.SQLAlchemy.Member.username == USER_PASS[0]
+                ).values(
+                    encoded_password = password,
+                ) )
+
+        acl_conf = dict( Doorbot.Config.get( 'acl_cache', {} ) )
+        acl_conf[ 'version_check_seconds' ] = 0
+        Doorbot.Config.set_override( 'acl_cache', acl_conf )
+        set_password( NEW_PASS )
+        try:
+            rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+            self.assertStatus( rv, 401 )
+        finally:
+            set_password( USER_PASS[1] )
+            Doorbot.Config.clear_overrides()
@@ -0,0 +1,86 @@
+import unittest
+import Doorbot.BcryptCalibration
+import Doorbot.Config
+import Doorbot.SQLAlchemy
+
+
+def fake_timer( difficulty, samples ):
+    # Pretend difficulty 10 takes 50ms, doubling each step
+    return 50 * 2 ** ( difficulty - 10 )
+
+
+class TestBcryptCalibration( unittest.TestCase ):
+    def tearDown( self ):
+        Doorbot.BcryptCalibration.use_difficulty( None )
+        Doorbot.Config.clear_overrides()
+
+    def test_fits_budget( self ):
+        difficulty, timings = Doorbot.BcryptCalibration.calibrate(
+            budget_ms = 250,
+            min_difficulty = 8,
+            max_difficulty = 16,
+            timer = fake_timer,
+        )
+        self.assertEqual( difficulty, 12, "200ms fits, 400ms doesn't" )
+        self.assertEqual( list( timings.keys() ), [ 8, 9, 10, 11, 12, 13 ],
+            "Stopped after the first one over budget" )
+
+    def test_limits( self ):
+        difficulty, timings = Doorbot.BcryptCalibration.calibrate(
+            budget_ms = 10,
+            min_difficulty = 10,
+            timer = fake_timer,
+        )
+        self.assertEqual( difficulty, 10, "Never below the floor" )
+
+        difficulty, timings = Doorbot.BcryptCalibration.calibrate(
+            budget_ms = 10000,
+            min_difficulty = 10,
+            max_difficulty = 12,
+            timer = fake_timer,
+        )
+        self.assertEqual( difficulty, 12, "Never above the ceiling" )
+
+    def test_real_timer( self ):
+        took = Doorbot.BcryptCalibration.time_difficulty( 4, 1 )
+        self.assertGreater( took, 0 )
+
+    def test_use_difficulty( self ):
+        Doorbot.Config.set_override( 'password_storage', {
+            "type": "bcrypt",
+            "bcrypt": { "difficulty": 10 },
+        })
+        Doorbot.BcryptCalibration.use_difficulty( 13 )
+        conf = Doorbot.BcryptCalibration.storage_config()
+        self.assertEqual( conf[ 'bcrypt' ][ 'difficulty' ], 13 )
+        self.assertEqual( conf[ 'type' ], 'bcrypt', "Rest of it is kept" )
+        self.assertEqual(
+            Doorbot.Config.get( 'password_storage' )[ 'bcrypt' ][ 'difficulty' ],
+            10,
+            "Config itself is left alone",
+        )
+
+        # Like a reloaded config raising the difficulty past the calibrated one
+        Doorbot.Config.set_override( 'password_storage', {
+            "type": "bcrypt",
+            "bcrypt": { "difficulty": 14 },
+        })
+        conf = Doorbot.BcryptCalibration.storage_config()
+        self.assertEqual( conf[ 'bcrypt' ][ 'difficulty' ], 14,
+            "Higher configured difficulty wins" )
+
+        Doorbot.Config.set_override( 'password_storage', {
+            "type": "plaintext",
+        })
+        conf = Doorbot.BcryptCalibration.storage_config()
+        self.assertEqual( conf[ 'type' ], 'plaintext',
+            "Switching type still takes effect" )
+
+    def test_stronger_hash_kept( self ):
+        member = Doorbot.SQLAlchemy.Member()
+        stored = { "type": "bcrypt", "bcrypt": { "difficulty": 12 } }
+        target = { "type": "bcrypt", "bcrypt": { "difficulty": 11 } }
+        self.assertTrue( member._password_config_does_match( stored, target ),
+            "Not re-encoded down to a lower difficulty" )
+        self.assertFalse( member._password_config_does_match( target, stored ),
+            "Re-encoded up to a higher difficulty" )
@@ -0,0 +1,93 @@
+import unittest
+import unittest.mock
+import os
+import pathlib
+import tempfile
+import Doorbot.Config
+
+
+class TestConfig( unittest.TestCase ):
+    def setUp( self ):
+        tmp = tempfile.NamedTemporaryFile(
+            mode = 'w',
+            suffix = '.yml',
+            delete = False,
+        )
+        tmp.write( "timezone: UTC\nsection:\n  key: 1\n  list:\n    - a\n" )
+        tmp.close()
+        self.conf_file = tmp.name
+        Doorbot.Config.init( self.conf_file )
+
+    def tearDown( self ):
+        os.unlink( self.conf_file )
+        Doorbot.Config.clear_overrides()
+        Doorbot.Config.init()
+
+    def rewrite( self, content ):
+        path = pathlib.Path( self.conf_file )
+        mtime = path.stat().st_mtime
+        path.write_text( content )
+        # Make sure the mtime moves, even on coarse filesystem clocks
+        os.utime( self.conf_file, ( mtime + 10, mtime + 10 ) )
+
+    def test_parsed_once( self ):
+        with unittest.mock.patch.object(
+            pathlib.Path,
+            'read_text',
+        ) as read_text:
+            for i in range( 5 ):
+                self.assertEqual( Doorbot.Config.get( 'timezone' ), "UTC" )
+            self.assertFalse( read_text.called, "Config not read again" )
+
+    def test_read_only( self ):
+        section = Doorbot.Config.get( 'section' )
+        self.assertEqual( section[ 'key' ], 1 )
+        self.assertEqual( section[ 'list' ], ( "a", ) )
+        with self.assertRaises( TypeError ):
+            section[ 'key' ] = 2
+
+    def test_default( self ):
+        self.assertEqual( Doorbot.Config.get( 'nothing', {} ), {} )
+        with self.assertRaises( KeyError ):
+            Doorbot.Config.get( 'nothing' )
+
+    def test_reload_on_change( self ):
+        self.rewrite( "timezone: America/Chicago\n" )
+        with unittest.mock.patch.object(
+            Doorbot.Config,
+            'RELOAD_CHECK_SECONDS',
+            0,
+        ):
+            Doorbot.Config.init( self.conf_file )
+            self.rewrite( "timezone: America/New_York\n" )
+            self.assertEqual( Doorbot.Config.get( 'timezone' ),
+                "America/New_York" )
+
+            # Broken file keeps the old config
+            self.rewrite( "timezone: [\n" )
+            self.assertEqual( Doorbot.Config.get( 'timezone' ),
+                "America/New_York" )
+
+    def test_reload_on_sighup( self ):
+        path = pathlib.Path( self.conf_file )
+        mtime = path.stat().st_mtime
+        path.write_text( "timezone: America/Chicago\n" )
+        os.utime( self.conf_file, ( mtime, mtime ) )
+        self.assertEqual( Doorbot.Config.get( 'timezone' ), "UTC",
+            "Same mtime, so no reload yet" )
+
+        Doorbot.Config._on_sighup( None, None )
+        self.assertEqual( Doorbot.Config.get( 'timezone' ),
+            "America/Chicago" )
+
+    def test_override( self ):
+        Doorbot.Config.set_override( 'timezone', "America/Denver" )
+        self.assertEqual( Doorbot.Config.get( 'timezone' ),
+            "America/Denver" )
+
+        Doorbot.Config.reload()
+        self.assertEqual( Doorbot.Config.get( 'timezone' ),
+            "America/Denver", "Overrides survive a reload" )
+
+        Doorbot.Config.clear_overrides()
+        self.assertEqual( Doorbot.Config.get( 'timezone' ), "UTC" )
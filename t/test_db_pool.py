@@ -0,0 +1,98 @@
+import unittest
+import flask_unittest
+import os
+import threading
+import time
+from flask import json
+import Doorbot.API
+import Doorbot.DBPool
+import Doorbot.SQLAlchemy
+from sqlalchemy import create_engine
+from sqlalchemy import text
+from sqlalchemy.exc import TimeoutError
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+TOKEN = "0123456789abcdef"
+
+class TestInstrumentedPool( unittest.TestCase ):
+    def make_engine( self ):
+        return create_engine(
+            "sqlite://",
+            poolclass = Doorbot.DBPool.InstrumentedQueuePool,
+            pool_size = 1,
+            max_overflow = 0,
+            pool_timeout = 0.2,
+            connect_args = {
+                "check_same_thread": False,
+            },
+        )
+
+    def test_counts_checkouts( self ):
+        engine = self.make_engine()
+        for i in range( 3 ):
+            with engine.connect() as conn:
+                conn.execute( text( "SELECT 1" ) )
+
+        stats = Doorbot.DBPool.pool_stats( engine )
+        self.assertEqual( stats[ 'checkouts' ], 3 )
+        self.assertEqual( stats[ 'connects' ], 1, "Connection was reused" )
+        self.assertEqual( stats[ 'checked_out' ], 0 )
+        engine.dispose()
+
+    def test_counts_waits( self ):
+        engine = self.make_engine()
+        conn = engine.connect()
+
+        def release():
+            time.sleep( 0.05 )
+            conn.close()
+        threading.Thread( target = release ).start()
+
+        with engine.connect() as conn2:
+            conn2.execute( text( "SELECT 1" ) )
+
+        stats = Doorbot.DBPool.pool_stats( engine )
+        self.assertGreaterEqual( stats[ 'waits' ], 1 )
+        self.assertGreater( stats[ 'wait_seconds' ], 0 )
+
+        conn = engine.connect()
+        with self.assertRaises( TimeoutError ):
+            engine.connect()
+        conn.close()
+
+        stats = Doorbot.DBPool.pool_stats( engine )
+        self.assertEqual( stats[ 'timeouts' ], 1 )
+        engine.dispose()
+
+
+class TestPoolStatsAPI( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        engine = Doorbot.SQLAlchemy.get_engine()
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "Foo Foo",
+            rfid = "1234",
+        )
+        session = Session( engine )
+        add_bearer_token( TOKEN, member, session )
+        session.add( member )
+        session.commit()
+        session.close()
+
+    def test_pool_stats( self, client ):
+        rv = client.get( '/v1/db_pool_stats' )
+        self.assertStatus( rv, 401 )
+
+        rv = client.get( '/v1/db_pool_stats',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertIn( 'pool', data )
@@ -0,0 +1,164 @@
+import unittest
+import os
+import Doorbot.EntryLogPartitions as Partitions
+import Doorbot.SQLAlchemy
+from datetime import datetime, timedelta, timezone
+from sqlalchemy import create_engine
+from sqlalchemy import text
+
+
+MIGRATION_FILE = os.path.join( os.path.dirname( __file__ ), "..", "sql",
+    "changes_pg.sql" )
+# The part of the migration that partitions entry_log
+MIGRATION_START = "-- Keyset pagination on the entry log"
+MIGRATION_END = "-- Scan counts"
+SCRATCH_SCHEMA = "entry_log_migration_test"
+
+
+def utc( year, month, day = 1 ):
+    return datetime( year, month, day, tzinfo = timezone.utc )
+
+class TestEntryLogPartitions( unittest.TestCase ):
+    def test_month_start( self ):
+        # Still December in UTC, even though it's January in UTC+6
+        local = datetime( 2024, 1, 1, 2, 0,
+            tzinfo = timezone( timedelta( hours = 6 ) ) )
+        self.assertEqual( Partitions.month_start( local ), utc( 2023, 12 ) )
+
+    def test_months_to_create( self ):
+        months = Partitions.months_to_create( utc( 2023, 11, 15 ), 3 )
+        self.assertEqual( [ Partitions.partition_name( m ) for m in months ], [
+            "entry_log_2023_11",
+            "entry_log_2023_12",
+            "entry_log_2024_01",
+            "entry_log_2024_02",
+        ])
+
+    def test_partition_month( self ):
+        self.assertEqual( Partitions.partition_month( "entry_log_2024_03" ),
+            utc( 2024, 3 ) )
+        self.assertIsNone( Partitions.partition_month( "entry_log_default" ) )
+        self.assertIsNone( Partitions.partition_month( "entry_log_legacy" ) )
+        self.assertIsNone( Partitions.partition_month( "entry_log_2024_13" ) )
+
+    def test_partitions_to_archive( self ):
+        names = [
+            "entry_log_2022_12",
+            "entry_log_2023_01",
+            "entry_log_2023_02",
+            "entry_log_default",
+        ]
+        now = utc( 2024, 2, 10 )
+        self.assertEqual(
+            Partitions.partitions_to_archive( names, now, 12 ),
+            [ "entry_log_2022_12", "entry_log_2023_01" ],
+            "Months ending before a year ago are archived",
+        )
+        self.assertEqual(
+            Partitions.partitions_to_archive( names, now, 0 ),
+            [],
+            "Zero retention keeps everything",
+        )
+
+    def test_parse_range_bound( self ):
+        self.assertEqual(
+            Partitions.parse_range_bound( "FOR VALUES FROM (MINVALUE)"
+                + " TO ('2024-02-01 00:00:00+00')" ),
+            ( None, utc( 2024, 2 ) ),
+        )
+        self.assertEqual(
+            Partitions.parse_range_bound( "FOR VALUES FROM"
+                + " ('2024-01-01 06:00:00+06') TO ('2024-02-01 00:00:00+00')" ),
+            ( utc( 2024, 1 ), utc( 2024, 2 ) ),
+            "Offsets converted to UTC",
+        )
+        self.assertIsNone( Partitions.parse_range_bound( "DEFAULT" ) )
+
+    def test_is_month_covered( self ):
+        legacy = ( None, utc( 2024, 2 ) )
+        self.assertTrue( Partitions.is_month_covered( utc( 2024, 1 ),
+            [ legacy ] ) )
+        self.assertFalse( Partitions.is_month_covered( utc( 2024, 2 ),
+            [ legacy ] ) )
+        self.assertFalse( Partitions.is_month_covered( utc( 2024, 1 ), [] ) )
+
+
+@unittest.skipUnless( 'PG' == os.environ.get( 'DB' ), "Needs Postgres" )
+class TestEntryLogPartitionsMigration( unittest.TestCase ):
+    """Runs the partitioning migration on an old style entry_log, in a
+    schema of its own, then maintains the partitions"""
+
+    def setUp( self ):
+        url = Doorbot.SQLAlchemy.get_engine().url
+        self.engine = create_engine(
+            url.render_as_string( hide_password = False ),
+            connect_args = {
+                "options": "-csearch_path=" + SCRATCH_SCHEMA,
+            },
+        )
+        with self.engine.begin() as conn:
+            conn.execute( text( "DROP SCHEMA IF EXISTS " + SCRATCH_SCHEMA
+                + " CASCADE" ) )
+            conn.execute( text( "CREATE SCHEMA " + SCRATCH_SCHEMA ) )
+            conn.execute( text( """
+                CREATE TABLE entry_log (
+                    id              SERIAL PRIMARY KEY NOT NULL,
+                    rfid            TEXT NOT NULL,
+                    entry_time      TIMESTAMP WITH TIME ZONE NOT NULL
+                        DEFAULT NOW(),
+                    is_active_tag   BOOLEAN NOT NULL,
+                    is_found_tag    BOOLEAN NOT NULL,
+                    location        INT
+                )
+            """ ) )
+            conn.execute( text( "CREATE INDEX ON entry_log (entry_time DESC)" ) )
+            conn.execute( text( "INSERT INTO entry_log"
+                + " ( rfid, is_active_tag, is_found_tag ) VALUES"
+                + " ( '1234', TRUE, TRUE )" ) )
+
+        with open( MIGRATION_FILE, 'r' ) as f:
+            migration = f.read()
+        start = migration.index( MIGRATION_START )
+        end = migration.index( MIGRATION_END )
+
+        # Straight to the DBAPI, so nothing in the SQL looks like a parameter
+        raw_conn = self.engine.raw_connection()
+        try:
+            cursor = raw_conn.cursor()
+            cursor.execute( migration[ start:end ] )
+            cursor.close()
+            raw_conn.commit()
+        finally:
+            raw_conn.close()
+
+    def tearDown( self ):
+        with self.engine.begin() as conn:
+            conn.execute( text( "DROP SCHEMA " + SCRATCH_SCHEMA + " CASCADE" ) )
+        self.engine.dispose()
+
+    def test_maintain_after_migration( self ):
+        now = datetime.now( timezone.utc )
+        this_month = Partitions.month_start( now )
+        next_month = Partitions.add_months( this_month, 1 )
+
+        result = Partitions.maintain( self.engine, now = now )
+        self.assertNotIn( Partitions.partition_name( this_month ),
+            result[ 'created' ], "This month is left to the legacy partition" )
+        self.assertIn( Partitions.partition_name( next_month ),
+            result[ 'created' ], "Next month created" )
+
+        with self.engine.begin() as conn:
+            conn.execute( text( "INSERT INTO entry_log"
+                + " ( rfid, entry_time, is_active_tag, is_found_tag ) VALUES"
+                + " ( '1234', :time, TRUE, TRUE )" ), {
+                    "time": next_month + timedelta( days = 1 ),
+                })
+            default_count = conn.execute( text(
+                "SELECT COUNT(*) FROM entry_log_default" ) ).scalar()
+            month_count = conn.execute( text( "SELECT COUNT(*) FROM "
+                + Partitions.partition_name( next_month ) ) ).scalar()
+        self.assertEqual( default_count, 0, "Nothing in the default partition" )
+        self.assertEqual( month_count, 1, "Scan went into its month" )
+
+        result = Partitions.maintain( self.engine, now = now )
+        self.assertEqual( result[ 'created' ], [], "Nothing left to create" )
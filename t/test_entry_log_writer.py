@@ -0,0 +1,108 @@
+import unittest
+import flask_unittest
+import os
+import psycopg2
+import re
+import sqlite3
+import time
+import Doorbot.Config
+import Doorbot.API
+import Doorbot.EntryLogWriter
+import Doorbot.SQLAlchemy
+from sqlalchemy import func
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+
+
+USER_PASS = ( "user", "pass" )
+RFID_FOO = "1234"
+RFID_BAR = "2345"
+
+
+def count_entries( rfid ):
+    session = Session( engine )
+    count = session.scalar(
+        select( func.count() ).select_from(
+            Doorbot.SQLAlchemy.EntryLog
+        ).where(
+            Doorbot.SQLAlchemy.EntryLog.rfid == rfid
+        )
+    )
+    session.close()
+    return count
+
+
+class TestEntryLogWriter( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+    engine = None
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "_tester",
+            rfid = USER_PASS[0],
+            username = USER_PASS[0],
+        )
+        member.set_password( USER_PASS[1], {
+            "type": "plaintext",
+        })
+
+        session = Session( engine )
+        session.add_all([
+            member,
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Foo Bar",
+                rfid = RFID_FOO,
+            ),
+            Doorbot.SQLAlchemy.Location(
+                name = "cleanroom.door",
+            ),
+        ])
+        session.commit()
+        session.close()
+
+    def test_entry_written_after_flush( self, client ):
+        rv = client.get( '/v1/entry/' + RFID_FOO + '/cleanroom.door',
+            auth = USER_PASS )
+        self.assertStatus( rv, 200 )
+
+        Doorbot.EntryLogWriter.flush()
+        self.assertEqual( count_entries( RFID_FOO ), 1, "Entry was written" )
+
+    def test_batch_written_when_full( self, client ):
+        session = Session( engine )
+        location = session.scalars(
+            select( Doorbot.SQLAlchemy.Location )
+        ).first()
+        location_id = location.id
+        session.close()
+
+        writer = Doorbot.EntryLogWriter.EntryLogWriter(
+            batch_size = 3,
+            flush_seconds = 60,
+        )
+        for i in range( 2 ):
+            writer.add( RFID_BAR, location_id, False, False )
+        time.sleep( 0.2 )
+        self.assertEqual( count_entries( RFID_BAR ), 0,
+            "Partial batch is held back" )
+
+        writer.add( RFID_BAR, location_id, False, False )
+        for i in range( 50 ):
+            if count_entries( RFID_BAR ) == 3:
+                break
+            time.sleep( 0.1 )
+        self.assertEqual( count_entries( RFID_BAR ), 3,
+            "Full batch was written without a flush" )
+
+        writer.add( RFID_BAR, location_id, False, False )
+        writer.stop()
+        self.assertEqual( count_entries( RFID_BAR ), 4,
+            "Stopping the writer writes what's left" )
@@ -0,0 +1,121 @@
+import unittest
+import flask_unittest
+import os
+import Doorbot.API
+import Doorbot.EntryLogWriter
+import Doorbot.LastSeen
+import Doorbot.SQLAlchemy
+from datetime import datetime, timedelta, timezone
+from flask import json
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID_FOO = "1234"
+RFID_BAR = "2345"
+RFID_NEVER = "3456"
+TOKEN = "0123456789abcdef"
+
+class TestLastSeen( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        engine = Doorbot.SQLAlchemy.get_engine()
+        members = [
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Foo Foo",
+                rfid = RFID_FOO,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Baz",
+                rfid = RFID_BAR,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Never Here",
+                rfid = RFID_NEVER,
+            ),
+        ]
+        front = Doorbot.SQLAlchemy.Location( name = "front.door" )
+        session = Session( engine )
+        add_bearer_token( TOKEN, members[0], session )
+        session.add_all( members )
+        session.add( front )
+        session.commit()
+        location_id = front.id
+        session.close()
+
+        now = datetime.now( timezone.utc ).replace( microsecond = 0 )
+        global foo_last_seen
+        foo_last_seen = now - timedelta( days = 1 )
+
+        # The newer batch is written first, so the older one must not undo it
+        writer = Doorbot.EntryLogWriter.EntryLogWriter()
+        for batch in [
+            [
+                ( RFID_FOO, foo_last_seen ),
+                ( RFID_FOO, foo_last_seen - timedelta( hours = 1 ) ),
+            ],
+            [
+                ( RFID_FOO, now - timedelta( days = 30 ) ),
+                ( RFID_BAR, now - timedelta( days = 400 ) ),
+            ],
+        ]:
+            for rfid, entry_time in batch:
+                writer.add( rfid, location_id, True, True, entry_time )
+            writer.flush()
+        writer.stop()
+
+    def search( self, client, query ):
+        rv = client.get( '/v1/search_tags?limit=100&' + query,
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        return {
+            line.split( ',' )[0]: line.split( ',' )[4]
+            for line in rv.data.decode( "UTF-8" ).splitlines()
+        }
+
+    def test_last_seen( self, client ):
+        results = self.search( client, 'tag=' + RFID_FOO )
+        self.assertEqual( results, {
+            RFID_FOO: foo_last_seen.isoformat(),
+        }, "Newest scan wins, whatever order batches are written in" )
+
+        results = self.search( client, 'tag=' + RFID_NEVER )
+        self.assertEqual( results, { RFID_NEVER: "" } )
+
+    def test_inactive( self, client ):
+        results = self.search( client, 'inactive_months=6' )
+        self.assertEqual( sorted( results.keys() ), [ RFID_BAR, RFID_NEVER ] )
+
+        rv = client.get( '/v1/search_tags?inactive_months=soon',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 400 )
+
+    def test_location_last_scan( self, client ):
+        rv = client.get( '/v1/location_last_scan',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        self.assertEqual( json.loads( rv.data ), [{
+            "location": "front.door",
+            "last_scan": foo_last_seen.isoformat(),
+            "rfid": RFID_FOO,
+            "is_active_tag": True,
+        }])
+
+    def test_backfill( self, client ):
+        # Already up to date, so reading the whole log changes nothing
+        Doorbot.LastSeen.backfill( Doorbot.SQLAlchemy.get_engine() )
+        results = self.search( client, 'tag=' + RFID_FOO )
+        self.assertEqual( results[ RFID_FOO ], foo_last_seen.isoformat() )
+
+    def test_inactive_cutoff( self, client ):
+        now = datetime( 2024, 3, 31, tzinfo = timezone.utc )
+        self.assertEqual( Doorbot.LastSeen.inactive_cutoff( 1, now ),
+            datetime( 2024, 2, 29, tzinfo = timezone.utc ) )
+        self.assertEqual( Doorbot.LastSeen.inactive_cutoff( 6, now ),
+            datetime( 2023, 9, 30, tzinfo = timezone.utc ) )
@@ -0,0 +1,85 @@
+import unittest
+import os
+import tempfile
+import Doorbot.MemberSnapshot
+
+
+def make_member( mms_id, name, active = True, end_date = '2026-01-01' ):
+    return {
+        'display_name': name,
+        'mms_id': mms_id,
+        'active_tag': active,
+        'active_memberships': [],
+        'mbrship': 1,
+        'end_date': end_date,
+    }
+
+
+class TestMemberSnapshot( unittest.TestCase ):
+    def test_hash( self ):
+        member = make_member( 1, "Foo Bar" )
+        reordered = dict( reversed( list( member.items() ) ) )
+        self.assertEqual(
+            Doorbot.MemberSnapshot.member_hash( member ),
+            Doorbot.MemberSnapshot.member_hash( reordered ),
+            "Hash doesn't depend on field order",
+        )
+        self.assertNotEqual(
+            Doorbot.MemberSnapshot.member_hash( member ),
+            Doorbot.MemberSnapshot.member_hash(
+                make_member( 1, "Foo Bar", active = False ) ),
+            "Hash changes with the fields",
+        )
+
+    def test_diff( self ):
+        old = Doorbot.MemberSnapshot.build_snapshot([
+            make_member( 1, "Foo Bar" ),
+            make_member( 2, "Baz Qux" ),
+            make_member( 3, "Gone Member" ),
+        ])
+        new = Doorbot.MemberSnapshot.build_snapshot([
+            make_member( 1, "Foo Bar" ),
+            make_member( 2, "Baz Qux", active = False ),
+            make_member( 4, "New Member" ),
+        ])
+
+        changes = Doorbot.MemberSnapshot.diff( old, new )
+        self.assertEqual( [ _[ 'mms_id' ] for _ in changes[ 'added' ] ], [ 4 ],
+            "New member added" )
+        self.assertEqual( len( changes[ 'changed' ] ), 1, "One member changed" )
+        self.assertTrue( changes[ 'changed' ][0][ 'previous' ][ 'active_tag' ],
+            "Previous version of changed member" )
+        self.assertFalse( changes[ 'changed' ][0][ 'current' ][ 'active_tag' ],
+            "Current version of changed member" )
+        self.assertEqual( [ _[ 'mms_id' ] for _ in changes[ 'removed' ] ], [ 3 ],
+            "Missing member removed" )
+
+    def test_diff_without_snapshot( self ):
+        new = Doorbot.MemberSnapshot.build_snapshot([
+            make_member( 1, "Foo Bar" ),
+        ])
+        changes = Doorbot.MemberSnapshot.diff( None, new )
+        self.assertEqual( len( changes[ 'added' ] ), 1,
+            "Everyone is added the first time" )
+        self.assertEqual( changes[ 'changed' ], [] )
+        self.assertEqual( changes[ 'removed' ], [] )
+
+    def test_save_load( self ):
+        snapshot = Doorbot.MemberSnapshot.build_snapshot([
+            make_member( 1, "Foo Bar" ),
+        ])
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            path = os.path.join( tmp_dir, "snapshot.json" )
+            self.assertIsNone( Doorbot.MemberSnapshot.load_snapshot( path ),
+                "No snapshot yet" )
+
+            Doorbot.MemberSnapshot.save_snapshot( path, snapshot )
+            loaded = Doorbot.MemberSnapshot.load_snapshot( path )
+            self.assertEqual( loaded, snapshot, "Snapshot loaded back" )
+            self.assertEqual(
+                Doorbot.MemberSnapshot.diff( loaded, snapshot ),
+                { 'added': [], 'changed': [], 'removed': [] },
+                "Nothing changed against a loaded snapshot",
+            )
+            self.assertFalse( os.path.exists( path + ".tmp" ),
+                "Temp file moved into place" )
@@ -0,0 +1,68 @@
+import unittest
+import threading
+import Doorbot.MemberPress
+
+
+class FakeResponse:
+    def __init__( self, data ):
+        self.data = data
+
+    def raise_for_status( self ):
+        pass
+
+    def json( self ):
+        return self.data
+
+
+class FakeSession:
+    """Serves a list of members a page at a time"""
+
+    def __init__( self, member_count ):
+        self.members = [ { "id": i } for i in range( member_count ) ]
+        self.pages_fetched = []
+        self.lock = threading.Lock()
+
+    def get( self, url, params, timeout ):
+        page = params[ "page" ]
+        per_page = params[ "per_page" ]
+        with self.lock:
+            self.pages_fetched.append( page )
+        start = ( page - 1 ) * per_page
+        return FakeResponse( self.members[ start : start + per_page ] )
+
+
+def make_client( session, workers = 3 ):
+    return Doorbot.MemberPress.MemberPressClient(
+        base_url = "https://mms.example.com",
+        user = "user",
+        passwd = "pass",
+        per_page = 10,
+        workers = workers,
+        session = session,
+    )
+
+
+class TestMemberPress( unittest.TestCase ):
+    def test_fetch_all( self ):
+        session = FakeSession( 75 )
+        client = make_client( session )
+
+        pages = []
+        members = client.fetch_all_members( on_page = pages.append )
+        self.assertEqual( [ m[ "id" ] for m in members ], list( range( 75 ) ),
+            "Every member, in order" )
+        self.assertEqual( pages, [ 1, 2, 3, 4, 5, 6, 7, 8 ] )
+        self.assertEqual( sorted( session.pages_fetched ),
+            [ 1, 2, 3, 4, 5, 6, 7, 8, 9 ],
+            "Fetched no further than the round with the last page" )
+        self.assertEqual( session.auth, ( "user", "pass" ) )
+
+    def test_exact_multiple( self ):
+        # The last full page is followed by an empty one
+        session = FakeSession( 30 )
+        members = make_client( session ).fetch_all_members()
+        self.assertEqual( len( members ), 30 )
+
+    def test_empty( self ):
+        members = make_client( FakeSession( 0 ) ).fetch_all_members()
+        self.assertEqual( members, [] )
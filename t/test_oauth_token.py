@@ -8,6 +8,7 @@ import Doorbot.API
 import Doorbot.Config
 import Doorbot.SQLAlchemy
 from datetime import timedelta, datetime
+from sqlalchemy import delete
 from sqlalchemy import select
 from sqlalchemy.orm import Session
 
@@ -15,17 +16,24 @@ from sqlalchemy.orm import Session
 RFID_FOO = "1234"
 TOKEN_GOOD = "0123456789abcdef"
 TOKEN_WRONG = "fedcba9876543210"
+TOKEN_EXPIRED = "00112233445566778899"
+TOKEN_DELETED = "99887766554433221100"
+TOKEN_REVOKED = "aabbccddeeff00112233"
 
 
-def add_bearer_token( token_str, member, session ):
+def add_bearer_token(
+    token_str,
+    member,
+    session,
+    expires_delta = timedelta( weeks = 1 ),
+):
     now = datetime.now()
-    week_delta = timedelta( weeks = 1 )
-    week_later = now + week_delta
+    expires = now + expires_delta
 
     token = Doorbot.SQLAlchemy.OauthToken(
         name = "foo_oauth",
         token = token_str,
-        expiration_date = week_later,
+        expiration_date = expires,
         member = member
     )
 
@@ -55,6 +63,10 @@ class TestOauthToken( flask_unittest.ClientTestCase ):
             rfid = RFID_FOO,
         )
         add_bearer_token( TOKEN_GOOD, member, session )
+        add_bearer_token( TOKEN_DELETED, member, session )
+        add_bearer_token( TOKEN_REVOKED, member, session )
+        add_bearer_token( TOKEN_EXPIRED, member, session,
+            expires_delta = timedelta( days = -1 ) )
 
         session.add( member )
         session.commit()
@@ -71,3 +83,55 @@ class TestOauthToken( flask_unittest.ClientTestCase ):
             headers = bearer_header( TOKEN_WRONG ),
         )
         self.assertStatus( rv, 401 )
+
+    def test_oauth_expired( self, client ):
+        rv = client.post( '/v1/deactivate_tag/' + RFID_FOO,
+            headers = bearer_header( TOKEN_EXPIRED ),
+        )
+        self.assertStatus( rv, 401 )
+
+    def test_oauth_deleted( self, client ):
+        rv = client.post( '/v1/deactivate_tag/' + RFID_FOO,
+            headers = bearer_header( TOKEN_DELETED ),
+        )
+        self.assertStatus( rv, 200 )
+
+        # Token is cached now, but deleting it has to clear that out
+        session = Session( engine )
+        token = session.scalars(
+            select( Doorbot.SQLAlchemy.OauthToken ).where(
+                Doorbot.SQLAlchemy.OauthToken.token == TOKEN_DELETED
+            )
+        ).one()
+        session.delete( token )
+        session.commit()
+        session.close()
+
+        rv = client.post( '/v1/deactivate_tag/' + RFID_FOO,
+            headers = bearer_header( TOKEN_DELETED ),
+        )
+        self.assertStatus( rv, 401 )
+
+    def test_oauth_deleted_by_other_worker( self, client ):
+        rv = client.post( '/v1/deactivate_tag/' + RFID_FOO,
+            headers = bearer_header( TOKEN_REVOKED ),
+        )
+        self.assertStatus( rv, 200 )
+
+        # Deleted outside this process's ORM, like another worker would, so 
+        # only the auth version tells us
+        with engine.begin() as conn:
+            conn.execute( delete( Doorbot.SQLAlchemy.OauthToken ).where(
+                Doorbot.SQLAlchemy.OauthToken.token == TOKEN_REVOKED
+            ) )
+
+        acl_conf = dict( Doorbot.Config.get( 'acl_cache', {} ) )
+        acl_conf[ 'version_check_seconds' ] = 0
+        Doorbot.Config.set_override( 'acl_cache', acl_conf )
+        try:
+            rv = client.post( '/v1/deactivate_tag/' + RFID_FOO,
+                headers = bearer_header( TOKEN_REVOKED ),
+            )
+            self.assertStatus( rv, 401 )
+        finally:
+            Doorbot.Config.clear_overrides()
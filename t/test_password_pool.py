@@ -0,0 +1,107 @@
+import unittest
+import unittest.mock
+import flask_unittest
+import os
+import threading
+import Doorbot.API
+import Doorbot.PasswordPool
+import Doorbot.SQLAlchemy
+from Doorbot.PasswordPool import PasswordPool, PasswordPoolBusy
+from sqlalchemy.orm import Session
+
+
+USER_PASS = ( "bcrypt_user", "pass" )
+RFID = "1234"
+
+
+class TestPasswordPool( unittest.TestCase ):
+    def test_run( self ):
+        pool = PasswordPool( max_workers = 1, max_queued = 0 )
+        self.assertEqual( pool.run( pow, 2, 10 ), 1024 )
+        with self.assertRaises( ZeroDivisionError ):
+            pool.run( divmod, 1, 0 )
+        pool.shutdown()
+
+    def test_full( self ):
+        pool = PasswordPool( max_workers = 1, max_queued = 0 )
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        thread = threading.Thread( target = pool.run, args = ( block, ) )
+        thread.start()
+        started.wait()
+
+        with self.assertRaises( PasswordPoolBusy ):
+            pool.run( pow, 2, 10 )
+
+        release.set()
+        thread.join()
+        self.assertEqual( pool.run( pow, 2, 10 ), 1024,
+            "Room again once the first job is done" )
+        pool.shutdown()
+
+    def test_queue_timeout( self ):
+        pool = PasswordPool( max_workers = 1, max_queued = 1,
+            queue_seconds = 0.1 )
+        started = threading.Event()
+        release = threading.Event()
+
+        def block():
+            started.set()
+            release.wait()
+
+        thread = threading.Thread( target = pool.run, args = ( block, ) )
+        thread.start()
+        started.wait()
+
+        ran = []
+        with self.assertRaises( PasswordPoolBusy ):
+            pool.run( ran.append, 1 )
+
+        release.set()
+        thread.join()
+        pool.shutdown()
+        self.assertEqual( ran, [], "Timed out job never ran" )
+
+
+class TestPasswordPoolBusyAPI( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "_tester",
+            rfid = RFID,
+            username = USER_PASS[0],
+        )
+        member.set_password( USER_PASS[1], {
+            "type": "bcrypt",
+            "bcrypt": {
+                "difficulty": 4,
+            },
+        })
+
+        session = Session( Doorbot.SQLAlchemy.get_engine() )
+        session.add( member )
+        session.commit()
+        session.close()
+
+    def test_busy_is_503( self, client ):
+        def busy( *args ):
+            raise PasswordPoolBusy( "Too many password checks in progress" )
+
+        with unittest.mock.patch.object( Doorbot.PasswordPool, 'run', busy ):
+            rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+        self.assertStatus( rv, 503 )
+        self.assertEqual( rv.headers[ 'Retry-After' ], "1" )
+
+        rv = client.get( '/check_tag/' + RFID, auth = USER_PASS )
+        self.assertStatus( rv, 200 )
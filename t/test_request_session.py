@@ -0,0 +1,94 @@
+import unittest
+import unittest.mock
+import os
+import Doorbot.ACLCache
+import Doorbot.API
+import Doorbot.Config
+import Doorbot.SQLAlchemy
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+
+RFID = "1234"
+FULL_NAME = "foo"
+
+class TestRequestSession( unittest.TestCase ):
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+
+        permission = Doorbot.SQLAlchemy.Permission(
+            name = "front.door",
+        )
+        role = Doorbot.SQLAlchemy.Role(
+            name = "doors",
+        )
+        role.permissions.append( permission )
+
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = FULL_NAME,
+            rfid = RFID,
+        )
+        member.roles.append( role )
+
+        session = Session( engine )
+        session.add_all([ permission, role, member ])
+        session.commit()
+        session.close()
+
+    def test_one_session_per_request( self ):
+        app = Doorbot.API.app
+        with app.app_context():
+            session = Doorbot.SQLAlchemy.get_request_session()
+            self.assertIs( session,
+                Doorbot.SQLAlchemy.get_request_session(),
+                "Same session for the whole request" )
+
+        with app.app_context():
+            self.assertIsNot( session,
+                Doorbot.SQLAlchemy.get_request_session(),
+                "New session for the next request" )
+
+    def test_version_check_shares_request_session( self ):
+        acl_conf = dict( Doorbot.Config.get( 'acl_cache', {} ) )
+        acl_conf[ 'version_check_seconds' ] = 0
+        Doorbot.Config.set_override( 'acl_cache', acl_conf )
+        try:
+            with Doorbot.API.app.app_context():
+                Doorbot.SQLAlchemy.get_request_session()
+                with unittest.mock.patch.object(
+                    Doorbot.SQLAlchemy,
+                    'get_session',
+                    side_effect = AssertionError( "Opened another session" ),
+                ):
+                    Doorbot.ACLCache.get_current_version()
+        finally:
+            Doorbot.Config.clear_overrides()
+
+    @unittest.skipUnless( 'PG' == os.environ.get( 'DB' ), "Needs Postgres" )
+    def test_statement_timeout_only_in_requests( self ):
+        conf = dict( Doorbot.Config.get( 'postgresql' ) )
+        conf[ 'statement_timeout_ms' ] = 12345
+        Doorbot.Config.set_override( 'postgresql', conf )
+        try:
+            with Doorbot.API.app.app_context():
+                session = Doorbot.SQLAlchemy.get_request_session()
+                self.assertEqual(
+                    session.scalar( text( "SHOW statement_timeout" ) ),
+                    "12345ms",
+                    "Timeout set for web requests",
+                )
+
+            session = Doorbot.SQLAlchemy.get_session()
+            self.assertEqual(
+                session.scalar( text( "SHOW statement_timeout" ) ),
+                "0",
+                "No timeout for scripts",
+            )
+            session.close()
+        finally:
+            Doorbot.Config.clear_overrides()
@@ -0,0 +1,134 @@
+import unittest
+import flask_unittest
+import os
+import Doorbot.API
+import Doorbot.EntryLogWriter
+import Doorbot.ScanRollups
+import Doorbot.SQLAlchemy
+from datetime import datetime, timezone
+from flask import json
+from sqlalchemy import select
+from sqlalchemy.orm import Session
+from test_oauth_token import add_bearer_token, bearer_header
+
+
+RFID_FOO = "1234"
+RFID_BAR = "2345"
+RFID_UNKNOWN = "9999"
+TOKEN = "0123456789abcdef"
+
+class TestScanRollups( flask_unittest.ClientTestCase ):
+    app = Doorbot.API.app
+    app.config[ 'is_testing' ] = True
+
+    @classmethod
+    def setUpClass( cls ):
+        if 'PG' != os.environ.get( 'DB' ):
+            Doorbot.SQLAlchemy.set_engine_sqlite()
+
+        global engine
+        engine = Doorbot.SQLAlchemy.get_engine()
+        members = [
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Foo Foo",
+                rfid = RFID_FOO,
+            ),
+            Doorbot.SQLAlchemy.Member(
+                full_name = "Bar Baz",
+                rfid = RFID_BAR,
+                active = False,
+            ),
+        ]
+        session = Session( engine )
+        add_bearer_token( TOKEN, members[0], session )
+        session.add_all( members )
+        session.add( Doorbot.SQLAlchemy.Location( name = "front.door" ) )
+        session.commit()
+
+        global location_id
+        location_id = session.scalar(
+            select( Doorbot.SQLAlchemy.Location.id )
+        )
+        session.close()
+
+        # Two hours on the same day, written through the writer
+        writer = Doorbot.EntryLogWriter.EntryLogWriter()
+        for rfid, active, found, hour in [
+            ( RFID_FOO, True, True, 10 ),
+            ( RFID_FOO, True, True, 10 ),
+            ( RFID_BAR, False, True, 10 ),
+            ( RFID_UNKNOWN, False, False, 11 ),
+        ]:
+            writer.add(
+                rfid = rfid,
+                location_id = location_id,
+                is_active_tag = active,
+                is_found_tag = found,
+                entry_time = datetime( 2024, 1, 1, hour, 15,
+                    tzinfo = timezone.utc ),
+            )
+        writer.stop()
+
+    def test_location_rollup( self, client ):
+        rv = client.get( '/v1/stats?since=2024-01-01&until=2024-01-02',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertEqual( data, [
+            {
+                "location": "front.door",
+                "hour": "2024-01-01T10:00:00+00:00",
+                "granted": 2,
+                "denied": 1,
+                "unknown": 0,
+            },
+            {
+                "location": "front.door",
+                "hour": "2024-01-01T11:00:00+00:00",
+                "granted": 0,
+                "denied": 0,
+                "unknown": 1,
+            },
+        ])
+
+    def test_member_rollup( self, client ):
+        rv = client.get( '/v1/stats?by=member&tag=' + RFID_FOO
+            + '&since=2024-01-01&until=2024-01-02',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 200 )
+        data = json.loads( rv.data.decode( "UTF-8" ) )
+        self.assertEqual( data, [{
+            "rfid": RFID_FOO,
+            "day": "2024-01-01",
+            "granted": 2,
+            "denied": 0,
+            "unknown": 0,
+        }])
+
+    def test_backfill_matches( self, client ):
+        def snapshot():
+            session = Session( engine )
+            rows = [
+                ( r.location, r.hour, r.granted, r.denied, r.unknown )
+                for r in session.scalars( select(
+                    Doorbot.SQLAlchemy.LocationHourlyScans
+                ).order_by( Doorbot.SQLAlchemy.LocationHourlyScans.hour ) )
+            ]
+            session.close()
+            return rows
+
+        before = snapshot()
+        total = Doorbot.ScanRollups.backfill( engine )
+        self.assertEqual( total, 4 )
+        self.assertEqual( snapshot(), before,
+            "Rebuilding gives the same counts" )
+
+    def test_bad_args( self, client ):
+        for query in [ 'by=foo', 'since=bar', 'tag=abc' ]:
+            rv = client.get( '/v1/stats?' + query,
+                headers = bearer_header( TOKEN ) )
+            self.assertStatus( rv, 400 )
+
+        rv = client.get( '/v1/stats?location=nowhere',
+            headers = bearer_header( TOKEN ) )
+        self.assertStatus( rv, 404 )
@@ -1,9 +1,11 @@
 import unittest
+import unittest.mock
 import psycopg2
 import os
 import re
 import sqlite3
 import Doorbot.Config
+import Doorbot.PasswordRehash
 import Doorbot.SQLAlchemy
 from sqlalchemy.orm import Session
 
@@ -55,6 +57,13 @@ class TestAuth( unittest.TestCase ):
 
         self.assertTrue( member.check_password( USER_PASS[1], session ),
             "Password is correct" )
+        self.assertTrue(
+            member.password_type == Doorbot.SQLAlchemy.PASSWORD_TYPE_PLAINTEXT,
+            "Password is re-encoded in the background, not right away"
+        )
+
+        Doorbot.PasswordRehash.flush()
+        session.refresh( member )
         self.assertTrue(
             member.password_type != Doorbot.SQLAlchemy.PASSWORD_TYPE_PLAINTEXT,
             "Password encryption type was changed after checking password" 
@@ -77,4 +86,47 @@ class TestAuth( unittest.TestCase ):
 
         assert member.check_password( KNOWN_PASS, session ), "Password checks out w/apache md5"
 
+        Doorbot.PasswordRehash.flush()
+        session.refresh( member )
+
         assert Doorbot.SQLAlchemy.PASSWORD_TYPE_APACHE_MD5 != member.password_type, "Password encodig type changed after checking it"
+
+    def test_rehash_skipped_after_password_change( self ):
+        member = Doorbot.SQLAlchemy.Member(
+            full_name = "_tester",
+            rfid = "3456",
+        )
+        member.set_password( KNOWN_PASS, {
+            "type": "plaintext",
+        })
+
+        session = Session( engine )
+        session.add( member )
+        session.commit()
+
+        rehasher = Doorbot.PasswordRehash.PasswordRehasher()
+        # Queued without starting the thread, so the upgrade can't run until 
+        # after the password change below
+        with unittest.mock.patch.object( rehasher, '_ensure_running' ):
+            self.assertTrue( rehasher.submit( member.id,
+                member.encoded_password, KNOWN_PASS,
+                Doorbot.Config.get( 'password_storage' ) ) )
+            self.assertFalse( rehasher.submit( member.id,
+                member.encoded_password, KNOWN_PASS,
+                Doorbot.Config.get( 'password_storage' ) ),
+                "Only one upgrade queued per member" )
+
+        # Changed before the upgrade got to run
+        member.set_password( KNOWN_PASS + "new", {
+            "type": "plaintext",
+        })
+        session.commit()
+
+        # With no thread running, this runs the upgrade right here
+        rehasher.flush()
+        rehasher.stop()
+        session.refresh( member )
+        self.assertEqual( member.password_type, "plaintext",
+            "Still stored the way the new password was" )
+        self.assertEqual( member.encoded_password, KNOWN_PASS + "new",
+            "New password wasn't overwritten by the old one" )